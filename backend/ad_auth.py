@@ -1,12 +1,11 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from pydantic import BaseModel
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import os
 import base64
 import ldap3
 from ldap3 import Server, Connection, NTLM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
+import crypto_keys
+from crypto_keys import get_keyring
 
 # Models
 class AuthRequest(BaseModel):
@@ -26,14 +25,8 @@ SALT = os.getenv('AD_AUTH_SALT', 'your-salt-here').encode()
 
 # Encryption/Decryption utils
 def derive_key(server_secret: str):
-    """Derive a key from the server secret"""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=SALT,
-        iterations=100000,
-    )
-    return kdf.derive(server_secret.encode())
+    """Derive a key from the server secret (cached per secret and salt)"""
+    return crypto_keys.derive_key(server_secret, SALT)
 
 def decrypt_password(encrypted_data: str, server_key: str) -> str:
     """Decrypt a password using AES-GCM"""
@@ -42,9 +35,7 @@ def decrypt_password(encrypted_data: str, server_key: str) -> str:
         iv = encrypted_bytes[:12]  # Extract IV (first 12 bytes)
         ciphertext = encrypted_bytes[12:]  # Remaining is ciphertext
 
-        key = derive_key(server_key)
-        aesgcm = AESGCM(key)
-        plaintext = aesgcm.decrypt(iv, ciphertext, None)
+        plaintext = get_keyring(server_key, SALT).decrypt(iv, ciphertext)
 
         return plaintext.decode()
     except Exception as e:
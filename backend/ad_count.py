@@ -0,0 +1,165 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from ldap3 import Connection, SUBTREE, NO_ATTRIBUTES
+from ldap3.core.exceptions import LDAPException
+
+from ldap_controls import supports_vlv, sort_control, vlv_control, parse_vlv_response
+from ldap_filters import normalize_dn, normalize_filter
+
+# --- Configuration ---
+COUNT_CACHE_TTL = int(os.getenv('AD_COUNT_CACHE_TTL', '300'))
+COUNT_CACHE_MAX_ENTRIES = int(os.getenv('AD_COUNT_CACHE_MAX_ENTRIES', '10000'))
+# AD's default MaxPageSize; larger pages are silently capped by the DC
+COUNT_PAGE_SIZE = 1000
+# Full enumerations running at once, so counting never takes over the LDAP pool
+COUNT_MAX_REFINES = int(os.getenv('AD_COUNT_MAX_REFINES', '2'))
+PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+
+
+def _vlv_count(conn: Connection, base: str | None, filter_cond: str) -> tuple[int | None, bool]:
+    """
+    Ask the DC for the result set size via a VLV request for a single entry.
+    Returns (count or None, whether the DC answered with a VLV response at all).
+    """
+    conn.search(
+        search_base=base or conn.server.info.other['defaultNamingContext'][0],
+        search_filter=filter_cond,
+        search_scope=SUBTREE,
+        attributes=NO_ATTRIBUTES,
+        controls=[sort_control('cn'), vlv_control(offset=1, before_count=0, after_count=0)]
+    )
+    response = parse_vlv_response(conn.result)
+    if response is None:
+        return None, False
+    if response['result'] != 0:
+        # e.g. the sort needs more than MaxTempTableSize rows for this filter
+        return None, True
+    return response['content_count'], True
+
+
+def _enumerate_count(conn: Connection, base: str | None, filter_cond: str, max_pages: int | None) -> tuple[int, bool]:
+    """
+    Count entries with an attribute-less paged search.
+    Stops after max_pages pages (None = run to the end) and reports whether it finished.
+    """
+    total = 0
+    cookie = None
+    pages = 0
+    while True:
+        conn.search(
+            search_base=base or conn.server.info.other['defaultNamingContext'][0],
+            search_filter=filter_cond,
+            search_scope=SUBTREE,
+            attributes=NO_ATTRIBUTES,
+            paged_size=COUNT_PAGE_SIZE,
+            paged_cookie=cookie
+        )
+        total += sum(1 for entry in conn.response if entry.get('type') == 'searchResEntry')
+        pages += 1
+        cookie = conn.result.get('controls', {}).get(PAGED_RESULTS_OID, {}).get('value', {}).get('cookie')
+        if not cookie:
+            return total, True
+        if max_pages is not None and pages >= max_pages:
+            return total, False
+
+
+class CountEngine:
+    """
+    Result counting for (search base, filter) pairs.
+
+    Counts come from the VLV content count when the DC supports it, otherwise
+    from an attribute-less paged enumeration. The first call returns after a
+    single page: if the result set is larger, the count is flagged inexact and
+    a full enumeration refines it in the background. Results are cached per
+    normalized base + filter for COUNT_CACHE_TTL seconds, least recently used
+    first out past COUNT_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, pool, ttl: int = COUNT_CACHE_TTL, max_entries: int = COUNT_CACHE_MAX_ENTRIES):
+        self.pool = pool
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._cache: OrderedDict[tuple[str, str], tuple[int, bool, float]] = OrderedDict()
+        self._refining: dict[tuple[str, str], asyncio.Task] = {}
+        self._refine_slots = asyncio.Semaphore(COUNT_MAX_REFINES)
+        self._vlv_failed = False
+
+    @staticmethod
+    def cache_key(base: str | None, filter_cond: str) -> tuple[str, str]:
+        return normalize_dn(base), normalize_filter(filter_cond)
+
+    def peek(self, base: str | None, filter_cond: str) -> tuple[int, bool] | None:
+        """Cached (count, is_exact) without touching the DC, or None"""
+        key = self.cache_key(base, filter_cond)
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[2] > self.ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return cached[0], cached[1]
+
+    def peek_many(self, bases: list[str | None], filter_cond: str) -> tuple[int, bool] | None:
+        counts = [self.peek(base, filter_cond) for base in bases]
+        if any(c is None for c in counts):
+            return None
+        return sum(c[0] for c in counts), all(c[1] for c in counts)
+
+    async def count(self, base: str | None, filter_cond: str) -> tuple[int, bool]:
+        cached = self.peek(base, filter_cond)
+        if cached is not None:
+            return cached
+
+        key = self.cache_key(base, filter_cond)
+        if not self._vlv_failed and supports_vlv(self.pool.server):
+            try:
+                content_count, answered = await self.pool.run(_vlv_count, base, filter_cond)
+                if content_count is not None:
+                    self._store(key, content_count, True)
+                    return content_count, True
+                # Advertised but not honoured (e.g. a proxy in between); stop asking
+                self._vlv_failed = not answered
+            except LDAPException as e:
+                print(f"VLV count failed, falling back to enumeration: {str(e)}")
+
+        count, is_exact = await self.pool.run(_enumerate_count, base, filter_cond, 1)
+        self._store(key, count, is_exact)
+        if not is_exact:
+            self._schedule_refine(key, base, filter_cond)
+        return count, is_exact
+
+    async def count_many(self, bases: list[str | None], filter_cond: str) -> tuple[int, bool]:
+        counts = await asyncio.gather(*[self.count(base, filter_cond) for base in bases])
+        return sum(c[0] for c in counts), all(c[1] for c in counts)
+
+    def _store(self, key: tuple[str, str], count: int, is_exact: bool):
+        now = time.monotonic()
+        self._cache[key] = (count, is_exact, now)
+        self._cache.move_to_end(key)
+        # Least recently used first: trim past the cap, and drop expired
+        # entries from the front (stale ones elsewhere age out behind them)
+        while self._cache:
+            oldest_key, oldest = next(iter(self._cache.items()))
+            if len(self._cache) <= self.max_entries and now - oldest[2] <= self.ttl:
+                break
+            del self._cache[oldest_key]
+
+    def _schedule_refine(self, key: tuple[str, str], base: str | None, filter_cond: str):
+        if key in self._refining:
+            return
+        task = asyncio.create_task(self._refine(key, base, filter_cond))
+        self._refining[key] = task
+        task.add_done_callback(lambda _: self._refining.pop(key, None))
+
+    async def _refine(self, key: tuple[str, str], base: str | None, filter_cond: str):
+        async with self._refine_slots:
+            try:
+                # One pool call for the whole walk: paging cookies stay on one connection
+                count, _ = await self.pool.run(_enumerate_count, base, filter_cond, None)
+                self._store(key, count, True)
+            except Exception as e:
+                print(f"Background count failed for {key[0] or 'default naming context'}: {str(e)}")
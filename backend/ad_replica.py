@@ -0,0 +1,352 @@
+"""
+Optional local replica of users, computers and groups.
+
+The first sync of each naming context is a full paged pull. After that,
+only objects whose uSNChanged is above the context's high-water mark are
+fetched. Deletions are found the same way, as tombstones read with the Show
+Deleted control. Objects are stored in SQLite, and start_query answers from
+here when the replica covers the query and synced recently enough. Text
+matching goes through the trigram/prefix index in search_index.
+
+USNs are local to one DC. If the pool ends up on a different DC
+(dsServiceName changes), the context is pulled in full again.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from ldap3 import Connection, SUBTREE, BASE
+
+from ldap_controls import show_deleted_control
+from ldap_filters import SEARCH_ATTRIBUTES
+from ldap_rows import response_rows
+from search_index import SearchIndex, fold, like_escape
+
+# --- Configuration ---
+REPLICA_ENABLED = os.getenv('AD_REPLICA_ENABLED', '0') == '1'
+REPLICA_PATH = os.getenv('AD_REPLICA_PATH', 'ad_replica.sqlite3')
+# Naming contexts to replicate, separated by ';' (DNs contain commas).
+# Defaults to the domain's defaultNamingContext.
+REPLICA_CONTEXTS = [c.strip() for c in os.getenv('AD_REPLICA_CONTEXTS', '').split(';') if c.strip()]
+REPLICA_POLL_INTERVAL = float(os.getenv('AD_REPLICA_POLL_INTERVAL', '30'))
+# Queries go to live LDAP once the last successful sync is older than this
+REPLICA_MAX_STALENESS = float(os.getenv('AD_REPLICA_MAX_STALENESS', '300'))
+REPLICA_PAGE_SIZE = 1000
+
+PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+# computer is a subclass of user, so this covers all three object types
+OBJECT_FILTER = "(|(objectClass=user)(objectClass=group))"
+# Constructed / operational attributes a '*' pull doesn't return; queries
+# asking for them go to live LDAP
+NOT_REPLICATED = {
+    'tokengroups', 'tokengroupsglobalanduniversal', 'canonicalname', 'createtimestamp',
+    'modifytimestamp', 'allowedattributes', 'allowedattributeseffective', 'structuralobjectclass',
+    'msds-user-account-control-computed', 'msds-resultantpso', 'msds-memberoftransitive',
+    'msds-memberstransitive', 'msds-principalname', 'msds-parentdistname'
+}
+
+# Which rows each query type covers
+OBJECT_TYPES = {
+    'users': 'is_user = 1',
+    'computers': 'is_computer = 1',
+    'groups': 'is_group = 1',
+}
+# Match modes the index can answer; ANR has its own server-side rules
+REPLICA_MATCH_MODES = ('contains', 'prefix', 'exact')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    guid TEXT PRIMARY KEY,
+    context TEXT NOT NULL,
+    dn TEXT NOT NULL,
+    dn_key TEXT NOT NULL,
+    cn_key TEXT,
+    sam_key TEXT,
+    is_user INTEGER NOT NULL,
+    is_computer INTEGER NOT NULL,
+    is_group INTEGER NOT NULL,
+    usn INTEGER,
+    pulled_at REAL,
+    attributes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_dn ON objects (dn_key);
+CREATE INDEX IF NOT EXISTS objects_context ON objects (context, pulled_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    context TEXT PRIMARY KEY,
+    dsa TEXT NOT NULL,
+    highest_usn INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def _key(value: str | None) -> str | None:
+    return fold(value) if value is not None else None
+
+
+def _first(attributes: dict, name: str):
+    values = attributes.get(name) or []
+    return values[0] if values else None
+
+
+def _under(dn_key: str, context_key: str) -> bool:
+    return dn_key == context_key or dn_key.endswith(',' + context_key)
+
+
+def root_dse(conn: Connection) -> tuple[str, int]:
+    """The DC we're talking to and its highest committed USN"""
+    conn.search('', '(objectClass=*)', BASE, attributes=['dsServiceName', 'highestCommittedUSN'])
+    if not conn.response or 'attributes' not in conn.response[0]:
+        raise RuntimeError(f"Could not read rootDSE: {conn.result.get('description')}")
+    attributes = conn.response[0]['attributes']
+    dsa = attributes.get('dsServiceName')
+    highest = attributes.get('highestCommittedUSN')
+    dsa = dsa[0] if isinstance(dsa, list) else dsa
+    highest = highest[0] if isinstance(highest, list) else highest
+    return str(dsa), int(highest)
+
+
+def walk(conn: Connection, base: str, filter_cond: str, attributes: list[str], controls, sink):
+    """Paged SUBTREE search, handing each page of rows to sink"""
+    cookie = None
+    while True:
+        conn.search(
+            search_base=base,
+            search_filter=filter_cond,
+            search_scope=SUBTREE,
+            attributes=attributes,
+            controls=controls,
+            paged_size=REPLICA_PAGE_SIZE,
+            paged_cookie=cookie
+        )
+        rows = response_rows(conn.response)
+        if rows:
+            sink(rows)
+        cookie = conn.result.get('controls', {}).get(PAGED_RESULTS_OID, {}).get('value', {}).get('cookie')
+        if not cookie:
+            return
+
+
+class DirectoryReplica:
+    """
+    SQLite copy of the directory objects start_query searches, kept current
+    by a background poll. All SQLite access goes through one connection
+    under a lock: the sync writes from a pool worker thread and queries read
+    via asyncio.to_thread. The database is opened by open() (or start()),
+    off the event loop, since rebuilding a missing index can take a while.
+    """
+
+    def __init__(self, pool, path: str = REPLICA_PATH, contexts: list[str] | None = None,
+                 poll_interval: float = REPLICA_POLL_INTERVAL, max_staleness: float = REPLICA_MAX_STALENESS):
+        self.pool = pool
+        self.contexts = list(contexts if contexts is not None else REPLICA_CONTEXTS)
+        self.poll_interval = poll_interval
+        self.max_staleness = max_staleness
+        self.default_context: str | None = None
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self.index: SearchIndex | None = None
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._synced_at: float | None = None
+        self._syncs = 0
+        self._full_pulls = 0
+        self._last_error: str | None = None
+
+    # --- Lifecycle ---
+    async def open(self):
+        await asyncio.to_thread(self._open)
+        return self
+
+    async def start(self):
+        await self.open()
+        self._task = asyncio.create_task(self._poll())
+        return self
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._db is not None:
+            self._db.close()
+
+    def _open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            if self.path != ':memory:':
+                db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            index = SearchIndex(db)
+            if index.is_empty():
+                # Replica written before the index existed
+                with db:
+                    index.add([
+                        (guid, json.loads(stored))
+                        for guid, stored in db.execute("SELECT guid, attributes FROM objects")
+                    ])
+            self._db, self.index = db, index
+
+    # --- Sync ---
+    async def sync(self):
+        """One round: a full pull for new (or re-homed) contexts, changes since the high-water mark otherwise"""
+        if self.default_context is None:
+            self.default_context = self.pool.default_naming_context
+        for context in self.contexts or [self.default_context]:
+            await self.pool.run(self._sync_context, context, self._state(context))
+        self._synced_at = time.time()
+        self._syncs += 1
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.sync()
+                self._last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"Directory replica sync failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _sync_context(self, conn: Connection, context: str, state: dict | None):
+        dsa, highest = root_dse(conn)
+        started = time.time()
+        if state is None or state['dsa'] != dsa:
+            # Changes committed during the pull have USNs above `highest` and
+            # are picked up (again, harmlessly) by the next incremental round
+            walk(conn, context, OBJECT_FILTER, ['*', 'uSNChanged'], None,
+                 lambda rows: self._upsert(context, rows, started))
+            with self._lock, self._db:
+                # Objects not seen by the pull are gone from this DC's view
+                gone = "FROM objects WHERE context = ? AND pulled_at < ?"
+                self.index.remove([guid for guid, in self._db.execute(f"SELECT guid {gone}", (context, started))])
+                self._db.execute(f"DELETE {gone}", (context, started))
+            self._full_pulls += 1
+        else:
+            since = state['highest_usn'] + 1
+            walk(conn, context, f"(&{OBJECT_FILTER}(uSNChanged>={since}))", ['*', 'uSNChanged'], None,
+                 lambda rows: self._upsert(context, rows, started))
+            walk(conn, context, f"(&(isDeleted=TRUE)(uSNChanged>={since}))", ['objectGUID'],
+                 [show_deleted_control()], self._delete)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_state (context, dsa, highest_usn, synced_at) VALUES (?, ?, ?, ?)",
+                (context, dsa, highest, time.time())
+            )
+
+    def _upsert(self, context: str, rows: list[dict], pulled_at: float):
+        records, indexed = [], []
+        for row in rows:
+            attributes = row['attributes']
+            guid = _first(attributes, 'objectGUID')
+            if guid is None:
+                continue
+            classes = {str(c).lower() for c in attributes.get('objectClass', [])}
+            records.append((
+                guid, context, row['dn'], _key(row['dn']),
+                _key(_first(attributes, 'cn')), _key(_first(attributes, 'sAMAccountName')),
+                int('user' in classes), int('computer' in classes), int('group' in classes),
+                _first(attributes, 'uSNChanged'), pulled_at, json.dumps(attributes)
+            ))
+            indexed.append((guid, attributes))
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+            self.index.add(indexed)
+
+    def _delete(self, rows: list[dict]):
+        guids = [_first(row['attributes'], 'objectGUID') for row in rows]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM objects WHERE guid = ?", [(guid,) for guid in guids])
+            self.index.remove(guids)
+
+    def _state(self, context: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT dsa, highest_usn FROM sync_state WHERE context = ?", (context,)
+            ).fetchone()
+        return {'dsa': row[0], 'highest_usn': row[1]} if row else None
+
+    # --- Queries ---
+    def age(self) -> float | None:
+        """Seconds since the last successful sync, None before the first one"""
+        return time.time() - self._synced_at if self._synced_at is not None else None
+
+    def covers(self, object_type: str, ou_list: list[str | None], match: str = 'contains') -> bool:
+        """Whether the replica can say which objects match: synced recently, every OU in scope, a mode the index handles"""
+        age = self.age()
+        if age is None or age > self.max_staleness or object_type not in OBJECT_TYPES:
+            return False
+        if match not in REPLICA_MATCH_MODES:
+            return False
+        contexts = [_key(c) for c in self.contexts or [self.default_context]]
+        return all(
+            any(_under(_key(ou or self.default_context), context) for context in contexts)
+            for ou in ou_list
+        )
+
+    @staticmethod
+    def replicates(attributes: list[str]) -> bool:
+        """Whether the stored attributes can answer for these, or they have to be read live"""
+        return not any(name.lower() in NOT_REPLICATED for name in attributes)
+
+    async def count(self, object_type: str, text: str, ou_list: list[str | None], match: str = 'contains') -> int:
+        rows = await asyncio.to_thread(self._select, "COUNT(*)", object_type, text, match, ou_list)
+        return rows[0][0]
+
+    async def page(self, object_type: str, text: str, ou_list: list[str | None], attributes: list[str],
+                   offset: int, limit: int, match: str = 'contains') -> list[dict]:
+        """Rows in the {"dn", "attributes"} shape live searches return, ordered by cn"""
+        rows = await asyncio.to_thread(self._select, "dn, attributes", object_type, text, match, ou_list, offset, limit)
+        return [{"dn": dn, "attributes": self._project(json.loads(stored), attributes)} for dn, stored in rows]
+
+    async def page_dns(self, object_type: str, text: str, ou_list: list[str | None],
+                       offset: int, limit: int, match: str = 'contains') -> list[str]:
+        """Just the DNs of a page, in the same order as page()"""
+        rows = await asyncio.to_thread(self._select, "dn", object_type, text, match, ou_list, offset, limit)
+        return [dn for dn, in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            objects = self._db.execute("SELECT COUNT(*) FROM objects").fetchone()[0] if self._db else 0
+        return {
+            "objects": objects,
+            "contexts": self.contexts or [self.default_context],
+            "age": self.age(),
+            "max_staleness": self.max_staleness,
+            "syncs": self._syncs,
+            "full_pulls": self._full_pulls,
+            "last_error": self._last_error
+        }
+
+    def _select(self, columns: str, object_type: str, text: str, match: str, ou_list: list[str | None],
+                offset: int = 0, limit: int | None = None) -> list:
+        with self._lock:
+            where, params = self._where(object_type, text, match, ou_list)
+            sql = f"SELECT {columns} FROM objects WHERE {where}"
+            if limit is not None:
+                sql += " ORDER BY cn_key, dn_key LIMIT ? OFFSET ?"
+                params += [limit, offset]
+            return self._db.execute(sql, params).fetchall()
+
+    def _where(self, object_type: str, text: str, match: str, ou_list: list[str | None]) -> tuple[str, list]:
+        type_clause = OBJECT_TYPES[object_type]
+        text_clause, params = self.index.match(SEARCH_ATTRIBUTES[object_type], text, match)
+        scopes = []
+        for ou in ou_list:
+            ou_key = _key(ou or self.default_context)
+            scopes.append("(dn_key = ? OR dn_key LIKE ? ESCAPE '\\')")
+            params += [ou_key, '%,' + like_escape(ou_key)]
+        return f"{type_clause} AND ({text_clause}) AND ({' OR '.join(scopes)})", params
+
+    @staticmethod
+    def _project(stored: dict, attributes: list[str]) -> dict:
+        """Requested attributes only; absent ones come back empty, as ldap3 returns them"""
+        by_name = {name.lower(): name for name in stored}
+        projected = {}
+        for name in attributes:
+            actual = by_name.get(name.lower())
+            projected[actual or name] = stored[actual] if actual else []
+        return dict(sorted(projected.items()))
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from redis.asyncio import Redis
+
+# --- Configuration ---
+USER_SESSION_LIFETIME = 3600  # 1 hour sliding expiry
+# How long a validated session is trusted without asking Redis again. Logouts
+# reach every worker over pub/sub; this bounds staleness if a message is lost.
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000'))
+# Sliding expiry is written back at most once per this many seconds per session
+AUTH_REFRESH_INTERVAL = float(os.getenv('AUTH_REFRESH_INTERVAL', '60'))
+INVALIDATION_CHANNEL = "user_session:invalidate"
+
+# Slide the expiry only if the session still exists; a logout may have raced us
+_SLIDE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'expires_at', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class SessionExpired(Exception):
+    """The session exists but is past its expiry time"""
+
+
+class SessionValidator:
+    """
+    Validates user_session:{id} tokens with an in-process cache in front of Redis.
+
+    A session validated within the last AUTH_CACHE_TTL seconds is answered
+    from memory. The sliding expiry (TTL + expires_at) is pushed to Redis in
+    the background and only when it has moved by AUTH_REFRESH_INTERVAL, so
+    steady traffic costs no Redis round trips. revoke() deletes the session
+    and tells every worker to drop it via pub/sub.
+    """
+
+    def __init__(self, redis: Redis, lifetime: int = USER_SESSION_LIFETIME,
+                 ttl: float = AUTH_CACHE_TTL, max_entries: int = AUTH_CACHE_MAX_ENTRIES,
+                 refresh_interval: float = AUTH_REFRESH_INTERVAL):
+        self.redis = redis
+        self.lifetime = lifetime
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        # session id -> (user_info, validated_at (monotonic), expires_at (epoch))
+        self._cache: OrderedDict[str, tuple[dict, float, float]] = OrderedDict()
+        self._slide_script = redis.register_script(_SLIDE)
+        self._background: set[asyncio.Task] = set()
+        self._listener: asyncio.Task | None = None
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        return f"user_session:{session_id}"
+
+    # --- Lifecycle ---
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+        return self
+
+    async def close(self):
+        tasks = list(self._background)
+        if self._listener:
+            tasks.append(self._listener)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # --- Public API ---
+    async def create(self, user_info: dict) -> str:
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.key(session_id), mapping={
+                "user_info": json.dumps(user_info),
+                "created_at": now,
+                "expires_at": now + self.lifetime
+            })
+            pipe.expire(self.key(session_id), self.lifetime)
+            await pipe.execute()
+        self._remember(session_id, user_info, now + self.lifetime)
+        return session_id
+
+    async def validate(self, session_id: str) -> dict | None:
+        """
+        user_info for a live session, None if it doesn't exist.
+        Raises SessionExpired if it exists but has expired.
+        """
+        cached = self._cache.get(session_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            user_info, _, expires_at = cached
+            if expires_at < time.time():
+                self._cache.pop(session_id, None)
+                raise SessionExpired(session_id)
+            self._hits += 1
+            self._cache.move_to_end(session_id)
+            self._slide(session_id, user_info, expires_at, cached[1])
+            return user_info
+
+        self._misses += 1
+        session_data = await self.redis.hgetall(self.key(session_id))
+        if not session_data:
+            self._cache.pop(session_id, None)
+            return None
+        expires_at = float(session_data.get("expires_at", 0))
+        if expires_at < time.time():
+            self._cache.pop(session_id, None)
+            await self.redis.delete(self.key(session_id))
+            raise SessionExpired(session_id)
+
+        user_info = json.loads(session_data.get("user_info", "{}"))
+        self._remember(session_id, user_info, expires_at)
+        self._slide(session_id, user_info, expires_at, time.monotonic())
+        return user_info
+
+    async def revoke(self, session_id: str):
+        """Delete the session and drop it from every worker's cache"""
+        self._cache.pop(session_id, None)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(self.key(session_id))
+            pipe.publish(INVALIDATION_CHANNEL, session_id)
+            await pipe.execute()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._cache),
+            "hits": self._hits,
+            "misses": self._misses,
+            "listening": bool(self._listener and not self._listener.done())
+        }
+
+    # --- Internals ---
+    def _remember(self, session_id: str, user_info: dict, expires_at: float):
+        self._cache[session_id] = (user_info, time.monotonic(), expires_at)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _slide(self, session_id: str, user_info: dict, expires_at: float, validated_at: float):
+        """Push the sliding expiry to Redis once it has moved by refresh_interval"""
+        new_expires = time.time() + self.lifetime
+        if new_expires - expires_at < self.refresh_interval:
+            return
+        self._cache[session_id] = (user_info, validated_at, new_expires)
+        task = asyncio.create_task(self._refresh(session_id, new_expires))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _refresh(self, session_id: str, new_expires: float):
+        try:
+            await self._slide_script(keys=[self.key(session_id)], args=[new_expires, self.lifetime])
+        except Exception as e:
+            print(f"Session refresh failed for {session_id}: {str(e)}")
+
+    async def _listen(self):
+        """Drop sessions revoked by other workers; resubscribe if Redis goes away"""
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Revocations may have been missed while disconnected
+                self._cache.clear()
+                try:
+                    async for message in pubsub.listen():
+                        if message.get('type') == 'message':
+                            session_id = message['data']
+                            if isinstance(session_id, bytes):
+                                session_id = session_id.decode()
+                            self._cache.pop(session_id, None)
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Session invalidation listener lost Redis, retrying: {str(e)}")
+                await asyncio.sleep(1)
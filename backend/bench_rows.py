@@ -0,0 +1,86 @@
+"""
+Microbenchmark: per-row cost of turning a search response into a page response.
+
+    python bench_rows.py [rows] [repeats]
+
+"before" is the old path: ldap3 Entry objects -> entry_to_json() ->
+json.loads, then a validated PaginatedResponse run through
+jsonable_encoder and JSONResponse (what FastAPI does for response_model).
+"after" is response_rows() -> model_construct -> FastJSONResponse.
+Runs against an in-memory MOCK_SYNC directory, so no DC is needed.
+"""
+import json
+import sys
+import time
+import uuid
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from ldap3 import Server, Connection, MOCK_SYNC, OFFLINE_AD_2012_R2, SUBTREE
+
+from json_response import FastJSONResponse, orjson
+from ldap_rows import response_rows
+from mainv2 import PaginatedResponse
+
+ATTRIBUTES = ['cn', 'sAMAccountName', 'mail', 'department', 'title', 'memberOf',
+              'whenCreated', 'objectGUID', 'userAccountControl']
+
+
+def directory(rows: int) -> Connection:
+    server = Server('bench', get_info=OFFLINE_AD_2012_R2)
+    conn = Connection(server, user='cn=bench,dc=bench', password='bench', client_strategy=MOCK_SYNC)
+    conn.strategy.add_entry('cn=bench,dc=bench', {'userPassword': 'bench'})
+    for i in range(rows):
+        conn.strategy.add_entry(f'cn=user{i},ou=people,dc=bench', {
+            'objectClass': ['top', 'person', 'user'],
+            'cn': f'user{i}',
+            'sAMAccountName': f'user{i}',
+            'mail': f'user{i}@bench.local',
+            'department': ['IT', 'Sales', 'HR', 'Finance'][i % 4],
+            'title': 'Engineer',
+            'memberOf': ['cn=staff,dc=bench', f'cn=team{i % 10},dc=bench'],
+            'whenCreated': '20200101000000.0Z',
+            'objectGUID': uuid.uuid4().bytes_le,
+            'userAccountControl': '512'
+        })
+    conn.bind()
+    conn.search('ou=people,dc=bench', '(objectClass=user)', SUBTREE, attributes=ATTRIBUTES)
+    return conn
+
+
+def page(results: list[dict], validate: bool) -> PaginatedResponse:
+    fields = dict(results=results, total_count=len(results), current_page=1, page_size=len(results),
+                  has_next_page=False, session_id=str(uuid.uuid4()), is_count_exact=True)
+    return PaginatedResponse(**fields) if validate else PaginatedResponse.model_construct(**fields)
+
+
+def before(conn: Connection) -> bytes:
+    # conn.entries caches its Entry objects; rebuild them as a fresh search would
+    entries = conn._get_entries(conn.response, conn.request)
+    results = [json.loads(entry.entry_to_json()) for entry in entries]
+    return JSONResponse(jsonable_encoder(page(results, validate=True))).body
+
+
+def after(conn: Connection) -> bytes:
+    return FastJSONResponse(dict(page(response_rows(conn.response), validate=False))).body
+
+
+def per_row_us(func, conn: Connection, rows: int, repeats: int) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func(conn)
+        best = min(best, time.perf_counter() - started)
+    return best / rows * 1e6
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    conn = directory(rows)
+    assert json.loads(before(conn))['results'] == json.loads(after(conn))['results']
+    old = per_row_us(before, conn, rows, repeats)
+    new = per_row_us(after, conn, rows, repeats)
+    print(f"{rows} rows, best of {repeats}, encoder: {'orjson' if orjson else 'json'}")
+    print(f"before: {old:8.2f} us/row")
+    print(f"after:  {new:8.2f} us/row  ({old / new:.1f}x)")
@@ -0,0 +1,170 @@
+"""
+Bulk lookup of many accounts by DN, sAMAccountName or UPN/mail.
+
+Identifiers are de-duplicated and grouped by kind. Each group is split
+into chunks, and each chunk becomes one OR filter, e.g.
+(|(sAMAccountName=a)(sAMAccountName=b)...). The chunks run concurrently
+on the LDAP pool, with a few slots left over for interactive queries.
+Results come back as each chunk finishes. Every row is matched back to
+the identifiers it satisfies, which gives the not-found list.
+"""
+import asyncio
+import os
+from collections.abc import AsyncIterator
+
+from ldap3 import Connection
+from ldap3.utils.conv import escape_filter_chars
+
+from ad_replica import walk
+from ldap_filters import normalize_dn
+from search_index import fold
+
+# --- Configuration ---
+BULK_LOOKUP_MAX_IDENTIFIERS = int(os.getenv('AD_BULK_LOOKUP_MAX_IDENTIFIERS', '50000'))
+# Terms per OR filter. AD evaluates each term from an index, but long
+# filters slow the DC down and can run into MaxQueryDuration.
+BULK_LOOKUP_BATCH = int(os.getenv('AD_BULK_LOOKUP_BATCH', '200'))
+# Filter text per request, well under the DC's MaxReceiveBuffer
+BULK_LOOKUP_MAX_FILTER_LENGTH = int(os.getenv('AD_BULK_LOOKUP_MAX_FILTER_LENGTH', '65536'))
+# Chunks in flight per lookup, so one bulk request doesn't take the whole pool
+BULK_LOOKUP_CONCURRENCY = int(os.getenv('AD_BULK_LOOKUP_CONCURRENCY', '4'))
+
+# Identifier kind -> attributes it is matched against
+LOOKUP_FIELDS = {
+    'dn': ('distinguishedName',),
+    'name': ('sAMAccountName',),
+    'address': ('userPrincipalName', 'mail'),
+}
+
+
+def identifier_kind(identifier: str) -> str:
+    """'=' can't appear in a sAMAccountName and '@' can't either, so the form tells them apart"""
+    if '=' in identifier:
+        return 'dn'
+    if '@' in identifier:
+        return 'address'
+    return 'name'
+
+
+def identifier_key(identifier: str) -> str:
+    """Comparison form: AD matches all three kinds case-insensitively, and DNs ignore spacing"""
+    return normalize_dn(identifier) if identifier_kind(identifier) == 'dn' else fold(identifier)
+
+
+def chunk_filters(kind: str, identifiers: list[str], object_class: str | None = None) -> list[tuple[list[str], str]]:
+    """(identifiers, filter) pairs, each filter under BULK_LOOKUP_BATCH terms and BULK_LOOKUP_MAX_FILTER_LENGTH"""
+    chunks, current, terms, length = [], [], [], 0
+    for identifier in identifiers:
+        value = escape_filter_chars(identifier)
+        added = [f"({field}={value})" for field in LOOKUP_FIELDS[kind]]
+        added_length = sum(map(len, added))
+        if current and (len(terms) + len(added) > BULK_LOOKUP_BATCH or
+                        length + added_length > BULK_LOOKUP_MAX_FILTER_LENGTH):
+            chunks.append((current, terms))
+            current, terms, length = [], [], 0
+        current.append(identifier)
+        terms.extend(added)
+        length += added_length
+    if current:
+        chunks.append((current, terms))
+
+    filters = []
+    for chunk, chunk_terms in chunks:
+        condition = chunk_terms[0] if len(chunk_terms) == 1 else f"(|{''.join(chunk_terms)})"
+        if object_class:
+            condition = f"(&(objectClass={object_class}){condition})"
+        filters.append((chunk, condition))
+    return filters
+
+
+def _search(conn: Connection, filter_cond: str, attributes: list[str]) -> list[dict]:
+    rows = []
+    walk(conn, conn.server.info.other['defaultNamingContext'][0], filter_cond, attributes, None, rows.extend)
+    return rows
+
+
+def _keys(row: dict, kind: str) -> set[str]:
+    """Folded values of row that an identifier of this kind would match"""
+    if kind == 'dn':
+        return {normalize_dn(row['dn'])}
+    by_name = {name.lower(): values for name, values in row['attributes'].items()}
+    return {
+        fold(value)
+        for field in LOOKUP_FIELDS[kind]
+        for value in by_name.get(field.lower()) or []
+        if isinstance(value, str)
+    }
+
+
+class BulkLookup:
+    """
+    One bulk request. Iterate it for lists of result rows, in the
+    {"dn", "attributes"} shape, as chunks complete. Afterwards not_found
+    holds the identifiers nothing matched, and failed holds the ones whose
+    chunk errored.
+    """
+
+    def __init__(self, pool, identifiers: list[str], attributes: list[str], object_class: str | None = None):
+        self.pool = pool
+        self.attributes = list(attributes)
+        self.object_class = object_class
+        # Duplicates, as AD compares them, are looked up once
+        unique: dict[str, str] = {}
+        for identifier in identifiers:
+            identifier = identifier.strip()
+            if identifier:
+                unique.setdefault(identifier_key(identifier), identifier)
+        self.identifiers = list(unique.values())
+        self.found = 0
+        self.not_found: list[str] = []
+        self.failed: list[str] = []
+
+    async def __aiter__(self) -> AsyncIterator[list[dict]]:
+        by_kind: dict[str, list[str]] = {}
+        for identifier in self.identifiers:
+            by_kind.setdefault(identifier_kind(identifier), []).append(identifier)
+
+        requested = {name.lower() for name in self.attributes}
+        slots = asyncio.Semaphore(max(1, BULK_LOOKUP_CONCURRENCY))
+
+        async def run(kind: str, chunk: list[str], filter_cond: str):
+            # Matching needs the lookup attributes even when they weren't asked for
+            extra = [field for field in LOOKUP_FIELDS[kind] if kind != 'dn' and field.lower() not in requested]
+            async with slots:
+                try:
+                    rows = await self.pool.run(_search, filter_cond, self.attributes + extra)
+                except Exception as e:
+                    print(f"Bulk lookup chunk failed: {str(e)}")
+                    rows = None
+            return kind, chunk, rows, extra
+
+        tasks = [
+            asyncio.create_task(run(kind, chunk, filter_cond))
+            for kind, identifiers in by_kind.items()
+            for chunk, filter_cond in chunk_filters(kind, identifiers, self.object_class)
+        ]
+        seen: set[str] = set()
+        try:
+            for done in asyncio.as_completed(tasks):
+                kind, chunk, rows, extra = await done
+                if rows is None:
+                    self.failed.extend(chunk)
+                    continue
+                matched, fresh = set(), []
+                for row in rows:
+                    matched |= _keys(row, kind)
+                    for field in extra:
+                        row['attributes'].pop(field, None)
+                    # An object asked for twice (e.g. by DN and by name) is returned once
+                    dn_key = normalize_dn(row['dn'])
+                    if dn_key not in seen:
+                        seen.add(dn_key)
+                        fresh.append(row)
+                self.not_found.extend(identifier for identifier in chunk if identifier_key(identifier) not in matched)
+                self.found += len(fresh)
+                if fresh:
+                    yield fresh
+        finally:
+            # The client went away mid-stream: drop the chunks still queued
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,83 @@
+import os
+from functools import lru_cache
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+
+PBKDF2_ITERATIONS = 100000
+
+# Retired secrets/salts still accepted while clients roll over to a new key.
+# Comma separated; a single salt applies to every previous secret.
+PREVIOUS_SECRETS_ENV = 'AD_AUTH_PREVIOUS_SECRET_KEYS'
+PREVIOUS_SALTS_ENV = 'AD_AUTH_PREVIOUS_SALTS'
+
+
+@lru_cache(maxsize=32)
+def derive_key(server_secret: str, salt: bytes) -> bytes:
+    """
+    Derive an AES key from the server secret.
+    PBKDF2 is deliberately slow, so the result is cached per (secret, salt);
+    a changed secret or salt simply derives and caches a new key.
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=PBKDF2_ITERATIONS,
+    )
+    return kdf.derive(server_secret.encode())
+
+
+class KeyRing:
+    """Current AES-GCM key first, followed by retired keys accepted for decryption"""
+
+    def __init__(self, secrets_and_salts: list[tuple[str, bytes]]):
+        self._entries = secrets_and_salts
+        self._ciphers: list[AESGCM] | None = None
+
+    @property
+    def ciphers(self) -> list[AESGCM]:
+        if self._ciphers is None:
+            self._ciphers = [AESGCM(derive_key(secret, salt)) for secret, salt in self._entries]
+        return self._ciphers
+
+    @property
+    def primary(self) -> AESGCM:
+        return self.ciphers[0]
+
+    def warm(self):
+        """Derive every key now, e.g. at startup, instead of on the first login"""
+        return self.ciphers
+
+    def decrypt(self, iv: bytes, ciphertext: bytes) -> bytes:
+        last_error = None
+        for aesgcm in self.ciphers:
+            try:
+                return aesgcm.decrypt(iv, ciphertext, None)
+            except InvalidTag as e:
+                last_error = e
+        raise last_error or InvalidTag()
+
+
+@lru_cache(maxsize=8)
+def _build_keyring(server_secret: str, salt: bytes, previous_secrets: str, previous_salts: str) -> KeyRing:
+    entries = [(server_secret, salt)]
+    old_secrets = [s.strip() for s in previous_secrets.split(',') if s.strip()]
+    old_salts = [s.strip().encode() for s in previous_salts.split(',') if s.strip()] or [salt]
+    for i, secret in enumerate(old_secrets):
+        old_salt = old_salts[i] if i < len(old_salts) else old_salts[-1]
+        if (secret, old_salt) not in entries:
+            entries.append((secret, old_salt))
+    return KeyRing(entries)
+
+
+def get_keyring(server_secret: str, salt: bytes) -> KeyRing:
+    """Return the (cached) key ring for the current secret, salt and rotation settings"""
+    return _build_keyring(
+        server_secret,
+        salt,
+        os.getenv(PREVIOUS_SECRETS_ENV, ''),
+        os.getenv(PREVIOUS_SALTS_ENV, ''),
+    )
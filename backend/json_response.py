@@ -0,0 +1,30 @@
+"""
+JSON responses for large result payloads.
+
+Endpoints that hand back thousands of rows return FastJSONResponse so
+FastAPI neither revalidates the payload against the response model nor
+walks it with jsonable_encoder. The body is encoded once, with orjson when
+it is installed.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,129 @@
+"""
+Server-side sort (RFC 2891) and Virtual List View (draft-ietf-ldapext-ldapv3-vlv)
+request controls, which ldap3 does not build or decode on its own.
+"""
+from pyasn1.codec.ber import decoder
+from pyasn1.type.namedtype import NamedTypes, NamedType, OptionalNamedType, DefaultedNamedType
+from pyasn1.type.tag import Tag, tagClassContext, tagFormatConstructed, tagFormatSimple
+from pyasn1.type.univ import Sequence, SequenceOf, Choice, Integer, OctetString, Boolean, Enumerated
+from ldap3 import Server
+from ldap3.protocol.controls import build_control
+
+SORT_REQUEST_OID = '1.2.840.113556.1.4.473'
+VLV_REQUEST_OID = '2.16.840.1.113730.3.4.9'
+VLV_RESPONSE_OID = '2.16.840.1.113730.3.4.10'
+SHOW_DELETED_OID = '1.2.840.113556.1.4.417'
+
+
+class SortKey(Sequence):
+    componentType = NamedTypes(
+        NamedType('attributeType', OctetString()),
+        OptionalNamedType('orderingRule', OctetString().subtype(
+            implicitTag=Tag(tagClassContext, tagFormatSimple, 0))),
+        DefaultedNamedType('reverseOrder', Boolean(False).subtype(
+            implicitTag=Tag(tagClassContext, tagFormatSimple, 1)))
+    )
+
+
+class SortKeyList(SequenceOf):
+    componentType = SortKey()
+
+
+class ByOffset(Sequence):
+    tagSet = Sequence.tagSet.tagImplicitly(Tag(tagClassContext, tagFormatConstructed, 0))
+    componentType = NamedTypes(
+        NamedType('offset', Integer()),
+        NamedType('contentCount', Integer())
+    )
+
+
+class VlvTarget(Choice):
+    componentType = NamedTypes(
+        NamedType('byOffset', ByOffset()),
+        NamedType('greaterThanOrEqual', OctetString().subtype(
+            implicitTag=Tag(tagClassContext, tagFormatSimple, 1)))
+    )
+
+
+class VlvRequest(Sequence):
+    componentType = NamedTypes(
+        NamedType('beforeCount', Integer()),
+        NamedType('afterCount', Integer()),
+        NamedType('target', VlvTarget()),
+        OptionalNamedType('contextID', OctetString())
+    )
+
+
+class VlvResponse(Sequence):
+    componentType = NamedTypes(
+        NamedType('targetPosition', Integer()),
+        NamedType('contentCount', Integer()),
+        NamedType('virtualListViewResult', Enumerated()),
+        OptionalNamedType('contextID', OctetString())
+    )
+
+
+def server_supports(server: Server, *oids: str) -> bool:
+    """True if the server's root DSE advertises every given control OID"""
+    info = server.info
+    if not info or not info.supported_controls:
+        return False
+    supported = {control[0] for control in info.supported_controls}
+    return all(oid in supported for oid in oids)
+
+
+def supports_vlv(server: Server) -> bool:
+    return server_supports(server, SORT_REQUEST_OID, VLV_REQUEST_OID)
+
+
+def sort_control(attribute: str = 'cn', reverse: bool = False):
+    keys = SortKeyList()
+    key = SortKey()
+    key['attributeType'] = attribute
+    if reverse:
+        key['reverseOrder'] = True
+    keys.setComponentByPosition(0, key)
+    return build_control(SORT_REQUEST_OID, True, keys)
+
+
+def show_deleted_control():
+    """LDAP_SERVER_SHOW_DELETED_OID: include tombstones in the search"""
+    return build_control(SHOW_DELETED_OID, True, None)
+
+
+def vlv_control(offset: int, before_count: int = 0, after_count: int = 0,
+                content_count: int = 0, context_id: bytes | None = None):
+    """
+    VLV request positioned by offset. offset is 1-based; content_count is the
+    client's estimate of the list size (0 = let the server interpret offset as absolute).
+    """
+    by_offset = ByOffset()
+    by_offset['offset'] = offset
+    by_offset['contentCount'] = content_count
+    target = VlvTarget()
+    target['byOffset'] = by_offset
+    request = VlvRequest()
+    request['beforeCount'] = before_count
+    request['afterCount'] = after_count
+    request['target'] = target
+    if context_id:
+        request['contextID'] = context_id
+    return build_control(VLV_REQUEST_OID, True, request)
+
+
+def parse_vlv_response(result: dict) -> dict | None:
+    """Decode the VLV response control from an ldap3 conn.result dict"""
+    control = (result or {}).get('controls', {}).get(VLV_RESPONSE_OID)
+    if not control:
+        return None
+    value = control['value']
+    if isinstance(value, dict):
+        return value
+    decoded, _ = decoder.decode(value, asn1Spec=VlvResponse())
+    context_id = decoded['contextID']
+    return {
+        'target_position': int(decoded['targetPosition']),
+        'content_count': int(decoded['contentCount']),
+        'result': int(decoded['virtualListViewResult']),
+        'context_id': bytes(context_id) if context_id.isValue else None
+    }
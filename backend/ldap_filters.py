@@ -0,0 +1,138 @@
+import json
+import os
+import re
+
+from ldap3.utils.conv import escape_filter_chars
+
+# --- Configuration ---
+# With no explicit match mode, input of at most this many characters is
+# treated as type-ahead and matched as a prefix, which AD can answer from its indexes
+MATCH_PREFIX_MAX_LENGTH = int(os.getenv('AD_MATCH_PREFIX_MAX_LENGTH', '3'))
+
+MATCH_MODES = ('contains', 'prefix', 'exact', 'anr')
+OBJECT_CLASSES = {'computers': 'computer', 'users': 'user', 'groups': 'group'}
+# Attributes the query text is matched on, per object type
+SEARCH_ATTRIBUTES = {
+    'computers': ('cn',),
+    'users': ('cn', 'sAMAccountName'),
+    'groups': ('cn',),
+}
+
+_DN_SEPARATOR = re.compile(r'\s*([,=+])\s*')
+_WILDCARDS = re.compile(r'\*+')
+
+
+def normalize_dn(dn: str | None) -> str:
+    """Case- and whitespace-insensitive form of a DN, used for cache keys and comparisons"""
+    if not dn:
+        return ''
+    return _DN_SEPARATOR.sub(r'\1', dn.strip()).lower()
+
+
+def _normalize_item(item: str) -> str:
+    """attr op value with the attribute and operator folded; the value is kept verbatim"""
+    attribute, equals, value = item.partition('=')
+    return re.sub(r'\s+', '', attribute).lower() + equals + value
+
+
+def normalize_filter(filter_cond: str) -> str:
+    """
+    Canonical form of an LDAP filter string for cache keys. Only the structure
+    is normalized: whitespace between components and around attribute names
+    goes, and attribute names are lower-cased. Assertion values are kept as
+    they are, since a space or a case change there can change what AD returns.
+    """
+    parts = []
+    i, end = 0, len(filter_cond)
+    while i < end:
+        char = filter_cond[i]
+        if char.isspace():
+            i += 1
+        elif char in ')&|!':
+            parts.append(char)
+            i += 1
+        elif char == '(':
+            parts.append(char)
+            i += 1
+            while i < end and filter_cond[i].isspace():
+                i += 1
+            if i < end and filter_cond[i] not in '&|!(':
+                # A simple item; ')' inside a value is always escaped as \29
+                close = filter_cond.find(')', i)
+                close = end if close == -1 else close
+                parts.append(_normalize_item(filter_cond[i:close]))
+                i = close
+        else:
+            # A bare item without parentheses
+            parts.append(_normalize_item(filter_cond[i:].rstrip()))
+            break
+    return ''.join(parts)
+
+
+def canonical_query(server: str, filter_cond: str, ous: list[str | None], attributes: list[str], page_size: int) -> str:
+    """
+    One string per distinct query: the LDAP server, normalized filter and
+    search bases, and the attribute set (case-insensitive, order and
+    duplicates ignored).
+    """
+    return json.dumps([
+        server.lower(),
+        normalize_filter(filter_cond),
+        [normalize_dn(ou) for ou in ous],
+        sorted({a.lower() for a in attributes}),
+        page_size
+    ], separators=(',', ':'))
+
+
+def choose_match(object_type: str, query: str) -> str:
+    """
+    Match mode when the request doesn't name one: explicit wildcards keep
+    substring semantics, short input is a prefix, and a first/last name pair
+    for users goes through Ambiguous Name Resolution.
+    """
+    query = query.strip()
+    if '*' in query:
+        return 'contains'
+    if object_type == 'users' and ' ' in query:
+        return 'anr'
+    if len(query) <= MATCH_PREFIX_MAX_LENGTH:
+        return 'prefix'
+    return 'contains'
+
+
+def _assertion(query: str, wildcards: bool) -> str:
+    """Escaped assertion value; with wildcards, '*' in the input stays a wildcard"""
+    if not wildcards:
+        return escape_filter_chars(query)
+    return '*'.join(escape_filter_chars(piece) for piece in query.split('*'))
+
+
+def query_filter(object_type: str, query: str, match: str) -> str:
+    """
+    LDAP filter for a search box query. prefix and exact compare from the
+    start of the value, so AD can use its attribute indexes; contains is a
+    leading-wildcard substring search the DC has to scan for; anr hands the
+    text to Ambiguous Name Resolution. Raises ValueError for bad input.
+    """
+    if match not in MATCH_MODES:
+        raise ValueError(f"Invalid match mode: {match}")
+    query = query.strip()
+    if not query and match in ('exact', 'anr'):
+        raise ValueError(f"The {match} match mode needs query text")
+
+    if match == 'anr':
+        condition = f"(anr={_assertion(query, False)})"
+    else:
+        if not query:
+            value = "*"
+        elif match == 'contains':
+            value = f"*{_assertion(query, True)}*"
+        elif match == 'prefix':
+            value = f"{_assertion(query, True)}*"
+        else:
+            value = _assertion(query, False)
+        # Escaped text never contains a bare '*', so runs of them are wildcards
+        value = _WILDCARDS.sub('*', value)
+        conditions = [f"({attribute}={value})" for attribute in SEARCH_ATTRIBUTES[object_type]]
+        condition = conditions[0] if len(conditions) == 1 else f"(|{''.join(conditions)})"
+    return f"(&(objectClass={OBJECT_CLASSES[object_type]}){condition})"
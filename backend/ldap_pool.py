@@ -0,0 +1,247 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from ldap3 import Server, Connection, NONE, BASE, NO_ATTRIBUTES
+from ldap3.core.exceptions import LDAPException, LDAPCommunicationError, LDAPBindError
+
+from schema_cache import attach_server_info
+
+# --- Configuration ---
+LDAP_POOL_SIZE = int(os.getenv('LDAP_POOL_SIZE', '8'))
+# Seconds a connection may sit idle before it is probed again
+LDAP_POOL_HEALTH_INTERVAL = float(os.getenv('LDAP_POOL_HEALTH_INTERVAL', '60'))
+# Longest run_on waits for its pinned connection before taking any free one
+LDAP_POOL_PIN_WAIT = float(os.getenv('LDAP_POOL_PIN_WAIT', '5'))
+
+
+class LdapPool:
+    """
+    Bounded pool of bound ldap3 connections.
+
+    ldap3's default SYNC strategy blocks the calling thread for the whole
+    round trip, so every operation is run on a dedicated worker thread with
+    a connection checked out exclusively for that call. At most `size`
+    searches are in flight; further callers wait for a free slot without
+    blocking the event loop.
+
+    Paged-results cookies are only valid on the connection that issued them,
+    so run_on can route a call back to a given slot. Each slot carries a
+    generation that is bumped whenever its connection is rebound.
+    """
+
+    def __init__(self, ldap_url: str, user: str, password: str,
+                 size: int = LDAP_POOL_SIZE,
+                 health_interval: float = LDAP_POOL_HEALTH_INTERVAL):
+        self.ldap_url = ldap_url
+        self.user = user
+        self.password = password
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        # Root DSE and schema are attached by open(), from the schema cache when it is current
+        self.server = Server(ldap_url, get_info=NONE)
+        self.server_info_source = None
+        # Tells pins from another pool (or another worker process) apart
+        self.pool_id = uuid.uuid4().hex[:8]
+        self._conns: list[Connection | None] = [None] * self.size
+        self._generations = [0] * self.size
+        self._checked_at = [0.0] * self.size
+        self._idle: list[int] = []
+        self._available = asyncio.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="ldap-pool")
+        self._lock = threading.Lock()
+        self._rebinds = 0
+        self._closed = False
+        self._releasing: set[asyncio.Task] = set()
+
+    # --- Lifecycle ---
+    async def open(self):
+        """Bind all connections up front so the first queries don't pay for it"""
+        loop = asyncio.get_running_loop()
+        first = await loop.run_in_executor(self._executor, self._connect)
+        if self.server.info is None:
+            self.server_info_source = await loop.run_in_executor(
+                self._executor, attach_server_info, self.server, first, self.ldap_url
+            )
+        conns = [first] + await asyncio.gather(*[
+            loop.run_in_executor(self._executor, self._connect)
+            for _ in range(self.size - 1)
+        ])
+        for slot, conn in enumerate(conns):
+            self._conns[slot] = conn
+            self._checked_at[slot] = time.monotonic()
+            self._idle.append(slot)
+        return self
+
+    async def close(self):
+        """Unbind every idle connection and stop the worker threads"""
+        self._closed = True
+        loop = asyncio.get_running_loop()
+        async with self._available:
+            conns = [self._conns[slot] for slot in self._idle]
+            self._idle.clear()
+            self._available.notify_all()
+        await asyncio.gather(*[
+            loop.run_in_executor(self._executor, self._unbind, conn)
+            for conn in conns
+        ])
+        self._executor.shutdown(wait=False)
+
+    # --- Public API ---
+    @property
+    def default_naming_context(self) -> str:
+        return self.server.info.other['defaultNamingContext'][0]
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run func(conn, *args, **kwargs) on a worker thread with a pooled connection.
+        func must do all of its work with conn (search and read conn.response /
+        conn.result) before returning, since the connection is handed to the
+        next caller as soon as it does.
+        """
+        slot = await self._acquire()
+        return await self._run_in_slot(slot, None, func, args, kwargs)
+
+    async def run_on(self, pin: str | None, func: Callable[..., Any], *args, **kwargs) -> tuple[Any, str]:
+        """
+        Like run, but on the connection named by pin (as returned by an earlier
+        run_on) when possible. func is called as func(conn, pinned, *args, **kwargs),
+        where pinned says whether conn is still the same bound connection; if not,
+        any per-connection state such as a paging cookie has to be rebuilt.
+        Returns (result, pin for the connection that was used).
+        """
+        slot, generation = self._parse_pin(pin)
+        slot = await self._acquire(slot)
+        result = await self._run_in_slot(slot, generation, func, args, kwargs)
+        return result, f"{self.pool_id}:{slot}:{self._generations[slot]}"
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self.size - len(self._idle),
+            "rebinds": self._rebinds,
+            "ldap_url": self.ldap_url,
+            "server_info": self.server_info_source,
+        }
+
+    # --- Slots ---
+    def _parse_pin(self, pin: str | None) -> tuple[int | None, int]:
+        try:
+            pool_id, slot, generation = pin.split(':')
+            slot, generation = int(slot), int(generation)
+        except (AttributeError, ValueError):
+            return None, -1
+        if pool_id != self.pool_id or not 0 <= slot < self.size:
+            return None, -1
+        return slot, generation
+
+    async def _acquire(self, slot: int | None = None) -> int:
+        if self._closed:
+            raise RuntimeError("LDAP pool is closed")
+        async with self._available:
+            if slot is not None:
+                try:
+                    await asyncio.wait_for(self._available.wait_for(lambda: slot in self._idle), LDAP_POOL_PIN_WAIT)
+                    self._idle.remove(slot)
+                    return slot
+                except asyncio.TimeoutError:
+                    pass  # Pinned connection stayed busy; take whichever frees up first
+            await self._available.wait_for(lambda: self._idle or self._closed)
+            if self._closed:
+                raise RuntimeError("LDAP pool is closed")
+            return self._idle.pop(0)
+
+    async def _release(self, slot: int):
+        if self._closed:
+            # Pool was swapped out while this call was running
+            asyncio.get_running_loop().run_in_executor(None, self._unbind, self._conns[slot])
+            return
+        async with self._available:
+            self._idle.append(slot)
+            self._available.notify_all()
+
+    async def _run_in_slot(self, slot: int, generation: int | None,
+                           func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        """
+        Run func on the slot's connection and release the slot once the worker
+        thread is done with it. A cancelled caller stops waiting right away, but
+        the slot stays checked out until the thread finishes: ldap3's SYNC
+        connections must not be driven from two threads at once.
+        """
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(self._call, slot, generation, func, args, kwargs)
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(self._schedule_release, slot)
+            except RuntimeError:
+                pass  # Event loop already closed; the pool goes with it
+
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _schedule_release(self, slot: int):
+        task = asyncio.ensure_future(self._release(slot))
+        self._releasing.add(task)
+        task.add_done_callback(self._releasing.discard)
+
+    # --- Worker-thread helpers ---
+    def _connect(self) -> Connection:
+        conn = Connection(self.server, user=self.user, password=self.password)
+        if not conn.bind(read_server_info=False):
+            raise LDAPBindError(f"LDAP bind failed: {conn.last_error}")
+        return conn
+
+    def _unbind(self, conn: Connection):
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    def _rebind(self, slot: int):
+        self._unbind(self._conns[slot])
+        with self._lock:
+            self._rebinds += 1
+        self._conns[slot] = self._connect()
+        self._generations[slot] += 1
+        self._checked_at[slot] = time.monotonic()
+
+    def _ensure_healthy(self, slot: int):
+        conn = self._conns[slot]
+        if conn.closed or not conn.bound:
+            self._rebind(slot)
+            return
+
+        if time.monotonic() - self._checked_at[slot] < self.health_interval:
+            return
+
+        # Cheap root DSE read to catch connections the DC dropped while idle
+        try:
+            conn.search('', '(objectClass=*)', search_scope=BASE, attributes=NO_ATTRIBUTES)
+            self._checked_at[slot] = time.monotonic()
+        except LDAPException as e:
+            print(f"LDAP pool health check failed, rebinding: {str(e)}")
+            self._rebind(slot)
+
+    def _invoke(self, slot: int, generation: int | None, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        conn = self._conns[slot]
+        if generation is None:
+            return func(conn, *args, **kwargs)
+        return func(conn, self._generations[slot] == generation, *args, **kwargs)
+
+    def _call(self, slot: int, generation: int | None, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        self._ensure_healthy(slot)
+        try:
+            result = self._invoke(slot, generation, func, args, kwargs)
+        except LDAPCommunicationError as e:
+            # Connection died mid-operation; retry once on a fresh bind
+            print(f"LDAP connection lost, rebinding: {str(e)}")
+            self._rebind(slot)
+            result = self._invoke(slot, generation, func, args, kwargs)
+        self._checked_at[slot] = time.monotonic()
+        return result
@@ -0,0 +1,38 @@
+"""
+Search results straight from conn.response to row dicts.
+
+Produces the same {"dn": ..., "attributes": {name: [values]}} shape as
+json.loads(entry.entry_to_json()), without building ldap3 Entry objects or
+going through a JSON string per entry.
+"""
+import base64
+import datetime
+
+
+def _cell(value):
+    """Same conversions as ldap3.utils.conv.format_json"""
+    if isinstance(value, (str, int, float)) or value is None:
+        return value
+    if isinstance(value, (datetime.datetime, datetime.timedelta)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return bytes(value).decode('utf-8')
+        except UnicodeDecodeError:
+            return {"encoded": base64.b64encode(bytes(value)).decode('ascii'), "encoding": "base64"}
+    return str(value)
+
+
+def entry_row(entry: dict) -> dict:
+    attributes = entry.get('attributes') or {}
+    row = {}
+    for name in sorted(attributes):
+        value = attributes[name]
+        values = value if isinstance(value, list) else [value]
+        row[name] = [_cell(v) for v in values]
+    return {"dn": entry['dn'], "attributes": row}
+
+
+def response_rows(response) -> list[dict]:
+    """Row dicts for the searchResEntry items of conn.response (referrals are skipped)"""
+    return [entry_row(entry) for entry in response or () if entry.get('type') == 'searchResEntry']
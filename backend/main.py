@@ -9,6 +9,14 @@ import uuid
 import time
 from datetime import datetime, timedelta
 import base64
+import asyncio
+import heapq
+import os
+import threading
+from collections import OrderedDict
+
+from ps_pool import PowerShellPool, PowerShellError
+from page_codec import ColumnarRows
 
 app = FastAPI(title="Active Directory Query API")
 
@@ -49,72 +57,157 @@ DEFAULT_ATTRIBUTES = {
     "groups": ["Name", "GroupCategory", "GroupScope", "Description", "DistinguishedName", "ManagedBy"]
 }
 
-# In-memory session store with TTL
+# --- Session store configuration ---
+SESSION_TTL_SECONDS = int(os.getenv('PS_SESSION_TTL', '1800'))  # 30 minutes
+# Approximate bytes of cached results kept across all sessions
+SESSION_MEMORY_BUDGET = int(os.getenv('PS_SESSION_MEMORY_BUDGET_MB', '256')) * 1024 * 1024
+# Longest the sweeper sleeps between passes
+SESSION_SWEEP_INTERVAL = float(os.getenv('PS_SESSION_SWEEP_INTERVAL', '60'))
+
+def approx_size(item) -> int:
+    """Rough in-memory footprint of a result row (its JSON length)"""
+    return len(json.dumps(item, default=str))
+
+# In-memory session store with TTL, LRU eviction and a memory budget.
+# all_results is a ColumnarRows: attribute names once, interned values
 class SessionStore:
-    def __init__(self, ttl_seconds=1800):  # Default 30 minute TTL
-        self.sessions = {}
+    """
+    Sessions live for ttl_seconds after creation. Expiry times sit in a heap so
+    the background sweeper only looks at sessions that are actually due.
+    The cached results of all sessions are kept under memory_budget bytes
+    (estimated from each row's JSON size) by evicting least recently used
+    sessions first. Safe to use from the request threadpool.
+    """
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, memory_budget=SESSION_MEMORY_BUDGET):
+        self.sessions = OrderedDict()
         self.ttl_seconds = ttl_seconds
+        self.memory_budget = memory_budget
+        self._expiry_heap = []  # (expires_at, session_id), monotonic time
+        self._sizes = {}  # session_id -> (bytes, rows counted)
+        self._bytes = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._lock = threading.RLock()
     
     def create_session(self, query_params):
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
-            'query_params': query_params,
-            'created_at': datetime.now(),
-            'last_accessed': datetime.now(),
-            'pages_fetched': 0,
-            'total_count': 0,
-            'is_count_exact': False,
-            'pagination_cookies': {},
-            'all_results': [],
-            'is_complete': False
-        }
+        with self._lock:
+            self.sessions[session_id] = {
+                'query_params': query_params,
+                'created_at': datetime.now(),
+                'last_accessed': datetime.now(),
+                'pages_fetched': 0,
+                'total_count': 0,
+                'is_count_exact': False,
+                'pagination_cookies': {},
+                'all_results': ColumnarRows(),
+                'is_complete': False
+            }
+            self._sizes[session_id] = (0, 0)
+            heapq.heappush(self._expiry_heap, (time.monotonic() + self.ttl_seconds, session_id))
         return session_id
     
     def get_session(self, session_id):
-        if session_id not in self.sessions:
-            return None
-        
-        session = self.sessions[session_id]
-        # Check if expired
-        if datetime.now() - session['created_at'] > timedelta(seconds=self.ttl_seconds):
-            del self.sessions[session_id]
-            return None
-        
-        # Update last accessed time
-        session['last_accessed'] = datetime.now()
-        return session
+        with self._lock:
+            if session_id not in self.sessions:
+                return None
+            
+            session = self.sessions[session_id]
+            # Check if expired
+            if datetime.now() - session['created_at'] > timedelta(seconds=self.ttl_seconds):
+                self._remove(session_id)
+                self._expirations += 1
+                return None
+            
+            # Update last accessed time
+            session['last_accessed'] = datetime.now()
+            self.sessions.move_to_end(session_id)
+            return session
     
     def update_session(self, session_id, data):
-        if session_id in self.sessions:
-            self.sessions[session_id].update(data)
-            self.sessions[session_id]['last_accessed'] = datetime.now()
+        with self._lock:
+            if session_id not in self.sessions:
+                return
+            session = self.sessions[session_id]
+            session.update(data)
+            session['last_accessed'] = datetime.now()
+            self.sessions.move_to_end(session_id)
+            self._account(session_id, session)
+            self._enforce_budget(keep=session_id)
     
     def cleanup_expired(self):
-        # Clean up expired sessions
-        now = datetime.now()
-        expired = [sid for sid, session in self.sessions.items() 
-                  if now - session['created_at'] > timedelta(seconds=self.ttl_seconds)]
-        
-        for sid in expired:
-            del self.sessions[sid]
+        # Pop every session whose expiry is due; entries for evicted sessions are skipped
+        now = time.monotonic()
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                _, session_id = heapq.heappop(self._expiry_heap)
+                if session_id in self.sessions:
+                    self._remove(session_id)
+                    self._expirations += 1
+    
+    def next_sweep_delay(self):
+        """Seconds until the next session is due to expire, capped at the sweep interval"""
+        with self._lock:
+            if not self._expiry_heap:
+                return SESSION_SWEEP_INTERVAL
+            return min(max(0.0, self._expiry_heap[0][0] - time.monotonic()), SESSION_SWEEP_INTERVAL)
+    
+    def has_room(self, session_id):
+        """Whether a session may cache more rows; a single session never holds more than the whole budget"""
+        with self._lock:
+            return self._sizes.get(session_id, (0, 0))[0] < self.memory_budget
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "bytes": self._bytes,
+                "memory_budget": self.memory_budget,
+                "evictions": self._evictions,
+                "expirations": self._expirations
+            }
+    
+    def _account(self, session_id, session):
+        """Add the size of rows appended since the last update (results only ever grow)"""
+        size, counted = self._sizes.get(session_id, (0, 0))
+        results = session['all_results']
+        if len(results) < counted:
+            # Replaced rather than extended; count from scratch
+            self._bytes -= size
+            size, counted = 0, 0
+        added = sum(approx_size(item) for item in results[counted:])
+        self._sizes[session_id] = (size + added, len(results))
+        self._bytes += added
+    
+    def _enforce_budget(self, keep):
+        """Evict least recently used sessions holding results until back under budget"""
+        if self._bytes <= self.memory_budget:
+            return
+        # Sessions without cached rows free nothing, so they are never evicted
+        victims = [sid for sid in self.sessions if sid != keep and self._sizes[sid][0] > 0]
+        for session_id in victims:
+            if self._bytes <= self.memory_budget:
+                break
+            self._remove(session_id)
+            self._evictions += 1
+    
+    def _remove(self, session_id):
+        del self.sessions[session_id]
+        size, _ = self._sizes.pop(session_id, (0, 0))
+        self._bytes -= size
 
-# Create session store
 session_store = SessionStore()
 
+# Persistent PowerShell workers; started on demand and warmed at startup
+powershell_pool = PowerShellPool()
+
 # Helper function to execute PowerShell commands
 def execute_powershell(command: str) -> str:
     try:
-        # Use PowerShell to execute the command
-        process = subprocess.run(
-            ["powershell", "-Command", command],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return process.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"PowerShell error: {e.stderr}")
-        raise HTTPException(status_code=500, detail=f"PowerShell error: {e.stderr}")
+        return powershell_pool.run(command)
+    except PowerShellError as e:
+        print(f"PowerShell error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"PowerShell error: {str(e)}")
 
 @app.get("/")
 def read_root():
@@ -123,7 +216,12 @@ def read_root():
 @app.get("/api/health")
 def health_check():
     """API Health Check"""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "powershell_pool": powershell_pool.stats(),
+        "sessions": session_store.stats()
+    }
 
 @app.get("/api/ad/attributes/{object_type}")
 def get_attributes(object_type: str):
@@ -172,7 +270,7 @@ def query_ad(request: ADQueryRequest):
         'total_count': total_count,
         'is_count_exact': is_exact,
         'pages_fetched': 1,
-        'all_results': results.copy(),
+        'all_results': ColumnarRows(results),
         'is_complete': not has_more,
         'pagination_cookies': {1: None, 2: pagination_cookie if has_more else None}
     })
@@ -298,9 +396,7 @@ def get_all_results(
     
     # If we already have all results, return them
     if session['is_complete']:
-        results = session['all_results']
-        if max_results > 0:
-            results = results[:max_results]
+        results = session['all_results'][:max_results or None]
         
         return {
             "results": results,
@@ -322,6 +418,10 @@ def get_all_results(
         if max_results > 0 and len(current_results) >= max_results:
             break
         
+        # Evicting other sessions can't make room for this one; stop here, incomplete
+        if not session_store.has_room(session_id):
+            break
+        
         # Get the cookie for the next page
         cookie = session['pagination_cookies'].get(current_page + 1)
         if not cookie:
@@ -340,9 +440,10 @@ def get_all_results(
             False  # Don't need count for subsequent pages
         )
         
-        # Update progress
+        # Update progress (and the session's size, for the budget check)
         current_page += 1
         current_results.extend(results)
+        session_store.update_session(session_id, {'pages_fetched': current_page})
         
         # Update cookies
         if has_more:
@@ -357,9 +458,7 @@ def get_all_results(
     session_store.update_session(session_id, session)
     
     # Return results
-    results = session['all_results']
-    if max_results > 0:
-        results = results[:max_results]
+    results = session['all_results'][:max_results or None]
     
     return {
         "results": results,
@@ -416,8 +515,9 @@ def get_ad_page(
     ou_paths = ou_paths or [None]
     
     # First, get count if requested
+    count_futures = []
     if get_count:
-        count_command = ""
+        count_commands = []
         for ou in ou_paths:
             if ou and not re.match(r'^[a-zA-Z0-9=,.\- ]+$', ou):
                 raise HTTPException(status_code=400, detail=f"Invalid OU path: {ou}")
@@ -425,33 +525,26 @@ def get_ad_page(
             # Create appropriate filter based on filter_type and whether search_query is empty
             if filter_type == "computers":
                 filter_condition = f"Name -like '*{search_query}*'" if search_query else "Name -like '*'"
-                count_command += f"""
+                count_commands.append(f"""
                 Get-ADComputer {"-SearchBase '" + ou + "' " if ou else ""} -Filter "{filter_condition}" | Measure-Object | Select-Object -ExpandProperty Count;
-                """
+                """)
             elif filter_type == "users":
                 if search_query:
                     filter_condition = f"Name -like '*{search_query}*' -or SamAccountName -like '*{search_query}*'"
                 else:
                     filter_condition = "Name -like '*'"
                     
-                count_command += f"""
+                count_commands.append(f"""
                 Get-ADUser {"-SearchBase '" + ou + "' " if ou else ""} -Filter "{filter_condition}" | Measure-Object | Select-Object -ExpandProperty Count;
-                """
+                """)
             elif filter_type == "groups":
                 filter_condition = f"Name -like '*{search_query}*'" if search_query else "Name -like '*'"
-                count_command += f"""
+                count_commands.append(f"""
                 Get-ADGroup {"-SearchBase '" + ou + "' " if ou else ""} -Filter "{filter_condition}" | Measure-Object | Select-Object -ExpandProperty Count;
-                """
+                """)
         
-        try:
-            count_result = execute_powershell(count_command)
-            counts = [int(c.strip()) for c in count_result.strip().split('\n') if c.strip()]
-            total_count = sum(counts)
-        except Exception as e:
-            # If count fails, we'll set an approximate count
-            print(f"Count estimation failed: {str(e)}")
-            total_count = 1000  # Default estimate
-            is_count_exact = False
+        # One worker per OU, running while this thread fetches the page
+        count_futures = [powershell_pool.submit(command) for command in count_commands]
     
     # Now get the actual page of results
     pagination_command = ""
@@ -559,13 +652,45 @@ def get_ad_page(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error querying AD: {str(e)}")
     
+    if count_futures:
+        try:
+            counts = [int(c.strip()) for future in count_futures
+                      for c in future.result().strip().split('\n') if c.strip()]
+            total_count = sum(counts)
+        except Exception as e:
+            # If count fails, we'll set an approximate count
+            print(f"Count estimation failed: {str(e)}")
+            total_count = 1000  # Default estimate
+            is_count_exact = False
+    
     return all_results, total_count, is_count_exact, has_more, next_cookie
 
 # Cleanup expired sessions periodically
 @app.on_event("startup")
 async def startup_event():
-    # Add any startup tasks here
-    pass
+    # Start the PowerShell workers (and their AD module import) in the background
+    asyncio.get_running_loop().run_in_executor(None, warm_powershell)
+    app.state.session_sweeper = asyncio.create_task(sweep_sessions())
+
+async def sweep_sessions():
+    """Expire sessions as they come due instead of waiting for someone to revisit them"""
+    while True:
+        await asyncio.sleep(session_store.next_sweep_delay())
+        try:
+            session_store.cleanup_expired()
+        except Exception as e:
+            print(f"Session sweep failed: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.session_sweeper.cancel()
+    powershell_pool.close()
+
+def warm_powershell():
+    try:
+        powershell_pool.warm()
+    except PowerShellError as e:
+        print(f"PowerShell workers not started: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,21 +1,41 @@
+import asyncio
 import base64
+import csv
+import io
 from datetime import datetime, timedelta
 import os
 import json
 import uuid
-from fastapi import FastAPI, HTTPException, Query, Path, Body, Depends
+from fastapi import FastAPI, HTTPException, Query, Path, Body, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from ldap3 import Server, Connection, ALL, SUBTREE, NTLM, SIMPLE
+from ldap3 import Server, Connection, ALL, SUBTREE, NTLM, SIMPLE, NO_ATTRIBUTES
 from typing import List, Optional, Dict, Any, Union
 import secrets
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
+import crypto_keys
+from crypto_keys import get_keyring
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from redis.asyncio import Redis
+from ldap_pool import LdapPool
+from ad_count import CountEngine
+from ldap_controls import supports_vlv
+from ldap_filters import canonical_query, choose_match, query_filter, MATCH_MODES, OBJECT_CLASSES
+from page_seek import DnIndex, SeekError, vlv_page, lookup_dns, SEEK_INDEX_MIN_PAGES
+from query_cursor import new_cursors, fetch_merged_page, has_more
+from query_planner import plan_bases, BaseOwners
+from session_repo import SessionRepository, PageConflict, SESSION_TTL
+from prefetch import Prefetcher
+from single_flight import SingleFlight
+from query_cache import QueryCache
+from auth_cache import SessionValidator, SessionExpired
+from session_tokens import TokenSigner, TokenInvalid, SESSION_TOKEN_MODE, SESSION_TOKEN_SECRET
+from ldap_rows import response_rows
+from json_response import FastJSONResponse, dumps
+from ad_replica import DirectoryReplica, REPLICA_ENABLED
+from membership import MembershipGraph, MEMBERSHIP_ENABLED
+from bulk_lookup import BulkLookup, BULK_LOOKUP_MAX_IDENTIFIERS
 
 
 # --- Configuration ---
@@ -35,21 +55,47 @@ LDAP_USER = os.getenv('LDAP_USER', '')
 LDAP_PASS = os.getenv('LDAP_PASS', '')
 SERVER_SECRET_KEY = os.getenv('AD_AUTH_SECRET_KEY', secrets.token_hex(32))
 SALT = os.getenv('AD_AUTH_SALT', secrets.token_hex(16)).encode()
+# Most queries one /api/ad/query/batch request may carry
+BATCH_QUERY_MAX = int(os.getenv('AD_BATCH_QUERY_MAX', '20'))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Redis pool
     app.state.redis = Redis(host="localhost", encoding="utf-8", port=6379, decode_responses=True)
+    # Query sessions hold raw paging cookies, so they get a binary-safe client
+    app.state.redis_bin = Redis(host="localhost", port=6379)
+    app.state.sessions = SessionRepository(app.state.redis_bin)
     
-    # LDAP connection
-    server = Server(app_config["ldap_url"], get_info=ALL)
-    conn = Connection(server, user=LDAP_USER, password=LDAP_PASS, auto_bind=True)
-    app.state.ldap = conn
+    # Derive the credential decryption keys once, off the event loop
+    await asyncio.to_thread(get_keyring(SERVER_SECRET_KEY, SALT).warm)
+
+    # LDAP connection pool
+    app.state.ldap_pool = await LdapPool(app_config["ldap_url"], LDAP_USER, LDAP_PASS).open()
+    app.state.counter = CountEngine(app.state.ldap_pool)
+    app.state.dn_index = DnIndex(app.state.ldap_pool, app.state.redis)
+    app.state.prefetcher = Prefetcher(app.state.ldap_pool, prefetch_next_page)
+    app.state.query_flight = SingleFlight()
+    app.state.query_cache = QueryCache(app.state.redis)
+    app.state.auth = await SessionValidator(app.state.redis).start()
+    app.state.tokens = None
+    if SESSION_TOKEN_MODE == 'signed':
+        app.state.tokens = TokenSigner(SESSION_TOKEN_SECRET or SERVER_SECRET_KEY, app.state.redis)
+    # Optional local copy of the directory that start_query answers from
+    app.state.replica = await DirectoryReplica(app.state.ldap_pool).start() if REPLICA_ENABLED else None
+    # Optional group nesting kept in memory for transitive membership lookups
+    app.state.membership = await MembershipGraph(app.state.ldap_pool).start() if MEMBERSHIP_ENABLED else None
     
     yield
     # close connections
+    if app.state.replica:
+        await app.state.replica.close()
+    if app.state.membership:
+        await app.state.membership.close()
+    await app.state.auth.close()
+    await app.state.prefetcher.close()
     await app.state.redis.close()
-    app.state.ldap.unbind()
+    await app.state.redis_bin.close()
+    await app.state.ldap_pool.close()
 
 # --- FastAPI App ---
 app = FastAPI(
@@ -80,6 +126,16 @@ class ADQueryRequest(BaseModel):
     attributes: list[str]
     ou_paths: list[str] | None = None
     page_size: int | None = 50
+    fresh: bool = False  # bypass the shared query cache
+    match: str | None = None  # 'contains', 'prefix', 'exact' or 'anr'; chosen from the input when omitted
+
+class BatchQueryRequest(BaseModel):
+    queries: list[ADQueryRequest]
+
+class BulkLookupRequest(BaseModel):
+    identifiers: list[str]  # DNs, sAMAccountNames and UPN/mail addresses, mixed freely
+    attributes: list[str]
+    filter: str | None = None  # 'computers', 'users' or 'groups' to restrict the object type
 
 class PaginatedResponse(BaseModel):
     results: list[dict]
@@ -89,6 +145,8 @@ class PaginatedResponse(BaseModel):
     has_next_page: bool
     session_id: str
     is_count_exact: bool = True
+    source: str = "ldap"  # 'ldap', or 'replica' when answered from the local replica
+    replica_age: float | None = None  # seconds since the replica last synced
 
 class AuthRequest(BaseModel):
     username: str
@@ -102,7 +160,7 @@ class AuthResponse(BaseModel):
     success: bool
     message: str
     user_info: Dict[str, Any] | None = None
-    token: Dict[str, Any] | None = None
+    token: str | None = None
 
 class ExportRequest(BaseModel):
     session_id: str
@@ -112,14 +170,8 @@ class ExportRequest(BaseModel):
 
 # --- Authentication Utilities ---
 def derive_key(server_secret: str):
-    """Derive a key from the server secret"""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=SALT,
-        iterations=100000,
-    )
-    return kdf.derive(server_secret.encode())
+    """Derive a key from the server secret (cached per secret and salt)"""
+    return crypto_keys.derive_key(server_secret, SALT)
 
 def decrypt_password(encrypted_data: str, server_key: str) -> str:
     """Decrypt a password using AES-GCM"""
@@ -128,9 +180,7 @@ def decrypt_password(encrypted_data: str, server_key: str) -> str:
         iv = encrypted_bytes[:12]  # Extract IV (first 12 bytes)
         ciphertext = encrypted_bytes[12:]  # Remaining is ciphertext
 
-        key = derive_key(server_key)
-        aesgcm = AESGCM(key)
-        plaintext = aesgcm.decrypt(iv, ciphertext, None)
+        plaintext = get_keyring(server_key, SALT).decrypt(iv, ciphertext)
 
         return plaintext.decode()
     except Exception as e:
@@ -191,106 +241,162 @@ def get_user_info(conn:Connection, username, domain):
         print(f"ERROR attempting to get_user_info: {str(e)}")
         raise
 
-# --- Helpers ---
-async def get_session_key(session_id: str) -> str:
-    return f"session:{session_id}"
+async def transitive_group_names(user_info: dict) -> list[str]:
+    """
+    Names of every group the user is in, nested ones included. Falls back to
+    the direct groups (memberOf) while the graph is disabled or still on its
+    initial pull, or if the lookup fails.
+    """
+    membership = getattr(app.state, 'membership', None)
+    if not user_info.get('distinguishedName') or membership is None or not membership.ready:
+        return user_info.get('groups', [])
+    try:
+        result = await membership.groups_of(user_info['distinguishedName'])
+    except Exception as e:
+        print(f"Transitive group lookup failed: {str(e)}")
+        result = None
+    if result is None:
+        return user_info.get('groups', [])
+    return [dn.split(',')[0].replace('CN=', '') for dn in result['groups']]
 
-async def count_ad_objects(conn, ou: str | None, filter_cond: str) -> tuple[int, bool]:
-    """Count AD objects matching the filter, return count and whether it's exact"""
+# --- Helpers ---
+async def count_ad_objects(ou_list: list[str | None], filter_cond: str) -> tuple[int, bool]:
+    """Count AD objects matching the filter across OUs, return count and whether it's exact"""
     try:
-        conn.search(
-            search_base=ou or conn.server.info.other['defaultNamingContext'][0],
-            search_filter=filter_cond,
-            search_scope=SUBTREE,
-            attributes=['distinguishedName'],
-            size_limit=1
-        )
-        # This is an estimation as we're not actually doing a full count
-        # but for lightweight queries it should be accurate
-        return len(conn.entries), True
+        return await app.state.counter.count_many(ou_list, filter_cond)
     except Exception as e:
         # If count fails, provide an estimate
         print(f"Count estimation failed: {str(e)}")
         return 1000, False
 
-async def ldap_page(ou: str | None, filter_cond: str, attrs: list[str], page_size: int, cookie: bytes | None):
-    conn: Connection = app.state.ldap
+async def refresh_session_count(session_id: str, ou_list: list[str | None], filter_cond: str) -> tuple[int, bool] | None:
+    """Pick up a count the background counter has refined since the session was created"""
+    refined = app.state.counter.peek_many(ou_list, filter_cond)
+    if refined is None or not refined[1]:
+        return None
+    await app.state.sessions.update_meta(session_id, {
+        'total_count': refined[0],
+        'is_count_exact': True
+    })
+    return refined
+
+def _resume_cookie(conn: Connection, base: str, filter_cond: str, offset: int) -> bytes | None:
+    """
+    Rebuild a paging cookie on this connection by replaying the search without
+    attributes up to offset entries. Returns None if the results ran out first.
+    """
+    cookie = None
+    while offset > 0:
+        conn.search(
+            search_base=base,
+            search_filter=filter_cond,
+            search_scope=SUBTREE,
+            attributes=NO_ATTRIBUTES,
+            paged_size=min(offset, 1000),
+            paged_cookie=cookie
+        )
+        offset -= sum(1 for entry in conn.response if entry.get('type') == 'searchResEntry')
+        cookie = conn.result.get('controls', {}).get('1.2.840.113556.1.4.319', {}).get('value', {}).get('cookie')
+        if not cookie:
+            return None
+    return cookie
+
+def _page_search(conn: Connection, pinned: bool, ou: str | None, filter_cond: str, attrs: list[str],
+                 page_size: int, cookie: bytes | None, offset: int):
+    base = ou or conn.server.info.other['defaultNamingContext'][0]
+    if cookie and not pinned:
+        # The cookie was issued on another connection (or before a rebind) and
+        # the DC won't honour it here; resume from the number of entries served
+        cookie = _resume_cookie(conn, base, filter_cond, offset)
+        if cookie is None:
+            return [], None
     conn.search(
-        search_base=ou or conn.server.info.other['defaultNamingContext'][0],
+        search_base=base,
         search_filter=filter_cond,
         search_scope=SUBTREE,
         attributes=attrs,
         paged_size=page_size,
         paged_cookie=cookie
     )
-    entries = [entry.entry_to_json() for entry in conn.response if entry.get('type') == 'searchResEntry']
+    entries = response_rows(conn.response)
     # extract cookie for next page
     controls = conn.result.get('controls', {})
     cookie_out = None
     if '1.2.840.113556.1.4.319' in controls:
         cookie_out = controls['1.2.840.113556.1.4.319']['value']['cookie']
+    return entries, cookie_out
+
+async def ldap_page(ou: str | None, filter_cond: str, attrs: list[str], page_size: int,
+                    cookie: bytes | None, pin: str | None = None, offset: int = 0):
+    # Runs in a worker thread on the pooled connection that issued the cookie, when it's still there
+    (entries, cookie_out), pin = await app.state.ldap_pool.run_on(
+        pin, _page_search, ou, filter_cond, attrs, page_size, cookie, offset
+    )
     has_more = bool(cookie_out)
-    return entries, cookie_out, has_more
+    return entries, cookie_out, has_more, pin
 
-async def export_to_csv(session_id: str, selected_ids: List[str] = None):
-    """Export session results to CSV"""
-    session_key = await get_session_key(session_id)
-    
-    # Get all pages
-    page_list = session_key + ":pages"
-    
-    all_results = []
-    page_count = await app.state.redis.llen(page_list)
-    
-    for i in range(page_count):
-        page_data = await app.state.redis.lindex(page_list, i)
-        results = json.loads(page_data)
-        all_results.extend(results)
-    
-    # Filter by selected IDs if provided
-    if selected_ids:
-        all_results = [item for item in all_results if item.get('distinguishedName') in selected_ids]
-    
-    # Generate CSV content
-    if not all_results:
-        return "No data to export"
-    
-    # Get fields from first result
-    fields = list(all_results[0].keys())
-    csv_content = ",".join(fields) + "\n"
+async def iter_session_results(session_id: str, selected_ids: List[str] = None):
+    """
+    Yield a session's results page by page: cached pages first (a batch per
+    round trip), then pages not fetched yet, straight from LDAP.
+    """
+    selected = {dn.lower() for dn in selected_ids} if selected_ids else None
+    served = 0
+    has_next = True
+    async for page in app.state.sessions.iter_pages(session_id):
+        served += 1
+        entries = page
+        if selected is not None:
+            entries = [e for e in entries if e['dn'].lower() in selected]
+        yield entries
     
-    for item in all_results:
-        row = []
-        for field in fields:
-            value = item.get(field, "")
-            # Handle values with commas by quoting
-            if isinstance(value, str) and (',' in value or '"' in value):
-                value = f'"{value.replace('"', '""')}"'
-            row.append(str(value) if value is not None else "")
-        csv_content += ",".join(row) + "\n"
+    # A selection can only contain entries the user has already seen
+    if selected is not None:
+        return
+    while has_next:
+        try:
+            response = await _fetch_page(session_id, served + 1)
+        except HTTPException:
+            return
+        served += 1
+        has_next = response.has_next_page and bool(response.results)
+        yield response.results
+
+def _flatten_entry(entry: dict, fields: list[str]) -> list[str]:
+    # AD returns lDAPDisplayName casing, which needn't match the requested field
+    attributes = {name.lower(): value for name, value in (entry.get('attributes') or {}).items()}
+    row = []
+    for field in fields:
+        value = entry['dn'] if field == 'dn' else attributes.get(field.lower(), "")
+        if isinstance(value, list):
+            value = "; ".join(str(v) for v in value)
+        row.append("" if value is None else str(value))
+    return row
+
+async def export_to_csv(session_id: str, fields: list[str], selected_ids: List[str] = None):
+    """Stream session results as CSV, one chunk per page"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue().encode()
     
-    return csv_content
+    async for entries in iter_session_results(session_id, selected_ids):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(_flatten_entry(entry, fields) for entry in entries)
+        yield buffer.getvalue().encode()
 
 async def export_to_json(session_id: str, selected_ids: List[str] = None):
-    """Export session results to JSON"""
-    session_key = await get_session_key(session_id)
-    
-    # Get all pages
-    page_list = session_key + ":pages"
-    
-    all_results = []
-    page_count = await app.state.redis.llen(page_list)
-    
-    for i in range(page_count):
-        page_data = await app.state.redis.lindex(page_list, i)
-        results = json.loads(page_data)
-        all_results.extend(results)
-    
-    # Filter by selected IDs if provided
-    if selected_ids:
-        all_results = [item for item in all_results if item.get('distinguishedName') in selected_ids]
-    
-    return json.dumps(all_results, indent=2)
+    """Stream session results as a JSON array, one chunk per page"""
+    yield b"["
+    first = True
+    async for entries in iter_session_results(session_id, selected_ids):
+        if not entries:
+            continue
+        chunk = ",\n".join(json.dumps(entry) for entry in entries)
+        yield (("\n" if first else ",\n") + chunk).encode()
+        first = False
+    yield b"\n]"
 
 # --- Session Management ---
 from fastapi import Depends, HTTPException, status
@@ -304,77 +410,106 @@ security = HTTPBearer()
 
 # Session management
 async def create_session(user_info: dict) -> str:
-    session_id = str(uuid.uuid4())
-    session_data = {
-        "user_info": json.dumps(user_info),
-        "created_at": time.time(),
-        "expires_at": time.time() + 3600  # 1 hour expiry
-    }
-    
-    # Store in Redis
-    session_key = f"user_session:{session_id}"
-    await app.state.redis.hset(session_key, mapping=session_data)
-    await app.state.redis.expire(session_key, 3600)  # 1 hour TTL
-    
-    return session_id
+    if app.state.tokens:
+        # Signed mode: the token itself carries the user info
+        return app.state.tokens.issue(user_info)
+    # Stored in Redis (1 hour sliding expiry) and cached locally
+    return await app.state.auth.create(user_info)
 
-async def validate_session(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    session_id = credentials.credentials
-    session_key = f"user_session:{session_id}"
-    
-    # Check if session exists
-    exists = await app.state.redis.exists(session_key)
-    if not exists:
+async def _session_claims(token: str) -> dict:
+    """Signed-mode token claims, with verification failures mapped to 401s"""
+    try:
+        return app.state.tokens.verify(token)
+    except SessionExpired:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session expired"
+        )
+    except TokenInvalid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired session"
         )
+
+async def validate_session(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    if app.state.tokens:
+        # Signature and expiry are checked in-process; a logout is one EXISTS away
+        claims = await _session_claims(credentials.credentials)
+        if await app.state.tokens.is_revoked(claims):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Session has been logged out"
+            )
+        return claims["user_info"]
     
-    # Get session data
-    session_data = await app.state.redis.hgetall(session_key)
-    
-    # Check if session expired
-    if float(session_data.get("expires_at", 0)) < time.time():
-        await app.state.redis.delete(session_key)
+    # Answered from the local validation cache when possible; see auth_cache
+    try:
+        user_info = await app.state.auth.validate(credentials.credentials)
+    except SessionExpired:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session expired"
         )
-    
-    # Refresh session TTL
-    await app.state.redis.expire(session_key, 3600)
-    
-    # Update expiry time
-    new_expires = time.time() + 3600
-    await app.state.redis.hset(session_key, "expires_at", new_expires)
-    
-    # Return user info
-    return json.loads(session_data.get("user_info", "{}"))
+    if user_info is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired session"
+        )
+    return user_info
 
 # --- Endpoints ---
 @app.get("/api/health")
 def health_check():
     """API Health Check"""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    pool = getattr(app.state, 'ldap_pool', None)
+    prefetcher = getattr(app.state, 'prefetcher', None)
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "ldap_pool": pool.stats() if pool else None,
+        "prefetch": prefetcher.stats() if prefetcher else None,
+        "query_flight": app.state.query_flight.stats() if hasattr(app.state, 'query_flight') else None,
+        "auth_cache": app.state.auth.stats() if hasattr(app.state, 'auth') else None,
+        "replica": app.state.replica.stats() if getattr(app.state, 'replica', None) else None,
+        "membership": app.state.membership.stats() if getattr(app.state, 'membership', None) else None
+    }
 
 @app.post("/api/auth/refresh")
-async def refresh_session(current_user: dict = Depends(validate_session)):
+async def refresh_session(current_user: dict = Depends(validate_session),
+                          credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Refresh the user's session"""
-    # Session is already refreshed in the validate_session dependency
-    return {
+    response = {
         "success": True,
         "message": "Session refreshed successfully",
         "user_info": current_user
     }
+    # Redis sessions slide in the validate_session dependency; a signed
+    # token can't be extended, so hand out a fresh one and revoke the old
+    # one, leaving a single live token for logout to kill
+    if app.state.tokens:
+        response["token"] = app.state.tokens.issue(current_user)
+        await app.state.tokens.revoke(app.state.tokens.verify(credentials.credentials))
+    return response
+
+@app.get("/api/auth/groups")
+async def session_groups(user_info: dict = Depends(validate_session)):
+    """All groups of the signed-in user, nested ones included; kept out of the session token"""
+    groups = await transitive_group_names(user_info)
+    return {"groups": groups, "count": len(groups)}
 
 @app.post("/api/auth/logout")
 async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Invalidate the user's session"""
-    session_id = credentials.credentials
-    session_key = f"user_session:{session_id}"
-    
-    # Delete the session
-    await app.state.redis.delete(session_key)
+    if app.state.tokens:
+        try:
+            claims = app.state.tokens.verify(credentials.credentials)
+        except (SessionExpired, TokenInvalid):
+            claims = None  # Nothing left to revoke
+        if claims:
+            await app.state.tokens.revoke(claims)
+    else:
+        # Delete the session and evict it from every worker's validation cache
+        await app.state.auth.revoke(credentials.credentials)
     
     return {
         "success": True,
@@ -399,79 +534,130 @@ async def get_attributes(object_type: str):
 @app.post("/api/ad/query", response_model=PaginatedResponse)
 async def start_query(req: ADQueryRequest,
                       user_info: dict = Depends(validate_session)):
+    return FastJSONResponse(dict(await _start_query(req)))
+
+@app.post("/api/ad/query/batch")
+async def start_query_batch(req: BatchQueryRequest,
+                            user_info: dict = Depends(validate_session)):
+    """
+    First pages of several queries in one round trip, e.g. users, computers
+    and groups of the same OU. The queries run concurrently; each result is
+    either a page or {"error", "status_code"} in the order they were sent.
+    """
+    if len(req.queries) > BATCH_QUERY_MAX:
+        raise HTTPException(400, f"At most {BATCH_QUERY_MAX} queries per batch")
+
+    async def run(query: ADQueryRequest) -> dict:
+        try:
+            return dict(await _start_query(query))
+        except HTTPException as e:
+            return {"error": e.detail, "status_code": e.status_code}
+        except Exception as e:
+            print(f"Batch query failed: {str(e)}")
+            return {"error": "Query failed", "status_code": 500}
+
+    return FastJSONResponse({"results": await asyncio.gather(*[run(query) for query in req.queries])})
+
+async def _start_query(req: ADQueryRequest) -> PaginatedResponse:
+    """Validate a query request and return its first page"""
     # Validate filter
     if req.filter not in {'computers', 'users', 'groups'}:
         raise HTTPException(400, "Invalid filter type")
     page_size = max(10, min(200, req.page_size or 50))
     
-    # Build an LDAP filter string
-    base_filter = {
-        'computers': f"(&(objectClass=computer)(cn=*{req.query}*))",
-        'users':     f"(&(objectClass=user)(|(cn=*{req.query}*)(sAMAccountName=*{req.query}*)))",
-        'groups':    f"(&(objectClass=group)(cn=*{req.query}*))"
-    }[req.filter]
+    # Build an LDAP filter string (prefix/exact/anr can use AD's indexes; contains can't)
+    match = req.match or choose_match(req.filter, req.query)
+    if match not in MATCH_MODES:
+        raise HTTPException(400, f"Invalid match mode, expected one of: {', '.join(MATCH_MODES)}")
+    try:
+        base_filter = query_filter(req.filter, req.query, match)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    
+    # One search per disjoint subtree: duplicate and nested bases are dropped
+    ou_list = plan_bases(req.ou_paths or [None], app.state.ldap_pool.default_naming_context)
+    return await _query(base_filter, ou_list, req.attributes, page_size, req.fresh,
+                        (req.filter, req.query.strip(), match))
+
+async def _query(base_filter: str, ou_list: list[str | None], attributes: list[str], page_size: int,
+                 fresh: bool = False, replica_match: tuple[str, str, str] | None = None) -> PaginatedResponse:
+    """First page of a query, from the shared cache when an identical search ran recently"""
+    # The server is part of the key: a switch must not serve the old directory's sessions
+    key = canonical_query(app.state.ldap_pool.ldap_url, base_filter, ou_list, attributes, page_size)
+    if not fresh:
+        session_id = await app.state.query_cache.get(key, SessionRepository.PREFIX)
+        if session_id is not None:
+            try:
+                return await _fetch_page(session_id, 1)
+            except HTTPException:
+                pass  # Session expired between the lookup and the read
     
-    ou_list = req.ou_paths or [None]
+    # Identical queries already in flight share one search and one session
+    async def run() -> PaginatedResponse:
+        response = await _run_query(base_filter, ou_list, attributes, page_size, replica_match)
+        await app.state.query_cache.put(key, response.session_id)
+        return response
+    return await app.state.query_flight.do(key, run)
+
+async def _run_query(base_filter: str, ou_list: list[str | None], attributes: list[str], page_size: int,
+                     replica_match: tuple[str, str, str] | None = None) -> PaginatedResponse:
+    """Count, fetch the first page and create the query session"""
     session_id = str(uuid.uuid4())
-    session_key = await get_session_key(session_id)
-
-    # Calculate total count (estimate)
-    total_count = 0
-    is_count_exact = True
-    for ou in ou_list:
-        count, is_exact = await count_ad_objects(app.state.ldap, ou, base_filter)
-        total_count += count
-        if not is_exact:
-            is_count_exact = False
-
-    # Prepare session data
-    await app.state.redis.hset(session_key, mapping={
+    session_key = app.state.sessions.key(session_id)
+
+    # (object type, text, match mode) queries are matched locally while the replica is fresh
+    replica = app.state.replica
+    if replica_match is not None and replica is not None and replica.covers(replica_match[0], ou_list, replica_match[2]):
+        return await _run_replica_query(session_id, base_filter, replica_match, ou_list, attributes, page_size)
+
+    # Calculate total count (exact, or an estimate refined in the background)
+    total_count, is_count_exact = await count_ad_objects(ou_list, base_filter)
+
+    # Sessions are seekable by position (VLV) when the DC supports it and the
+    # count is exact; otherwise jumps are served from a background DN index
+    seek_mode = 'index'
+    results = None
+    ou_counts = []
+    if is_count_exact and supports_vlv(app.state.ldap_pool.server):
+        ou_counts = [c for c, _ in await asyncio.gather(*[app.state.counter.count(ou, base_filter) for ou in ou_list])]
+        try:
+            results = await vlv_page(app.state.ldap_pool, ou_list, ou_counts, base_filter, attributes, page_size, 1)
+            has_more_global = page_size < total_count
+            seek_mode = 'vlv'
+        except SeekError as e:
+            print(f"VLV unavailable for this query, using paged cursors: {str(e)}")
+
+    # Fetch first page, fanning out across OUs
+    cursors = new_cursors(ou_list)
+    if results is None:
+        fetch = lambda ou, cookie, pin, offset: ldap_page(ou, base_filter, attributes, page_size, cookie, pin, offset)
+        owners = BaseOwners(ou_list, app.state.ldap_pool.default_naming_context)
+        results, has_more_global = await fetch_merged_page(cursors, ou_list, fetch, page_size, owners)
+
+    # Session metadata, cursors and first page go to Redis in one round trip
+    await app.state.sessions.create(session_id, {
         'filter': base_filter,
-        'attributes': json.dumps(req.attributes),
-        'ous': json.dumps(ou_list),
+        'attributes': attributes,
+        'ous': ou_list,
         'page_size': page_size,
         'current_index': 0,  # how many items served
         'total_count': total_count,
-        'is_count_exact': json.dumps(is_count_exact)
-    })
-    
-    # Set TTL for session keys (30 minutes)
-    await app.state.redis.expire(session_key, 1800)
-    
-    # Store per-OU cookies
-    for ou in ou_list:
-        await app.state.redis.hset(session_key + ":cookies", ou or "_ROOT_", "")
-    
-    # Set TTL for cookies
-    await app.state.redis.expire(session_key + ":cookies", 1800)
-
-    # Fetch first page
-    results = []
-    next_page_items = []
-    total_fetched = 0
-    has_more_global = False
-    for ou in ou_list:
-        cookie = b""
-        entries, cookie_out, has_more = await ldap_page(ou, base_filter, req.attributes, page_size, cookie)
-        results.extend(entries)
-        total_fetched += len(entries)
-        has_more_global = has_more_global or has_more
-        # persist this OU's cookie
-        await app.state.redis.hset(session_key + ":cookies", ou or "_ROOT_", cookie_out or "")
-        if total_fetched >= page_size:
-            break
+        'is_count_exact': is_count_exact,
+        'seek_mode': seek_mode,
+        'ou_counts': ou_counts
+    }, cursors, results)
 
-    # Create pages list
-    page_list = session_key + ":pages"
-    await app.state.redis.rpush(page_list, json.dumps(results[:page_size]))
-    await app.state.redis.expire(page_list, 1800)  # Set TTL
+    if seek_mode == 'index' and (not is_count_exact or total_count > SEEK_INDEX_MIN_PAGES * page_size):
+        await app.state.dn_index.ensure(session_key, ou_list, base_filter, SESSION_TTL)
+    if seek_mode == 'index' and has_more_global:
+        app.state.prefetcher.schedule(session_id, 1)
     
     # Calculate total pages
     total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
     
     # Respond
-    return PaginatedResponse(
-        results=[json.loads(r) for r in results[:page_size]],
+    return PaginatedResponse.model_construct(
+        results=results,
         total_count=total_count,
         current_page=1,
         page_size=page_size,
@@ -480,91 +666,278 @@ async def start_query(req: ADQueryRequest,
         is_count_exact=is_count_exact
     )
 
+async def _run_replica_query(session_id: str, base_filter: str, replica_match: tuple[str, str, str],
+                             ou_list: list[str | None], attributes: list[str], page_size: int) -> PaginatedResponse:
+    """_run_query against the local replica: exact count, pages read by position"""
+    object_type, text, match = replica_match
+    total_count = await app.state.replica.count(object_type, text, ou_list, match)
+    results = await _replica_page(replica_match, ou_list, attributes, page_size, 1)
+    await app.state.sessions.create(session_id, {
+        'filter': base_filter,
+        'attributes': attributes,
+        'ous': ou_list,
+        'page_size': page_size,
+        'current_index': 0,
+        'total_count': total_count,
+        'is_count_exact': True,
+        'seek_mode': 'replica',
+        'ou_counts': [],
+        'replica_match': list(replica_match)
+    }, {}, results)
+    return PaginatedResponse.model_construct(
+        results=results,
+        total_count=total_count,
+        current_page=1,
+        page_size=page_size,
+        has_next_page=page_size < total_count,
+        session_id=session_id,
+        is_count_exact=True,
+        **_freshness({'seek_mode': 'replica'})
+    )
+
+async def _replica_page(replica_match: tuple[str, str, str], ou_list: list[str | None], attributes: list[str],
+                        page_size: int, page_number: int) -> list[dict]:
+    """
+    One page of a replica session. The index picks the DNs; attributes the
+    replica doesn't hold are then read live for just those DNs.
+    """
+    replica = app.state.replica
+    if replica is None:
+        raise SeekError("The directory replica is not enabled")
+    object_type, text, match = replica_match
+    offset = (page_number - 1) * page_size
+    if replica.replicates(attributes):
+        return await replica.page(object_type, text, ou_list, attributes, offset, page_size, match)
+    dns = await replica.page_dns(object_type, text, ou_list, offset, page_size, match)
+    return await lookup_dns(app.state.ldap_pool, dns, attributes, ou_list)
+
+def _freshness(meta: dict) -> dict:
+    """Source fields for a session's pages"""
+    if meta.get('seek_mode') != 'replica':
+        return {}
+    replica = app.state.replica
+    return {'source': 'replica', 'replica_age': replica.age() if replica else None}
+
+@app.post("/api/ad/lookup")
+async def bulk_lookup(req: BulkLookupRequest,
+                      user_info: dict = Depends(validate_session)):
+    """
+    Look up many accounts in one request, without creating a query session.
+    Streams NDJSON: one line per object found, as each batch completes, and
+    a final {"summary": ...} line listing the identifiers nothing matched.
+    """
+    if req.filter is not None and req.filter not in OBJECT_CLASSES:
+        raise HTTPException(400, "Invalid filter type")
+    if len(req.identifiers) > BULK_LOOKUP_MAX_IDENTIFIERS:
+        raise HTTPException(400, f"At most {BULK_LOOKUP_MAX_IDENTIFIERS} identifiers per request")
+    lookup = BulkLookup(app.state.ldap_pool, req.identifiers, req.attributes, OBJECT_CLASSES.get(req.filter))
+    return StreamingResponse(bulk_lookup_lines(lookup), media_type="application/x-ndjson")
+
+async def bulk_lookup_lines(lookup: BulkLookup):
+    async for rows in lookup:
+        yield b"".join(dumps(row) + b"\n" for row in rows)
+    yield dumps({"summary": {
+        "requested": len(lookup.identifiers),
+        "found": lookup.found,
+        "not_found": lookup.not_found,
+        "failed": lookup.failed
+    }}) + b"\n"
+
+def _membership_graph() -> MembershipGraph:
+    if getattr(app.state, 'membership', None) is None:
+        raise HTTPException(503, "Membership graph is disabled (AD_MEMBERSHIP_ENABLED)")
+    return app.state.membership
+
+@app.get("/api/ad/membership/groups")
+async def principal_groups(principal: str = Query(..., description="DN or sAMAccountName"),
+                           user_info: dict = Depends(validate_session)):
+    """All groups of a user, computer or group: direct, nested and the primary group"""
+    membership = _membership_graph()
+    result = await membership.groups_of(principal)
+    if result is None:
+        raise HTTPException(404, "Principal not found")
+    return FastJSONResponse({**result, "count": len(result["groups"]), "graph_age": membership.age()})
+
+@app.get("/api/ad/membership/members")
+async def group_members(group: str = Query(..., description="DN or sAMAccountName"),
+                        recursive: bool = True,
+                        user_info: dict = Depends(validate_session)):
+    """Members of a group; with recursive, also everything in the groups nested under it"""
+    membership = _membership_graph()
+    result = await membership.members_of(group, recursive)
+    if result is None:
+        raise HTTPException(404, "Group not found")
+    return FastJSONResponse({**result, "count": len(result["members"]), "graph_age": membership.age()})
+
+@app.get("/api/ad/query/cache/stats")
+async def query_cache_stats(user_info: dict = Depends(validate_session)):
+    """Hit/miss counters and size of the shared query cache"""
+    return await app.state.query_cache.stats()
+
 @app.get("/api/ad/query/page/{session_id}", response_model=PaginatedResponse)
 async def fetch_page(
     session_id: str = Path(...),
     page_number: int = Query(1, ge=1)
 ):
-    session_key = await get_session_key(session_id)
-    exists = await app.state.redis.exists(session_key)
-    if not exists:
+    return FastJSONResponse(dict(await _fetch_page(session_id, page_number)))
+
+async def _fetch_page(session_id: str, page_number: int) -> PaginatedResponse:
+    """
+    One page of a query session. Built with model_construct: the rows come
+    from our own decoder, so revalidating every page isn't worth its cost.
+    """
+    # Metadata plus the cached page (or, on a miss, the cursors) in one round trip
+    read = await app.state.sessions.read_page(session_id, page_number)
+    if read is None:
+        app.state.prefetcher.cancel(session_id)
         raise HTTPException(404, "Session not found or expired")
+    meta = read['meta']
+    cached_pages = read['page_count']
     
-    page_size = int(await app.state.redis.hget(session_key, 'page_size'))
-    total_count = int(await app.state.redis.hget(session_key, 'total_count'))
-    is_count_exact = json.loads(await app.state.redis.hget(session_key, 'is_count_exact'))
+    page_size = meta['page_size']
+    total_count = meta['total_count']
+    is_count_exact = meta['is_count_exact']
+    if not is_count_exact:
+        refined = await refresh_session_count(session_id, meta['ous'], meta['filter'])
+        if refined:
+            total_count, is_count_exact = refined
     
     # Calculate total pages
     total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
     
-    if page_number > total_pages:
+    # An inexact count is only a lower bound, so don't reject pages past it
+    if is_count_exact and page_number > total_pages:
         raise HTTPException(status_code=400, detail=f"Page number exceeds total pages: {total_pages}")
     
-    page_list = session_key + ":pages"
-    # If page cached, return
-    if await app.state.redis.llen(page_list) >= page_number:
-        data = await app.state.redis.lindex(page_list, page_number-1)
-        results = json.loads(data)
-        return PaginatedResponse(
-            results=results,
+    seek_mode = meta.get('seek_mode')
+    next_in_line = page_number == cached_pages + 1
+    
+    # If page cached, return. In index mode the page after the sequential list
+    # is always rebuilt from the cursors so they stay in step with the list.
+    # An empty page is still a cached page
+    cached = read['page'] if read['page'] is not None else read['seek_page']
+    if cached is not None and not (next_in_line and seek_mode == 'index'):
+        if read['seek_page'] is not None and next_in_line:
+            # VLV page read out of order is now next in line; move it onto the list
+            await app.state.sessions.promote_seek_page(session_id, page_number, cached)
+        elif seek_mode == 'index' and read['page'] is not None and (page_number < total_pages or not is_count_exact):
+            # Only paged-cursor sessions have pages to prefetch
+            app.state.prefetcher.schedule(session_id, page_number)
+        return PaginatedResponse.model_construct(
+            results=cached,
             total_count=total_count,
             current_page=page_number,
             page_size=page_size,
-            has_next_page=page_number < total_pages,
+            has_next_page=page_number < total_pages or not is_count_exact,
             session_id=session_id,
-            is_count_exact=is_count_exact
+            is_count_exact=is_count_exact,
+            **_freshness(meta)
         )
     
-    # Otherwise build next page
-    base_filter = await app.state.redis.hget(session_key, 'filter')
-    attrs = json.loads(await app.state.redis.hget(session_key, 'attributes'))
-    ou_list = json.loads(await app.state.redis.hget(session_key, 'ous'))
+    # Otherwise build the page
+    base_filter = meta['filter']
+    attrs = meta['attributes']
+    ou_list = meta['ous']
+    session_key = app.state.sessions.key(session_id)
 
+    # Jump straight to the page instead of replaying the ones in between
+    if seek_mode in ('vlv', 'replica') or not next_in_line:
+        try:
+            if seek_mode == 'replica':
+                results = await _replica_page(meta['replica_match'], ou_list, attrs, page_size, page_number)
+                has_more_global = page_number * page_size < total_count
+            elif seek_mode == 'vlv':
+                results = await vlv_page(app.state.ldap_pool, ou_list, meta['ou_counts'], base_filter, attrs, page_size, page_number)
+                has_more_global = page_number * page_size < total_count
+            else:
+                await app.state.dn_index.ensure(session_key, ou_list, base_filter, SESSION_TTL)
+                dns, has_more_global = await app.state.dn_index.page_dns(session_key, page_size, page_number)
+                results = await lookup_dns(app.state.ldap_pool, dns, attrs, ou_list)
+        except SeekError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        if next_in_line:
+            await app.state.sessions.promote_seek_page(session_id, page_number, results)
+        else:
+            await app.state.sessions.store_seek_page(session_id, page_number, results)
+        return PaginatedResponse.model_construct(
+            results=results,
+            total_count=total_count,
+            current_page=page_number,
+            page_size=page_size,
+            has_next_page=has_more_global,
+            session_id=session_id,
+            is_count_exact=is_count_exact,
+            **_freshness(meta)
+        )
+
+    # Only the next page is left: fetch it with the paged cursors
+    lock = app.state.prefetcher.lock(session_id)
+    if lock.locked():
+        # A prefetch is advancing this session's cursors; serve what it stored
+        async with lock:
+            pass
+        return await _fetch_page(session_id, page_number)
+    cursors = read['cursors']
     results = []
-    has_more_global = False
-    
-    # We need to fetch pages sequentially
-    current_page = await app.state.redis.llen(page_list)
-    
-    while current_page < page_number:
-        page_results = []
-        for ou in ou_list:
-            # Get cookie for the current OU
-            cookie_raw = await app.state.redis.hget(session_key + ":cookies", ou or "_ROOT_")
-            if not cookie_raw:
-                continue  # Skip OUs without cookies (already exhausted)
-                
-            cookie = base64.b64decode(cookie_raw) if cookie_raw else b""
-            entries, cookie_out, has_more = await ldap_page(ou, base_filter, attrs, page_size, cookie)
-            
-            # Update cookie
-            await app.state.redis.hset(session_key + ":cookies", ou or "_ROOT_", cookie_out or "")
-            
-            page_results.extend(entries)
-            has_more_global = has_more_global or has_more
-            
-            if len(page_results) >= page_size:
-                break
-        
-        # Cache the new page
-        current_page += 1
-        await app.state.redis.rpush(page_list, json.dumps(page_results[:page_size]))
-        
-        # If we've reached the requested page, break
-        if current_page >= page_number:
-            results = page_results[:page_size]
-            break
+    has_more_global = has_more(cursors)
+    if has_more_global:
+        try:
+            async with lock:
+                results, has_more_global = await append_next_page(
+                    session_id, meta, cached_pages, cursors, read['seek_page'] is not None
+                )
+        except PageConflict:
+            # A concurrent request stored this page first; serve its copy
+            results = (await app.state.sessions.get_pages(session_id, page_number - 1, page_number - 1))[0]
+        except KeyError:
+            app.state.prefetcher.cancel(session_id)
+            raise HTTPException(404, "Session not found or expired")
+    if has_more_global:
+        app.state.prefetcher.schedule(session_id, page_number)
 
-    return PaginatedResponse(
+    return PaginatedResponse.model_construct(
         results=results,
         total_count=total_count,
         current_page=page_number,
         page_size=page_size,
-        has_next_page=has_more_global and page_number < total_pages,
+        has_next_page=has_more_global,
         session_id=session_id,
         is_count_exact=is_count_exact
     )
 
+async def append_next_page(session_id: str, meta: dict, page_index: int, cursors: dict,
+                           replaces_seek_page: bool = False) -> tuple[list, bool]:
+    """
+    Build the page after the sequential list from the cursors and store it with
+    the advanced cursors atomically. Raises PageConflict / KeyError like append_page.
+    """
+    fetch = lambda ou, cookie, pin, offset: ldap_page(ou, meta['filter'], meta['attributes'], meta['page_size'], cookie, pin, offset)
+    owners = BaseOwners(meta['ous'], app.state.ldap_pool.default_naming_context)
+    results, more = await fetch_merged_page(cursors, meta['ous'], fetch, meta['page_size'], owners)
+    await app.state.sessions.append_page(session_id, page_index, results, cursors)
+    if replaces_seek_page:
+        await app.state.sessions.drop_seek_page(session_id, page_index + 1)
+    return results, more
+
+async def prefetch_next_page(session_id: str, target: int) -> bool:
+    """Prefetcher callback: store the next uncached page unless target pages are cached already"""
+    meta = await app.state.sessions.get_meta(session_id)
+    if meta is None or meta.get('seek_mode') != 'index' or meta['page_count'] >= target:
+        return False
+    read = await app.state.sessions.read_page(session_id, meta['page_count'] + 1)
+    if read is None or not read['cursors'] or not has_more(read['cursors']):
+        return False
+    try:
+        _, more = await append_next_page(
+            session_id, read['meta'], read['page_count'], read['cursors'], read['seek_page'] is not None
+        )
+    except PageConflict:
+        return True
+    except KeyError:
+        return False  # session expired
+    return more
+
 @app.get("/api/ad/query/all/{session_id}")
 async def get_all_results(
     session_id: str = Path(...),
@@ -575,50 +948,108 @@ async def get_all_results(
     This may involve multiple AD queries to fetch all pages.
     Use max_results parameter to limit the total number of results.
     """
-    session_key = await get_session_key(session_id)
-    exists = await app.state.redis.exists(session_key)
-    if not exists:
+    meta = await app.state.sessions.get_meta(session_id)
+    if meta is None:
         raise HTTPException(404, "Session not found or expired")
     
     # We need to fetch more pages
-    total_count = int(await app.state.redis.hget(session_key, 'total_count'))
-    page_size = int(await app.state.redis.hget(session_key, 'page_size'))
-    is_count_exact = json.loads(await app.state.redis.hget(session_key, 'is_count_exact'))
+    total_count = meta['total_count']
+    page_size = meta['page_size']
+    is_count_exact = meta['is_count_exact']
     
     # Calculate how many pages we need
     pages_needed = (min(total_count, max_results) + page_size - 1) // page_size
     
     # Get current pages count
-    page_list = session_key + ":pages"
-    current_pages = await app.state.redis.llen(page_list)
+    current_pages = meta['page_count']
     
     # Fetch additional pages if needed
     for page in range(current_pages + 1, pages_needed + 1):
         try:
-            await fetch_page(session_id, page)
+            await _fetch_page(session_id, page)
         except HTTPException:
             break
     
     # Get all results
     all_results = []
-    fetched_page_count = await app.state.redis.llen(page_list)
-    
-    for i in range(fetched_page_count):
-        page_data = await app.state.redis.lindex(page_list, i)
-        results = json.loads(page_data)
-        all_results.extend(results)
+    async for page in app.state.sessions.iter_pages(session_id):
+        all_results.extend(page)
     
     # Apply max_results limit
     if max_results > 0:
         all_results = all_results[:max_results]
     
-    return {
+    return FastJSONResponse({
         "results": all_results,
         "total_count": total_count,
         "is_complete": len(all_results) >= total_count,
         "is_count_exact": is_count_exact,
         "fetched_count": len(all_results)
-    }
+    })
+
+@app.get("/api/ad/query/stream/{session_id}")
+async def stream_results(
+    request: Request,
+    session_id: str = Path(...),
+    format: str = Query("ndjson"),
+    max_results: int = Query(10000, ge=0)
+):
+    """
+    Stream a session's results as each page arrives, as NDJSON lines or
+    Server-Sent Events. A "results" event carries one page of rows. It is
+    followed by a "progress" event with fetched and total_count, and the
+    stream ends with "done". Paging stops as soon as the client goes away.
+    """
+    meta = await app.state.sessions.get_meta(session_id)
+    if meta is None:
+        raise HTTPException(404, "Session not found or expired")
+    format = format.lower()
+    if format == "ndjson":
+        media_type = "application/x-ndjson"
+    elif format == "sse":
+        media_type = "text/event-stream"
+    else:
+        raise HTTPException(400, "Unsupported stream format. Use 'ndjson' or 'sse'.")
+    # Keep proxies from buffering events that are meant to arrive one at a time
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream_session_events(request, session_id, meta, format, max_results),
+                             media_type=media_type, headers=headers)
+
+def _stream_event(format: str, event: str, data: dict) -> bytes:
+    if format == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+    return dumps({"event": event, **data}) + b"\n"
+
+async def stream_session_events(request: Request, session_id: str, meta: dict, format: str, max_results: int):
+    fetched = 0
+    pages = iter_session_results(session_id)
+    try:
+        async for entries in pages:
+            if max_results > 0:
+                entries = entries[:max_results - fetched]
+            fetched += len(entries)
+            if entries:
+                yield _stream_event(format, "results", {"results": entries})
+            # The background counter may have refined the total since the last page
+            meta = await app.state.sessions.get_meta(session_id) or meta
+            yield _stream_event(format, "progress", {
+                "fetched": fetched,
+                "total_count": meta['total_count'],
+                "is_count_exact": meta['is_count_exact']
+            })
+            if max_results > 0 and fetched >= max_results:
+                break
+            # Pages are fetched lazily, so returning here stops the LDAP paging
+            if await request.is_disconnected():
+                return
+    finally:
+        await pages.aclose()
+    yield _stream_event(format, "done", {
+        "fetched": fetched,
+        "total_count": meta['total_count'],
+        "is_complete": fetched >= meta['total_count'],
+        "is_count_exact": meta['is_count_exact']
+    })
 
 @app.post("/api/ad/query/export/{session_id}")
 async def export_results(
@@ -630,24 +1061,19 @@ async def export_results(
     Can export all results or only selected items.
     """
     # Verify session exists
-    session_key = await get_session_key(session_id)
-    exists = await app.state.redis.exists(session_key)
-    if not exists:
+    meta = await app.state.sessions.get_meta(session_id)
+    if meta is None:
         raise HTTPException(404, "Session not found or expired")
+    selected_ids = export_params.selected_ids if export_params.selected_only else None
     
-    # Call appropriate export function based on format
+    # Pick the streaming encoder; pages are pulled lazily as the client reads
     if export_params.format.lower() == "csv":
-        content = await export_to_csv(
-            session_id, 
-            export_params.selected_ids if export_params.selected_only else None
-        )
+        fields = ['dn'] + [a for a in meta['attributes'] if a.lower() != 'dn']
+        content = export_to_csv(session_id, fields, selected_ids)
         media_type = "text/csv"
         filename = f"ad_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     elif export_params.format.lower() == "json":
-        content = await export_to_json(
-            session_id, 
-            export_params.selected_ids if export_params.selected_only else None
-        )
+        content = export_to_json(session_id, selected_ids)
         media_type = "application/json"
         filename = f"ad_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
     else:
@@ -658,9 +1084,9 @@ async def export_results(
         'Content-Disposition': f'attachment; filename="{filename}"'
     }
     
-    # Return file content
+    # Stream file content
     return StreamingResponse(
-        iter([content]),
+        content,
         media_type=media_type,
         headers=headers
     )
@@ -676,7 +1102,8 @@ async def verify_credentials(auth_request: AuthRequest):
         )
 
         if success:
-            # Create a session
+            # Create a session. Nested groups stay out of it (signed tokens
+            # would grow with every group); clients get them from /api/auth/groups.
             session_id = await create_session(user_info)
             
             return {
@@ -713,13 +1140,27 @@ async def set_ldap_server(config: LdapServerConfig):
         app_config["ldap_server"] = config.server_name
         app_config["ldap_url"] = format_ldap_url(config.server_name)
         
-        # Reconnect to the new LDAP server
-        if hasattr(app.state, 'ldap') and app.state.ldap is not None:
-            app.state.ldap.unbind()
-            
-        server = Server(app_config["ldap_url"], get_info=ALL)
-        conn = Connection(server, user=LDAP_USER, password=LDAP_PASS, auto_bind=True)
-        app.state.ldap = conn
+        # Build a pool against the new LDAP server before retiring the old one
+        new_pool = await LdapPool(app_config["ldap_url"], LDAP_USER, LDAP_PASS).open()
+        old_pool = getattr(app.state, 'ldap_pool', None)
+        app.state.ldap_pool = new_pool
+        app.state.counter = CountEngine(new_pool)
+        app.state.dn_index = DnIndex(new_pool, app.state.redis)
+        old_prefetcher = getattr(app.state, 'prefetcher', None)
+        app.state.prefetcher = Prefetcher(new_pool, prefetch_next_page)
+        if old_prefetcher is not None:
+            await old_prefetcher.close()
+        old_membership = getattr(app.state, 'membership', None)
+        app.state.membership = await MembershipGraph(new_pool).start() if MEMBERSHIP_ENABLED else None
+        if old_membership is not None:
+            await old_membership.close()
+        # The replica's poll runs on the pool, and its data must come from the new server
+        old_replica = getattr(app.state, 'replica', None)
+        app.state.replica = await DirectoryReplica(new_pool).start() if REPLICA_ENABLED else None
+        if old_replica is not None:
+            await old_replica.close()
+        if old_pool is not None:
+            await old_pool.close()
         
         return {
             "success": True,
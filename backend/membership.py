@@ -0,0 +1,354 @@
+"""
+Transitive group membership, answered from an in-memory group graph.
+
+The graph holds every group in the domain with its direct parent groups
+(memberOf). It is loaded with one paged pull, then kept current by
+polling for groups whose uSNChanged moved, the same way ad_replica does.
+Adding or removing a member writes the group's member attribute, so for
+each changed group the member list is re-read. That fixes the graph's
+nesting and shows which cached answers to drop. Deleted groups are found
+as tombstones.
+
+"All groups of Y" reads Y's direct groups once (cached with a TTL). The
+closure is then walked in memory. The primary group is included, since
+memberOf leaves it out. tokenGroups would give the same closure, but it
+only covers security groups and returns SIDs that still need resolving.
+"All members of X" is one LDAP_MATCHING_RULE_IN_CHAIN search, cached
+until X or a group nested under it changes. Changes to users themselves
+(e.g. a new primaryGroupID) are only picked up when the TTL runs out.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from ldap3 import Connection, BASE, NO_ATTRIBUTES
+from ldap3.utils.conv import escape_filter_chars
+
+from ad_replica import root_dse, walk
+from ldap_controls import show_deleted_control
+from ldap_rows import response_rows
+from search_index import fold
+
+# --- Configuration ---
+MEMBERSHIP_ENABLED = os.getenv('AD_MEMBERSHIP_ENABLED', '0') == '1'
+MEMBERSHIP_POLL_INTERVAL = float(os.getenv('AD_MEMBERSHIP_POLL_INTERVAL', '30'))
+# Cached direct groups of a principal, and member lists, expire after this
+MEMBERSHIP_CACHE_TTL = float(os.getenv('AD_MEMBERSHIP_CACHE_TTL', '300'))
+MEMBERSHIP_CACHE_MAX_ENTRIES = int(os.getenv('AD_MEMBERSHIP_CACHE_MAX_ENTRIES', '10000'))
+
+IN_CHAIN_OID = '1.2.840.113556.1.4.1941'
+GROUP_ATTRIBUTES = ['objectGUID', 'objectSid', 'sAMAccountName', 'memberOf', 'uSNChanged']
+PRINCIPAL_ATTRIBUTES = ['memberOf', 'objectSid', 'primaryGroupID']
+
+
+def _first(attributes: dict, name: str):
+    values = attributes.get(name) or []
+    return values[0] if values else None
+
+
+def _primary_group_sid(attributes: dict) -> str | None:
+    """SID of the primary group: the principal's domain SID plus primaryGroupID as the RID"""
+    sid, rid = _first(attributes, 'objectSid'), _first(attributes, 'primaryGroupID')
+    if not isinstance(sid, str) or rid is None:
+        return None
+    return f"{sid.rsplit('-', 1)[0]}-{rid}"
+
+
+def _read_principal(conn: Connection, base: str, principal: str) -> dict | None:
+    """The entry for a DN or sAMAccountName, with the attributes membership needs"""
+    if '=' in principal:
+        conn.search(principal, '(objectClass=*)', BASE, attributes=PRINCIPAL_ATTRIBUTES)
+    else:
+        conn.search(base, f"(sAMAccountName={escape_filter_chars(principal)})", attributes=PRINCIPAL_ATTRIBUTES)
+    rows = response_rows(conn.response)
+    return rows[0] if rows else None
+
+
+def _read_members(conn: Connection, base: str, group_dn: str, recursive: bool) -> list[str]:
+    if not recursive:
+        conn.search(group_dn, '(objectClass=*)', BASE, attributes=['member'])
+        rows = response_rows(conn.response)
+        return list(rows[0]['attributes'].get('member', [])) if rows else []
+    members = []
+    walk(conn, base, f"(memberOf:{IN_CHAIN_OID}:={escape_filter_chars(group_dn)})", NO_ATTRIBUTES, None,
+         lambda rows: members.extend(row['dn'] for row in rows))
+    return members
+
+
+class MembershipGraph:
+    """
+    Group nesting for the default naming context, plus TTL caches of
+    per-principal direct groups and per-group member lists. LDAP runs on
+    pool workers; the graph and caches are only touched on the event loop.
+    """
+
+    def __init__(self, pool, poll_interval: float = MEMBERSHIP_POLL_INTERVAL,
+                 ttl: float = MEMBERSHIP_CACHE_TTL, max_entries: int = MEMBERSHIP_CACHE_MAX_ENTRIES):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.context: str | None = None
+        # Groups by objectGUID, with lookups by DN, sAMAccountName and SID
+        self._dn: dict[str, str] = {}
+        self._keys: dict[str, tuple[str | None, str | None]] = {}
+        self._by_dn: dict[str, str] = {}
+        self._by_sam: dict[str, str] = {}
+        self._by_sid: dict[str, str] = {}
+        self._parents: dict[str, set[str]] = {}
+        self._children: dict[str, set[str]] = {}
+        # principal as asked for -> (expires, principal DN, direct group guids)
+        self._direct: OrderedDict[str, tuple[float, str, frozenset[str]]] = OrderedDict()
+        # (group guid, recursive) -> (expires, member DNs)
+        self._members: OrderedDict[tuple[str, bool], tuple[float, list[str]]] = OrderedDict()
+        self._dsa: str | None = None
+        self._highest_usn = 0
+        self._sync_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._synced_at: float | None = None
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._last_error: str | None = None
+
+    # --- Lifecycle ---
+    async def start(self):
+        self._task = asyncio.create_task(self._poll())
+        return self
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    # --- Sync ---
+    async def sync(self):
+        """A full pull the first time (or after a DC switch), changed and deleted groups otherwise"""
+        async with self._sync_lock:
+            await self._sync()
+
+    async def _sync(self):
+        if self.context is None:
+            self.context = self.pool.default_naming_context
+        since = self._highest_usn + 1 if self._synced_at is not None else None
+        dsa, highest, changed, deleted = await self.pool.run(self._pull, self.context, self._dsa, since)
+        if dsa != self._dsa or since is None:
+            self._load(changed)
+        else:
+            self._apply(changed, deleted)
+        self._dsa, self._highest_usn = dsa, highest
+        self._synced_at = time.time()
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.sync()
+                self._last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"Membership graph sync failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    @staticmethod
+    def _pull(conn: Connection, context: str, dsa: str | None, since: int | None):
+        current, highest = root_dse(conn)
+        changed, deleted = [], []
+        if since is None or current != dsa:
+            walk(conn, context, '(objectClass=group)', GROUP_ATTRIBUTES, None, changed.extend)
+        else:
+            walk(conn, context, f"(&(objectClass=group)(uSNChanged>={since}))", GROUP_ATTRIBUTES + ['member'],
+                 None, changed.extend)
+            walk(conn, context, f"(&(isDeleted=TRUE)(objectClass=group)(uSNChanged>={since}))", ['objectGUID'],
+                 [show_deleted_control()], deleted.extend)
+        return current, highest, changed, deleted
+
+    def _load(self, rows: list[dict]):
+        for index in (self._dn, self._keys, self._by_dn, self._by_sam, self._by_sid, self._parents, self._children):
+            index.clear()
+        self._direct.clear()
+        self._members.clear()
+        for row in rows:
+            self._put(row)
+        for row in rows:
+            self._link_parents(row)
+
+    def _apply(self, changed: list[dict], deleted: list[dict]):
+        gone = {_first(row['attributes'], 'objectGUID') for row in deleted} & self._dn.keys()
+        changed = [row for row in changed if _first(row['attributes'], 'objectGUID') not in gone]
+        touched = gone | {guid for guid in (_first(row['attributes'], 'objectGUID') for row in changed) if guid}
+        affected = self._ancestors(touched)
+        for guid in gone:
+            self._remove(guid)
+        for row in changed:
+            self._put(row)
+        # memberOf first, then the member lists, which are the forward links
+        # the change was actually written to
+        for row in changed:
+            self._link_parents(row)
+        for row in changed:
+            self._link_children(_first(row['attributes'], 'objectGUID'), row['attributes'].get('member', []))
+        self._invalidate(touched, affected | self._ancestors(touched) | touched, changed)
+
+    def _put(self, row: dict):
+        attributes = row['attributes']
+        guid = _first(attributes, 'objectGUID')
+        if guid is None:
+            return
+        if guid in self._dn:
+            self._unindex(guid)
+        sam, sid = _first(attributes, 'sAMAccountName'), _first(attributes, 'objectSid')
+        sam, sid = fold(sam) if sam else None, sid if isinstance(sid, str) else None
+        self._dn[guid] = row['dn']
+        self._keys[guid] = (sam, sid)
+        self._by_dn[fold(row['dn'])] = guid
+        if sam:
+            self._by_sam[sam] = guid
+        if sid:
+            self._by_sid[sid] = guid
+        self._parents.setdefault(guid, set())
+        self._children.setdefault(guid, set())
+
+    def _link_parents(self, row: dict):
+        guid = _first(row['attributes'], 'objectGUID')
+        if guid not in self._dn:
+            return
+        parents = self._resolve(row['attributes'].get('memberOf', []))
+        for parent in self._parents[guid] - parents:
+            self._children[parent].discard(guid)
+        for parent in parents:
+            self._children[parent].add(guid)
+        self._parents[guid] = parents
+
+    def _link_children(self, guid: str, member_dns: list[str]):
+        children = self._resolve(member_dns)
+        for child in self._children[guid] - children:
+            self._parents[child].discard(guid)
+        for child in children:
+            self._parents[child].add(guid)
+        self._children[guid] = children
+
+    def _remove(self, guid: str):
+        for parent in self._parents.pop(guid, set()):
+            self._children[parent].discard(guid)
+        for child in self._children.pop(guid, set()):
+            self._parents[child].discard(guid)
+        self._unindex(guid)
+        del self._dn[guid], self._keys[guid]
+
+    def _unindex(self, guid: str):
+        """Drop the DN, name and SID lookups for a group, which may be about to be re-added"""
+        sam, sid = self._keys[guid]
+        for index, key in ((self._by_dn, fold(self._dn[guid])), (self._by_sam, sam), (self._by_sid, sid)):
+            if index.get(key) == guid:
+                del index[key]
+
+    def _invalidate(self, touched: set[str], groups: set[str], changed: list[dict]):
+        """
+        Drop member lists of the changed groups and every group they are
+        nested in. Drop direct groups of every principal that was in a
+        changed group or is in one now; closures are walked per query.
+        """
+        if not touched:
+            return
+        listed = {fold(dn) for row in changed for dn in row['attributes'].get('member', [])}
+        for key in [key for key in self._members if key[0] in groups]:
+            del self._members[key]
+            self._invalidations += 1
+        for key, (_, dn, direct) in list(self._direct.items()):
+            if direct & touched or fold(dn) in listed:
+                del self._direct[key]
+                self._invalidations += 1
+
+    def _resolve(self, dns: list[str]) -> set[str]:
+        """Group guids for DNs; members that aren't groups (or are outside the context) drop out"""
+        return {guid for guid in (self._by_dn.get(fold(dn)) for dn in dns) if guid is not None}
+
+    def _ancestors(self, guids: set[str]) -> set[str]:
+        seen, stack = set(), list(guids)
+        while stack:
+            for parent in self._parents.get(stack.pop(), ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
+
+    def _group(self, group: str) -> str | None:
+        return self._by_dn.get(fold(group)) if '=' in group else self._by_sam.get(fold(group))
+
+    # --- Queries ---
+    @property
+    def ready(self) -> bool:
+        """True once the initial pull has finished"""
+        return self._synced_at is not None
+
+    def age(self) -> float | None:
+        return time.time() - self._synced_at if self._synced_at is not None else None
+
+    async def groups_of(self, principal: str) -> dict | None:
+        """DN of the principal (DN or sAMAccountName) and the DNs of all its groups; None if it doesn't exist"""
+        await self._ready()
+        key = fold(principal.strip())
+        cached = self._direct.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._direct.move_to_end(key)
+            self._hits += 1
+            dn, direct = cached[1], cached[2]
+        else:
+            self._misses += 1
+            row = await self.pool.run(_read_principal, self.context, principal.strip())
+            if row is None:
+                return None
+            direct = set(self._resolve(row['attributes'].get('memberOf', [])))
+            primary = self._by_sid.get(_primary_group_sid(row['attributes']))
+            if primary:
+                direct.add(primary)
+            dn, direct = row['dn'], frozenset(direct)
+            self._remember(self._direct, key, (time.monotonic() + self.ttl, dn, direct))
+        groups = self._ancestors(set(direct)) | direct
+        return {"dn": dn, "groups": sorted(self._dn[guid] for guid in groups if guid in self._dn)}
+
+    async def members_of(self, group: str, recursive: bool = True) -> dict | None:
+        """DN of the group (DN or sAMAccountName) and its member DNs; None if no such group"""
+        await self._ready()
+        guid = self._group(group.strip())
+        if guid is None:
+            return None
+        key = (guid, recursive)
+        cached = self._members.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._members.move_to_end(key)
+            self._hits += 1
+            members = cached[1]
+        else:
+            self._misses += 1
+            members = await self.pool.run(_read_members, self.context, self._dn[guid], recursive)
+            self._remember(self._members, key, (time.monotonic() + self.ttl, members))
+        return {"dn": self._dn[guid], "members": members}
+
+    def stats(self) -> dict:
+        return {
+            "groups": len(self._dn),
+            "cached_principals": len(self._direct),
+            "cached_member_lists": len(self._members),
+            "hits": self._hits,
+            "misses": self._misses,
+            "invalidations": self._invalidations,
+            "age": self.age(),
+            "last_error": self._last_error
+        }
+
+    async def _ready(self):
+        """The first query waits for the initial pull if the poll hasn't finished it yet"""
+        if self._synced_at is None:
+            async with self._sync_lock:
+                if self._synced_at is None:
+                    await self._sync()
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
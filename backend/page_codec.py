@@ -0,0 +1,199 @@
+"""
+Column-wise encoding for cached result pages.
+
+A page of rows like {"dn": ..., "attributes": {"cn": [...], ...}} is stored
+as the attribute names once plus one value array per column. Columns with
+few distinct values (OperatingSystem, Department, ...) are dictionary coded:
+the distinct cells once, then an integer code per row. The result is packed
+with msgpack when it is installed (JSON otherwise) and compressed with zstd
+or zlib.
+
+Blob layout: MAGIC, serializer byte, compressor byte, body.
+"""
+import json
+import os
+import sys
+import zlib
+from collections.abc import Sequence
+
+try:
+    import msgpack
+except ImportError:  # optional; JSON is used instead
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is used instead
+    zstandard = None
+
+# --- Configuration ---
+# 'auto' (zstd if installed, else zlib), 'zstd', 'zlib' or 'none'
+PAGE_COMPRESSION = os.getenv('PAGE_COMPRESSION', 'auto').lower()
+# Bodies smaller than this aren't worth compressing
+PAGE_COMPRESS_MIN_BYTES = 512
+# A column is dictionary coded when distinct cells / rows is at most this
+DICTIONARY_MAX_RATIO = 0.5
+
+MAGIC = b"\xc7P"
+_MSGPACK, _JSON = b"m", b"j"
+_NONE, _ZLIB, _ZSTD = b"n", b"z", b"s"
+
+
+def _compressor() -> bytes:
+    if PAGE_COMPRESSION == 'none':
+        return _NONE
+    if PAGE_COMPRESSION in ('auto', 'zstd') and zstandard is not None:
+        return _ZSTD
+    return _ZLIB
+
+
+# --- Columnar form ---
+def _cell_key(cell) -> str:
+    return json.dumps(cell, sort_keys=True, separators=(',', ':'))
+
+
+def _encode_column(cells: list) -> dict:
+    keys = [_cell_key(cell) for cell in cells]
+    distinct: dict[str, int] = {}
+    for key in keys:
+        distinct.setdefault(key, len(distinct))
+    if len(cells) > 1 and len(distinct) <= len(cells) * DICTIONARY_MAX_RATIO:
+        values = [None] * len(distinct)
+        for key, cell in zip(keys, cells):
+            values[distinct[key]] = cell
+        return {"dict": values, "codes": [distinct[key] for key in keys]}
+    return {"values": cells}
+
+
+def _decode_column(column: dict) -> list:
+    if "dict" in column:
+        values = column["dict"]
+        return [values[code] for code in column["codes"]]
+    return column["values"]
+
+
+def to_columns(rows: list[dict]) -> dict:
+    """Rows of {"dn", "attributes"} -> {"dn": [...], "names": [...], "columns": [...], "absent": [...]}"""
+    names: dict[str, None] = {}
+    for row in rows:
+        for name in row.get("attributes", {}):
+            names.setdefault(name, None)
+    # Absent attributes are stored as None, and their row numbers listed per
+    # column so they can be told apart from attributes whose value is None
+    columns, absent = [], []
+    for name in names:
+        cells = [row.get("attributes", {}).get(name) for row in rows]
+        columns.append(_encode_column(cells))
+        absent.append([i for i, row in enumerate(rows) if name not in row.get("attributes", {})])
+    return {"dn": [row.get("dn") for row in rows], "names": list(names), "columns": columns, "absent": absent}
+
+
+def from_columns(page: dict) -> list[dict]:
+    names = page["names"]
+    columns = [_decode_column(column) for column in page["columns"]]
+    if "absent" in page:
+        absent = [set(rows) for rows in page["absent"]]
+    else:
+        # Pages encoded before absent rows were listed: None meant absent
+        absent = [{i for i, value in enumerate(column) if value is None} for column in columns]
+    rows = []
+    for i, dn in enumerate(page["dn"]):
+        attributes = {}
+        for name, column, missing in zip(names, columns, absent):
+            if i not in missing:
+                attributes[name] = column[i]
+        rows.append({"dn": dn, "attributes": attributes})
+    return rows
+
+
+# --- Binary encoding ---
+def encode_page(rows: list[dict]) -> bytes:
+    page = to_columns(rows)
+    if msgpack is not None:
+        serializer, body = _MSGPACK, msgpack.packb(page, use_bin_type=True)
+    else:
+        serializer, body = _JSON, json.dumps(page, separators=(',', ':')).encode()
+
+    compressor = _compressor() if len(body) >= PAGE_COMPRESS_MIN_BYTES else _NONE
+    if compressor == _ZSTD:
+        body = zstandard.ZstdCompressor().compress(body)
+    elif compressor == _ZLIB:
+        body = zlib.compress(body, 6)
+    return MAGIC + serializer + compressor + body
+
+
+def decode_page(blob: bytes) -> list[dict]:
+    if not blob.startswith(MAGIC):
+        # Page cached before the columnar format: a JSON list of rows
+        return [json.loads(row) if isinstance(row, str) else row for row in json.loads(blob)]
+
+    serializer, compressor, body = blob[2:3], blob[3:4], blob[4:]
+    if compressor == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Page is zstd-compressed but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compressor == _ZLIB:
+        body = zlib.decompress(body)
+
+    if serializer == _MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("Page is msgpack-encoded but msgpack is not installed")
+        page = msgpack.unpackb(body, raw=False)
+    else:
+        page = json.loads(body)
+    return from_columns(page)
+
+
+# --- In-process rows (main.py) ---
+class ColumnarRows(Sequence):
+    """
+    List-like store of flat row dicts kept column-wise: each key is stored
+    once and string values are interned, so repeated values such as
+    OperatingSystem share one object. Indexing and slicing return dicts.
+    """
+
+    _ABSENT = object()
+
+    def __init__(self, rows=()):
+        self._names: list[str] = []
+        self._index: dict[str, int] = {}
+        self._columns: list[list] = []
+        self._length = 0
+        self.extend(rows)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("row index out of range")
+        return self._row(index)
+
+    def append(self, row: dict):
+        for name in row:
+            if name not in self._index:
+                self._index[name] = len(self._names)
+                self._names.append(name)
+                self._columns.append([self._ABSENT] * self._length)
+        for name, column in zip(self._names, self._columns):
+            value = row.get(name, self._ABSENT)
+            column.append(sys.intern(value) if isinstance(value, str) else value)
+        self._length += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def copy(self) -> list[dict]:
+        return self[:]
+
+    def _row(self, i: int) -> dict:
+        return {
+            name: column[i]
+            for name, column in zip(self._names, self._columns)
+            if column[i] is not self._ABSENT
+        }
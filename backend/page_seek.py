@@ -0,0 +1,209 @@
+import asyncio
+import os
+
+from ldap3 import Connection, SUBTREE, NO_ATTRIBUTES
+from ldap3.utils.conv import escape_filter_chars
+
+from ldap_controls import sort_control, vlv_control, parse_vlv_response
+from ldap_filters import normalize_dn
+from ldap_rows import response_rows
+from query_planner import base_key, contains
+
+# --- Configuration ---
+# Sessions with more pages than this get a DN index built in the background
+SEEK_INDEX_MIN_PAGES = int(os.getenv('AD_SEEK_INDEX_MIN_PAGES', '5'))
+# Index walks running at once; each holds one pooled connection until done
+SEEK_MAX_BUILDS = int(os.getenv('AD_SEEK_MAX_BUILDS', '2'))
+# Longest a page jump waits for the DN index to reach the requested page
+SEEK_WAIT_TIMEOUT = float(os.getenv('AD_SEEK_WAIT_TIMEOUT', '30'))
+# Attribute VLV sessions are sorted on (AD requires a sort control with VLV)
+VLV_SORT_ATTRIBUTE = 'cn'
+DN_INDEX_PAGE_SIZE = 1000
+DN_LOOKUP_BATCH = 200
+PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+
+
+class SeekError(Exception):
+    """A page could not be read by position"""
+
+
+# --- Virtual List View ---
+def _vlv_slice(conn: Connection, ou: str | None, filter_cond: str, attrs: list[str],
+               offset: int, count: int, content_count: int) -> list[dict]:
+    conn.search(
+        search_base=ou or conn.server.info.other['defaultNamingContext'][0],
+        search_filter=filter_cond,
+        search_scope=SUBTREE,
+        attributes=attrs,
+        controls=[
+            sort_control(VLV_SORT_ATTRIBUTE),
+            vlv_control(offset=offset, before_count=0, after_count=count - 1, content_count=content_count)
+        ]
+    )
+    response = parse_vlv_response(conn.result)
+    if response is None or response['result'] != 0:
+        raise SeekError(f"VLV read failed: {conn.result.get('description')}")
+    return response_rows(conn.response)[:count]
+
+
+async def vlv_page(pool, ou_list: list[str | None], ou_counts: list[int], filter_cond: str,
+                   attrs: list[str], page_size: int, page_number: int) -> list[dict]:
+    """
+    Read one page directly by position. The global offset is split into
+    per-OU slices using each OU's count, and the slices are read concurrently.
+    """
+    skip = (page_number - 1) * page_size
+    remaining = page_size
+    slices = []
+    for ou, ou_count in zip(ou_list, ou_counts):
+        if remaining <= 0:
+            break
+        if skip >= ou_count:
+            skip -= ou_count
+            continue
+        take = min(remaining, ou_count - skip)
+        slices.append((ou, skip + 1, take, ou_count))
+        remaining -= take
+        skip = 0
+
+    pages = await asyncio.gather(*[
+        pool.run(_vlv_slice, ou, filter_cond, attrs, offset, take, ou_count)
+        for ou, offset, take, ou_count in slices
+    ])
+    return [entry for page in pages for entry in page]
+
+
+# --- DN index ---
+def _walk_dns(conn: Connection, ou: str | None, filter_cond: str, sink) -> bool:
+    """
+    Attribute-less paged walk of one OU, handing each batch of DNs to sink.
+    Runs as a single pool call so the paging cookie stays on one connection.
+    sink returns False to abandon the walk; the return value says whether it finished.
+    """
+    cookie = None
+    while True:
+        conn.search(
+            search_base=ou or conn.server.info.other['defaultNamingContext'][0],
+            search_filter=filter_cond,
+            search_scope=SUBTREE,
+            attributes=NO_ATTRIBUTES,
+            paged_size=DN_INDEX_PAGE_SIZE,
+            paged_cookie=cookie
+        )
+        dns = [entry['dn'] for entry in conn.response if entry.get('type') == 'searchResEntry']
+        if dns and sink(dns) is False:
+            return False
+        cookie = conn.result.get('controls', {}).get(PAGED_RESULTS_OID, {}).get('value', {}).get('cookie')
+        if not cookie:
+            return True
+
+
+def _lookup_dns(conn: Connection, ou: str | None, dns: list[str], attrs: list[str]) -> list[dict]:
+    dn_filter = ''.join(f"(distinguishedName={escape_filter_chars(dn)})" for dn in dns)
+    conn.search(
+        search_base=ou or conn.server.info.other['defaultNamingContext'][0],
+        search_filter=f"(|{dn_filter})",
+        search_scope=SUBTREE,
+        attributes=attrs
+    )
+    return response_rows(conn.response)
+
+
+async def lookup_dns(pool, dns: list[str], attrs: list[str], ou_list: list[str | None] | None = None) -> list[dict]:
+    """
+    Fetch attrs for a list of DNs in batched OR filters, preserving the given
+    order. Each DN is searched for under the session base that holds it.
+    """
+    ou_list = ou_list or [None]
+    keys = [base_key(ou, pool.default_naming_context) for ou in ou_list]
+    by_base: dict[str | None, list[str]] = {}
+    for dn in dns:
+        dn_key = normalize_dn(dn)
+        owner = next((ou for ou, key in zip(ou_list, keys) if contains(key, dn_key)), None)
+        by_base.setdefault(owner, []).append(dn)
+    batches = [
+        (ou, base_dns[i:i + DN_LOOKUP_BATCH])
+        for ou, base_dns in by_base.items()
+        for i in range(0, len(base_dns), DN_LOOKUP_BATCH)
+    ]
+    pages = await asyncio.gather(*[pool.run(_lookup_dns, ou, batch, attrs) for ou, batch in batches])
+    # The DC returns matches in its own order; restore the index order
+    by_dn = {row['dn'].lower(): row for page in pages for row in page}
+    return [by_dn[dn.lower()] for dn in dns if dn.lower() in by_dn]
+
+
+class DnIndex:
+    """
+    Offset -> DN index for sessions the DC can't position into.
+
+    A background task walks the result set without attributes (1000 DNs per
+    round trip, in the same OU order and DC order that the paged cursors
+    use) and appends the DNs to session:{id}:dn_index. A jump to page N then
+    costs one LRANGE plus one batched lookup of that page's DNs, instead of
+    replaying every page in between.
+    """
+
+    def __init__(self, pool, redis):
+        self.pool = pool
+        self.redis = redis
+        self._builds: dict[str, asyncio.Task] = {}
+        self._build_slots = asyncio.Semaphore(SEEK_MAX_BUILDS)
+
+    async def ensure(self, session_key: str, ou_list: list[str | None], filter_cond: str, ttl: int):
+        """Start building the index for a session unless some worker already is"""
+        if session_key in self._builds:
+            return
+        if not await self.redis.hsetnx(session_key, 'dn_index_started', 1):
+            return
+        task = asyncio.create_task(self._build(session_key, ou_list, filter_cond, ttl))
+        self._builds[session_key] = task
+        task.add_done_callback(lambda _: self._builds.pop(session_key, None))
+
+    async def _build(self, session_key: str, ou_list: list[str | None], filter_cond: str, ttl: int):
+        index_key = session_key + ":dn_index"
+        loop = asyncio.get_running_loop()
+
+        async def append(dns: list[str]) -> bool:
+            if not await self.redis.exists(session_key):
+                return False  # session expired; stop walking
+            await self.redis.rpush(index_key, *dns)
+            await self.redis.expire(index_key, ttl)
+            return True
+
+        def sink(dns: list[str]) -> bool:
+            # Called on the pool's worker thread; blocks it until Redis has the batch
+            return asyncio.run_coroutine_threadsafe(append(dns), loop).result()
+
+        try:
+            async with self._build_slots:
+                await self.redis.delete(index_key)
+                for ou in ou_list:
+                    if not await self.pool.run(_walk_dns, ou, filter_cond, sink):
+                        return
+                await self.redis.hset(session_key, 'dn_index_complete', 1)
+        except Exception as e:
+            print(f"DN index build failed for {session_key}: {str(e)}")
+            # Let the next jump start a fresh build
+            await self.redis.hdel(session_key, 'dn_index_started')
+
+    async def page_dns(self, session_key: str, page_size: int, page_number: int) -> tuple[list[str], bool]:
+        """
+        DNs for a page, waiting (up to SEEK_WAIT_TIMEOUT) for the index to reach it.
+        Returns (dns, whether the index holds anything past this page).
+        """
+        index_key = session_key + ":dn_index"
+        start = (page_number - 1) * page_size
+        end = start + page_size
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SEEK_WAIT_TIMEOUT
+        while True:
+            indexed = await self.redis.llen(index_key)
+            started, complete = await self.redis.hmget(session_key, ['dn_index_started', 'dn_index_complete'])
+            if indexed >= end or complete:
+                break
+            if not started or loop.time() > deadline:
+                raise SeekError("Page index is not available yet")
+            await asyncio.sleep(0.1)
+        dns = await self.redis.lrange(index_key, start, end - 1)
+        return dns, indexed > end or not complete
+
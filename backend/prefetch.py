@@ -0,0 +1,89 @@
+import asyncio
+import os
+import weakref
+from typing import Awaitable, Callable
+
+# --- Configuration ---
+# Pages kept ready ahead of the last page served
+PREFETCH_DEPTH = int(os.getenv('AD_PREFETCH_DEPTH', '2'))
+# Sessions prefetching at once, across the whole worker
+PREFETCH_MAX_CONCURRENT = int(os.getenv('AD_PREFETCH_MAX_CONCURRENT', '2'))
+# Idle LDAP connections left for interactive requests; prefetch backs off below this
+PREFETCH_MIN_IDLE = int(os.getenv('AD_PREFETCH_MIN_IDLE', '2'))
+
+# fetch_next(session_id, target) -> whether there may be more pages to fetch
+PageBuilder = Callable[[str, int], Awaitable[bool]]
+
+
+class Prefetcher:
+    """
+    Fetches the pages after the one just served in the background.
+
+    fetch_next builds the next uncached page of a session from its stored
+    cursors and returns False once the session is gone, exhausted, or already
+    holds `target` pages. Cursor advances for a session are serialized through
+    lock(session_id), which the request path takes too, so a prefetch and a
+    click on "next" never replay the same paging cookie.
+    """
+
+    def __init__(self, pool, fetch_next: PageBuilder, depth: int = PREFETCH_DEPTH,
+                 max_concurrent: int = PREFETCH_MAX_CONCURRENT, min_idle: int = PREFETCH_MIN_IDLE):
+        self.pool = pool
+        self.fetch_next = fetch_next
+        self.depth = depth
+        self.min_idle = min_idle
+        self._slots = asyncio.Semaphore(max(1, max_concurrent))
+        self._targets: dict[str, int] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+
+    def schedule(self, session_id: str, page_number: int):
+        """Make sure pages up to page_number + depth get fetched"""
+        if self.depth <= 0:
+            return
+        target = page_number + self.depth
+        self._targets[session_id] = max(self._targets.get(session_id, 0), target)
+        if session_id not in self._tasks:
+            task = asyncio.create_task(self._run(session_id))
+            self._tasks[session_id] = task
+            task.add_done_callback(lambda _: self._forget(session_id))
+
+    def cancel(self, session_id: str):
+        """Stop prefetching for a session that expired or was deleted"""
+        task = self._tasks.get(session_id)
+        if task:
+            task.cancel()
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, "running": len(self._tasks)}
+
+    def _forget(self, session_id: str):
+        self._tasks.pop(session_id, None)
+        self._targets.pop(session_id, None)
+
+    async def _run(self, session_id: str):
+        try:
+            async with self._slots:
+                while True:
+                    if self.pool.stats()["idle"] < self.min_idle:
+                        return  # The pool is busy serving requests; the next click fetches on demand
+                    async with self.lock(session_id):
+                        if not await self.fetch_next(session_id, self._targets[session_id]):
+                            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Prefetch failed for session {session_id}: {str(e)}")
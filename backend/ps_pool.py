@@ -0,0 +1,278 @@
+"""
+Pool of long-lived PowerShell workers for main.py.
+
+Each worker is one powershell process that imports the ActiveDirectory module
+once and then runs commands sent over stdin, one JSON request per line:
+
+    -> {"id": 7, "command": "Get-ADUser ..."}
+    <- @@frame {"id": 7, "ok": true, "output": "..."}
+
+Responses are prefixed with FRAME_MARKER so stray host output (Write-Host,
+module warnings) can't be mistaken for a reply.
+"""
+import base64
+import itertools
+import json
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+# --- Configuration ---
+PS_POOL_SIZE = int(os.getenv('PS_POOL_SIZE', '4'))
+# Commands a worker runs before it is replaced (bounds leaks in long-lived runspaces)
+PS_WORKER_MAX_COMMANDS = int(os.getenv('PS_WORKER_MAX_COMMANDS', '200'))
+PS_COMMAND_TIMEOUT = float(os.getenv('PS_COMMAND_TIMEOUT', '120'))
+PS_STARTUP_TIMEOUT = float(os.getenv('PS_STARTUP_TIMEOUT', '60'))
+# Idle seconds after which a worker is pinged before being handed out
+PS_HEALTH_INTERVAL = float(os.getenv('PS_HEALTH_INTERVAL', '60'))
+# Overrides the worker process, e.g. "python ps_stub_worker.py" on Linux
+PS_WORKER_COMMAND = os.getenv('PS_WORKER_COMMAND', '')
+
+FRAME_MARKER = "@@frame "
+
+# Commands keep PowerShell's default ErrorActionPreference ('Continue'), as
+# under the old one-shot "powershell -Command": non-terminating errors still
+# return the partial output, and only terminating ones fail the command.
+WORKER_SCRIPT = r"""
+$ProgressPreference = 'SilentlyContinue'
+[Console]::OutputEncoding = [System.Text.Encoding]::UTF8
+function Send-Frame($frame) {
+    [Console]::Out.WriteLine('@@frame ' + ($frame | ConvertTo-Json -Compress -Depth 3))
+    [Console]::Out.Flush()
+}
+try {
+    Import-Module ActiveDirectory -ErrorAction Stop
+    Send-Frame @{ id = 0; ok = $true; output = 'ready' }
+} catch {
+    Send-Frame @{ id = 0; ok = $false; error = $_.Exception.Message }
+    exit 1
+}
+while ($null -ne ($line = [Console]::In.ReadLine())) {
+    $request = $line | ConvertFrom-Json
+    try {
+        # Child scope, so variables from one command don't leak into the next
+        $output = & ([scriptblock]::Create($request.command)) | Out-String
+        Send-Frame @{ id = $request.id; ok = $true; output = $output }
+    } catch {
+        Send-Frame @{ id = $request.id; ok = $false; error = ($_ | Out-String) }
+    }
+}
+"""
+
+
+class PowerShellError(Exception):
+    """A command failed inside the worker, or the worker itself died"""
+
+
+def _default_worker_command() -> list[str]:
+    if PS_WORKER_COMMAND:
+        return shlex.split(PS_WORKER_COMMAND)
+    encoded = base64.b64encode(WORKER_SCRIPT.encode('utf-16-le')).decode()
+    return ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive", "-EncodedCommand", encoded]
+
+
+class PowerShellWorker:
+    """One persistent powershell process; not thread-safe, the pool hands it to one caller at a time"""
+
+    def __init__(self, argv: list[str]):
+        try:
+            self.process = subprocess.Popen(
+                argv,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding='utf-8',
+                bufsize=1
+            )
+        except OSError as e:
+            raise PowerShellError(f"Could not start PowerShell worker: {str(e)}")
+        self.commands_run = 0
+        self.broken = False
+        self.last_used = time.monotonic()
+        self._ids = itertools.count(1)
+        self._frames: queue.Queue = queue.Queue()
+        threading.Thread(target=self._read_frames, daemon=True).start()
+        ready = self._next_frame(0, PS_STARTUP_TIMEOUT)
+        if not ready.get('ok'):
+            self.close()
+            raise PowerShellError(f"PowerShell worker failed to start: {ready.get('error')}")
+
+    @property
+    def alive(self) -> bool:
+        return not self.broken and self.process.poll() is None
+
+    def run(self, command: str, timeout: float = PS_COMMAND_TIMEOUT) -> str:
+        request_id = next(self._ids)
+        try:
+            self.process.stdin.write(json.dumps({"id": request_id, "command": command}) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.broken = True
+            raise PowerShellError(f"PowerShell worker is gone: {str(e)}")
+        frame = self._next_frame(request_id, timeout)
+        self.commands_run += 1
+        self.last_used = time.monotonic()
+        if not frame.get('ok'):
+            raise PowerShellError(frame.get('error') or "PowerShell command failed")
+        return frame.get('output') or ""
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+    def _next_frame(self, request_id: int, timeout: float) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                frame = self._frames.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                self.broken = True
+                self.process.kill()
+                raise PowerShellError(f"PowerShell command timed out after {timeout}s")
+            if frame is None:
+                self.broken = True
+                raise PowerShellError("PowerShell worker exited")
+            if frame.get('id') == request_id:
+                return frame
+            # Reply to a command that timed out earlier; drop it
+
+    def _read_frames(self):
+        for line in self.process.stdout:
+            if not line.startswith(FRAME_MARKER):
+                continue
+            try:
+                self._frames.put(json.loads(line[len(FRAME_MARKER):]))
+            except ValueError:
+                continue
+        self._frames.put(None)
+
+
+class PowerShellPool:
+    """
+    Up to `size` workers, started lazily and shared by the request threads.
+    Workers are health-checked before reuse and replaced after
+    max_commands commands or any worker-level failure.
+    """
+
+    def __init__(self, size: int = PS_POOL_SIZE, max_commands: int = PS_WORKER_MAX_COMMANDS,
+                 argv: list[str] | None = None):
+        self.size = max(1, size)
+        self.max_commands = max_commands
+        self.argv = argv or _default_worker_command()
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="ps-pool")
+        self._lock = threading.Lock()
+        self._started = 0
+        self._recycled = 0
+        self._closed = False
+
+    def warm(self, count: int | None = None):
+        """
+        Start workers ahead of the first request (pays the module import up
+        front). They start in parallel and each goes into the pool as soon as
+        it is ready, so an early request waits for one import, not all of them.
+        Raises the first start failure once every start has finished.
+        """
+        missing = min(count or self.size, self.size) - self._idle.qsize()
+        futures = [self._executor.submit(self._warm_one) for _ in range(max(0, missing))]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def run(self, command: str, timeout: float = PS_COMMAND_TIMEOUT) -> str:
+        worker = self._acquire()
+        try:
+            return worker.run(command, timeout)
+        finally:
+            # Dead or timed-out workers are replaced on release
+            self._release(worker)
+
+    def submit(self, command: str, timeout: float = PS_COMMAND_TIMEOUT) -> Future:
+        """Run a command in the background; the future raises PowerShellError on failure"""
+        return self._executor.submit(self.run, command, timeout)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "started": self._started,
+            "recycled": self._recycled
+        }
+
+    def _warm_one(self):
+        """Start one more worker and put it in the pool; it takes a slot only while starting"""
+        if self._closed:
+            raise PowerShellError("PowerShell pool is closed")
+        self._slots.acquire()
+        try:
+            worker = self._spawn()
+        except Exception:
+            self._slots.release()
+            raise
+        self._release(worker)
+
+    def _acquire(self) -> PowerShellWorker:
+        if self._closed:
+            raise PowerShellError("PowerShell pool is closed")
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._spawn()
+                if self._healthy(worker):
+                    return worker
+                self._discard(worker, release=False)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, worker: PowerShellWorker):
+        if self._closed or not worker.alive or worker.commands_run >= self.max_commands:
+            self._discard(worker)
+            return
+        self._idle.put(worker)
+        self._slots.release()
+
+    def _discard(self, worker: PowerShellWorker, release: bool = True):
+        with self._lock:
+            self._recycled += 1
+        worker.close()
+        if release:
+            self._slots.release()
+
+    def _spawn(self) -> PowerShellWorker:
+        worker = PowerShellWorker(self.argv)
+        with self._lock:
+            self._started += 1
+        return worker
+
+    def _healthy(self, worker: PowerShellWorker) -> bool:
+        if not worker.alive:
+            return False
+        if time.monotonic() - worker.last_used < PS_HEALTH_INTERVAL:
+            return True
+        try:
+            return worker.run("'pong'", timeout=10).strip() == 'pong'
+        except PowerShellError:
+            return False
@@ -0,0 +1,35 @@
+"""
+Stand-in for the PowerShell worker on machines without PowerShell / RSAT.
+
+Speaks the ps_pool frame protocol and answers with canned output: 0 for each
+Measure-Object count, an empty page for searches. Run main.py with
+PS_WORKER_COMMAND="python ps_stub_worker.py" to use it.
+"""
+import json
+import sys
+
+FRAME_MARKER = "@@frame "
+
+
+def send(frame: dict):
+    sys.stdout.write(FRAME_MARKER + json.dumps(frame) + "\n")
+    sys.stdout.flush()
+
+
+def answer(command: str) -> str:
+    if command.strip() == "'pong'":
+        return "pong\n"
+    if "Measure-Object" in command:
+        return "0\n" * command.count("Measure-Object")
+    return json.dumps({"Items": [], "Cookie": "", "HasMoreResults": False}) + "\n"
+
+
+def main():
+    send({"id": 0, "ok": True, "output": "ready"})
+    for line in sys.stdin:
+        request = json.loads(line)
+        send({"id": request["id"], "ok": True, "output": answer(request["command"])})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import time
+
+from redis.asyncio import Redis
+
+# --- Configuration ---
+QUERY_CACHE_TTL = int(os.getenv('AD_QUERY_CACHE_TTL', '300'))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv('AD_QUERY_CACHE_MAX_ENTRIES', '500'))
+
+_PREFIX = "query_cache"
+
+# Look up an entry and check its session in one round trip. A hit refreshes
+# the entry's TTL along with its LRU score, so a recently used entry is never
+# dead while the LRU index still ranks it as hot; a miss drops the entry.
+# KEYS: entry, lru, stats  ARGV: entry hash, now, ttl, session key prefix
+_GET = """
+local session_id = redis.call('GET', KEYS[1])
+if session_id and redis.call('EXISTS', ARGV[4] .. session_id) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+    redis.call('HINCRBY', KEYS[3], 'hits', 1)
+    return session_id
+end
+if session_id then
+    redis.call('DEL', KEYS[1])
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HINCRBY', KEYS[3], 'misses', 1)
+return false
+"""
+
+
+class QueryCache:
+    """
+    Cross-user cache from a canonical query to the session holding its results.
+
+    Keys:
+      query_cache:{sha256}  string  session id, expires the cache TTL after its last use
+      query_cache:lru       zset    entry hash -> last use, for size-bounded eviction
+      query_cache:stats     hash    hits / misses / evictions
+
+    Entries point at regular query sessions, so a hit serves pages that are
+    already in Redis (and keeps paging from that session's cursors).
+    """
+
+    def __init__(self, redis: Redis, ttl: int = QUERY_CACHE_TTL, max_entries: int = QUERY_CACHE_MAX_ENTRIES):
+        self.redis = redis
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lru_key = f"{_PREFIX}:lru"
+        self._stats_key = f"{_PREFIX}:stats"
+        self._get = redis.register_script(_GET)
+
+    @staticmethod
+    def entry_hash(canonical: str) -> str:
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _entry_key(self, entry_hash: str) -> str:
+        return f"{_PREFIX}:{entry_hash}"
+
+    async def get(self, canonical: str, session_prefix: str) -> str | None:
+        """
+        Session id cached for this query, or None. session_prefix + id is the
+        session's Redis key, so entries whose session has expired count as misses.
+        """
+        entry_hash = self.entry_hash(canonical)
+        session_id = await self._get(
+            keys=[self._entry_key(entry_hash), self._lru_key, self._stats_key],
+            args=[entry_hash, time.time(), self.ttl, session_prefix]
+        )
+        return session_id.decode() if isinstance(session_id, bytes) else session_id
+
+    async def put(self, canonical: str, session_id: str):
+        entry_hash = self.entry_hash(canonical)
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._entry_key(entry_hash), session_id, ex=self.ttl)
+            pipe.zadd(self._lru_key, {entry_hash: now})
+            # Entries past their TTL are gone already; drop them from the LRU index
+            pipe.zremrangebyscore(self._lru_key, '-inf', now - self.ttl)
+            pipe.zcard(self._lru_key)
+            size = (await pipe.execute())[-1]
+
+        if size > self.max_entries:
+            await self._evict(size - self.max_entries)
+
+    async def invalidate(self, canonical: str):
+        await self._drop(self.entry_hash(canonical))
+
+    async def stats(self) -> dict:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._stats_key)
+            pipe.zcard(self._lru_key)
+            counters, entries = await pipe.execute()
+        hits = int(counters.get('hits', 0))
+        misses = int(counters.get('misses', 0))
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "evictions": int(counters.get('evictions', 0)),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0
+        }
+
+    async def _drop(self, entry_hash: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._entry_key(entry_hash))
+            pipe.zrem(self._lru_key, entry_hash)
+            await pipe.execute()
+
+    async def _evict(self, count: int):
+        """Drop the least recently used entries"""
+        evicted = await self.redis.zpopmin(self._lru_key, count)
+        if not evicted:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(*[self._entry_key(entry_hash) for entry_hash, _ in evicted])
+            pipe.hincrby(self._stats_key, 'evictions', len(evicted))
+            await pipe.execute()
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from query_planner import BaseOwners
+
+# Hash field used for searches without an OU (default naming context)
+ROOT_OU_KEY = "_ROOT_"
+
+# fetch(ou, cookie, pin, offset) -> (entries, cookie_out, has_more, pin)
+PageFetcher = Callable[[str | None, bytes | None, str | None, int],
+                       Awaitable[tuple[list, bytes | None, bool, str | None]]]
+
+
+def ou_key(ou: str | None) -> str:
+    return ou or ROOT_OU_KEY
+
+
+def new_cursors(ou_list: list[str | None]) -> dict[str, dict]:
+    """
+    Fresh per-OU cursor state: paging cookie, fetched-but-unserved entries,
+    exhausted flag, the pooled connection the cookie belongs to and how many
+    entries the search has returned so far (to resume if that connection is gone).
+    """
+    return {
+        ou_key(ou): {"cookie": None, "buffer": [], "done": False, "pin": None, "offset": 0}
+        for ou in ou_list
+    }
+
+
+def has_more(cursors: dict[str, dict]) -> bool:
+    return any(state["buffer"] or not state["done"] for state in cursors.values())
+
+
+async def fetch_merged_page(cursors: dict[str, dict], ou_list: list[str | None],
+                            fetch: PageFetcher, page_size: int,
+                            owners: BaseOwners | None = None) -> tuple[list, bool]:
+    """
+    Build the next page across all OUs.
+
+    Every OU that has run dry is refilled concurrently (one LDAP page each,
+    bounded by the connection pool), then entries are taken in ou_list order
+    so pages are identical no matter which OU answered first. Entries an OU
+    returned beyond the current page stay in its buffer for the next one.
+    With owners, an entry that an earlier, overlapping OU also returns is
+    dropped. Mutates cursors in place; returns (page, has_more).
+    """
+    page = []
+    while len(page) < page_size:
+        dry = [(index, ou) for index, ou in enumerate(ou_list)
+               if not cursors[ou_key(ou)]["buffer"] and not cursors[ou_key(ou)]["done"]]
+        if dry:
+            pages = await asyncio.gather(*[
+                fetch(ou, cursors[ou_key(ou)]["cookie"], cursors[ou_key(ou)]["pin"], cursors[ou_key(ou)]["offset"])
+                for _, ou in dry
+            ])
+            for (index, ou), (entries, cookie_out, more, pin) in zip(dry, pages):
+                state = cursors[ou_key(ou)]
+                # offset counts what the DC returned, so a resumed search skips the same entries
+                state["buffer"].extend(owners.keep(index, entries) if owners else entries)
+                state["cookie"] = cookie_out or None
+                state["done"] = not more
+                state["pin"] = pin
+                state["offset"] += len(entries)
+
+        for ou in ou_list:
+            state = cursors[ou_key(ou)]
+            take = page_size - len(page)
+            page.extend(state["buffer"][:take])
+            del state["buffer"][:take]
+            if len(page) >= page_size:
+                break
+            if not state["done"]:
+                # Later OUs must wait until this one is drained to keep the order stable
+                break
+
+        if not has_more(cursors):
+            break
+
+    return page, has_more(cursors)
@@ -0,0 +1,65 @@
+"""
+Search-base planning for queries over several OUs.
+
+Every base in ou_paths costs a SUBTREE search per page, plus a count. If one
+base lies inside another (OU=IT,OU=Staff under OU=Staff), the inner search
+only repeats work and returns every entry twice. plan_bases compares
+normalized DNs and keeps the outermost bases only. A missing base stands for
+the default naming context. The remaining bases are disjoint subtrees, and an
+LDAP search takes a single base, so each still gets its own search with the
+same filter.
+
+BaseOwners is the merge-time guard for base lists that were never planned,
+such as sessions stored before planning. Each DN belongs to the first base
+whose subtree holds it, and rows any other base returns for it are dropped.
+"""
+from ldap_filters import normalize_dn
+
+
+def contains(base_key: str, dn_key: str) -> bool:
+    return bool(base_key) and (dn_key == base_key or dn_key.endswith(',' + base_key))
+
+
+def base_key(ou: str | None, default_context: str | None) -> str:
+    return normalize_dn(ou) or normalize_dn(default_context)
+
+
+def plan_bases(ou_list: list[str | None], default_context: str | None) -> list[str | None]:
+    """
+    ou_list without duplicates and without bases nested in another one, in
+    the order given. The default naming context, by name or omitted, comes
+    back as None.
+    """
+    default_key = normalize_dn(default_context)
+    planned: dict[str, str | None] = {}
+    for ou in ou_list:
+        key = base_key(ou, default_context)
+        if key not in planned:
+            planned[key] = None if not key or key == default_key else ou
+    return [
+        ou for key, ou in planned.items()
+        if not any(other != key and contains(other, key) for other in planned)
+    ]
+
+
+class BaseOwners:
+    """Which of several possibly overlapping bases each returned DN is served from"""
+
+    def __init__(self, ou_list: list[str | None], default_context: str | None):
+        self.keys = [base_key(ou, default_context) for ou in ou_list]
+        self.overlapping = any(
+            i != j and (a == b or contains(a, b))
+            for i, a in enumerate(self.keys) for j, b in enumerate(self.keys)
+        )
+
+    def keep(self, index: int, entries: list[dict]) -> list[dict]:
+        """entries the base at index returned, minus those an earlier base owns"""
+        if not self.overlapping:
+            return entries
+        return [entry for entry in entries if self._owner(normalize_dn(entry['dn']), index) == index]
+
+    def _owner(self, dn_key: str, fallback: int) -> int:
+        for index, key in enumerate(self.keys):
+            if contains(key, dn_key):
+                return index
+        return fallback
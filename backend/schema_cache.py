@@ -0,0 +1,116 @@
+"""
+On-disk cache of the DC's root DSE and schema.
+
+Server(get_info=ALL) reads the root DSE and the whole subschema on the first
+bind. On AD the subschema runs to megabytes, and reading it added seconds to
+every startup and every server switch. The pool now binds with get_info=NONE
+and calls attach_server_info. That reads the schema version, which is three
+BASE reads: the root DSE, modifyTimeStamp on the subschema entry, and
+schemaInfo on the schema naming context. If a cache file for that server has
+the same version, the root DSE and schema come from the file. Otherwise they
+are read from the DC and written back. Files are replaced atomically, so
+several workers can share one directory.
+"""
+import hashlib
+import json
+import os
+
+from ldap3 import Connection, Server, ALL, BASE
+from ldap3.core.exceptions import LDAPException
+from ldap3.protocol.rfc4512 import DsaInfo, SchemaInfo
+
+# --- Configuration ---
+SCHEMA_CACHE_DIR = os.getenv('AD_SCHEMA_CACHE_DIR', 'schema_cache')
+SCHEMA_CACHE_ENABLED = os.getenv('AD_SCHEMA_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+def _read_base(conn: Connection, dn: str, attributes: list[str]) -> dict:
+    if not conn.search(dn, '(objectClass=*)', search_scope=BASE, attributes=attributes) or not conn.response:
+        return {}
+    return conn.response[0].get('raw_attributes') or {}
+
+
+def schema_version(conn: Connection) -> str:
+    """
+    The DC's schema version, or '' if it can't be read. Any schema update
+    moves modifyTimeStamp on the subschema entry and rewrites schemaInfo.
+    """
+    try:
+        root = _read_base(conn, '', ['subschemaSubentry', 'schemaNamingContext'])
+        subschema = (root.get('subschemaSubentry') or [b''])[0]
+        schema_nc = (root.get('schemaNamingContext') or [b''])[0]
+        if not subschema:
+            return ''
+        modified = _read_base(conn, subschema.decode(), ['modifyTimeStamp']).get('modifyTimeStamp') or [b'']
+        schema_info = [b'']
+        if schema_nc:
+            schema_info = _read_base(conn, schema_nc.decode(), ['schemaInfo']).get('schemaInfo') or [b'']
+    except (LDAPException, UnicodeDecodeError) as e:
+        print(f"Schema version read failed: {str(e)}")
+        return ''
+    return f"{modified[0].decode(errors='replace')}:{schema_info[0].hex()}"
+
+
+def _path(ldap_url: str) -> str:
+    return os.path.join(SCHEMA_CACHE_DIR, hashlib.sha256(ldap_url.lower().encode()).hexdigest()[:16] + '.json')
+
+
+def _load(ldap_url: str, version: str) -> tuple[DsaInfo, SchemaInfo] | None:
+    try:
+        with open(_path(ldap_url), encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('server') != ldap_url or cached.get('version') != version:
+            return None
+        schema = SchemaInfo.from_json(cached['schema'])
+        # Formatted with the schema, as a bind would have done
+        return DsaInfo.from_json(cached['dsa_info'], schema=schema), schema
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable schema cache for {ldap_url}: {str(e)}")
+        return None
+
+
+def _save(ldap_url: str, version: str, info: DsaInfo, schema: SchemaInfo):
+    path = _path(ldap_url)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SCHEMA_CACHE_DIR, exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'server': ldap_url,
+                'version': version,
+                'dsa_info': info.to_json(indent=None),
+                'schema': schema.to_json(indent=None),
+            }, f)
+        # Other workers see the old file or the new one, never half of it
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Schema cache write failed for {ldap_url}: {str(e)}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def attach_server_info(server: Server, conn: Connection, ldap_url: str) -> str:
+    """
+    Give server its root DSE and schema, from the cache when the version
+    matches and from the DC through conn otherwise. Returns 'cache' or 'server'.
+    """
+    version = schema_version(conn) if SCHEMA_CACHE_ENABLED else ''
+    cached = _load(ldap_url, version) if version else None
+    if cached:
+        info, schema = cached
+        server.attach_schema_info(schema)
+        server.attach_dsa_info(info)
+        return 'cache'
+
+    # A throwaway Server collects the full read; conn only carries the searches
+    full = Server(ldap_url, get_info=ALL)
+    full.get_info_from_server(conn)
+    server.attach_schema_info(full.schema)
+    server.attach_dsa_info(full.info)
+    if version and full.info and full.schema:
+        _save(ldap_url, version, full.info, full.schema)
+    return 'server'
@@ -0,0 +1,154 @@
+"""
+Trigram and prefix index over the naming attributes of replicated objects.
+
+AD can't serve leading-wildcard filters like (cn=*smi*) from its indexes.
+Here each value of cn, sAMAccountName, mail and displayName is stored
+twice. It is stored once as a casefolded term: the (field, term) B-tree is
+the prefix trie. It is also stored once per trigram. A substring query
+intersects the posting lists of its trigrams into a small candidate set,
+and only those candidates are checked against the full pattern.
+"""
+import sqlite3
+
+INDEXED_ATTRIBUTES = ('cn', 'sAMAccountName', 'mail', 'displayName')
+GRAM = 3
+# Upper bound for a prefix range scan: sorts after every other character
+PREFIX_END = '\U0010ffff'
+# Posting lists intersected per query; the exact check handles the rest
+MAX_PROBES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    field TEXT NOT NULL,
+    term TEXT NOT NULL,
+    guid TEXT NOT NULL,
+    PRIMARY KEY (field, term, guid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS terms_guid ON terms (guid);
+CREATE TABLE IF NOT EXISTS grams (
+    gram TEXT NOT NULL,
+    field TEXT NOT NULL,
+    guid TEXT NOT NULL,
+    PRIMARY KEY (gram, field, guid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS grams_guid ON grams (guid);
+"""
+
+
+def fold(value: str) -> str:
+    return value.casefold()
+
+
+def trigrams(term: str) -> set[str]:
+    return {term[i:i + GRAM] for i in range(len(term) - GRAM + 1)}
+
+
+def like_escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SearchIndex:
+    """
+    Lives in the replica's SQLite database; the caller holds its lock and
+    transaction. match() returns SQL for a WHERE clause over the table
+    whose object ids are in guid_column.
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        db.executescript(SCHEMA)
+
+    def is_empty(self) -> bool:
+        return self.db.execute("SELECT 1 FROM terms LIMIT 1").fetchone() is None
+
+    def add(self, objects: list[tuple[str, dict]]):
+        """(guid, attributes) pairs; replaces whatever was indexed for those guids"""
+        self.remove([guid for guid, _ in objects])
+        terms, grams = [], set()
+        for guid, attributes in objects:
+            by_name = {name.lower(): values for name, values in attributes.items()}
+            for field in INDEXED_ATTRIBUTES:
+                for value in by_name.get(field.lower()) or []:
+                    if not isinstance(value, str):
+                        continue
+                    term = fold(value)
+                    terms.append((field, term, guid))
+                    grams.update((gram, field, guid) for gram in trigrams(term))
+        self.db.executemany("INSERT OR IGNORE INTO terms VALUES (?, ?, ?)", terms)
+        self.db.executemany("INSERT OR IGNORE INTO grams VALUES (?, ?, ?)", grams)
+
+    def remove(self, guids: list[str]):
+        rows = [(guid,) for guid in guids]
+        self.db.executemany("DELETE FROM terms WHERE guid = ?", rows)
+        self.db.executemany("DELETE FROM grams WHERE guid = ?", rows)
+
+    def match(self, fields: tuple[str, ...], text: str, mode: str = 'contains',
+              guid_column: str = 'objects.guid') -> tuple[str, list]:
+        """
+        SQL condition and params for objects where one of fields matches text
+        the way the LDAP filters from ldap_filters.query_filter do: *text* for
+        'contains', text* for 'prefix' (any '*' in text is a wildcard) or the
+        whole value for 'exact'. Reads gram frequencies, so it runs under the
+        caller's lock like any other query.
+        """
+        in_fields = ', '.join('?' * len(fields))
+        if mode == 'exact':
+            return (
+                f"{guid_column} IN (SELECT guid FROM terms WHERE field IN ({in_fields}) AND term = ?)",
+                [*fields, fold(text)]
+            )
+
+        pieces = fold(text).split('*')
+        if not any(pieces):
+            # Only wildcards: every object with a value in one of fields
+            return f"EXISTS (SELECT 1 FROM terms t WHERE t.guid = {guid_column} AND t.field IN ({in_fields}))", [*fields]
+        anchored = mode == 'prefix'
+        pattern = '%'.join(like_escape(piece) for piece in pieces) + '%'
+        if not anchored:
+            pattern = '%' + pattern
+        verify = (
+            f"EXISTS (SELECT 1 FROM terms t WHERE t.guid = {guid_column} AND t.field IN ({in_fields}) "
+            f"AND t.term LIKE ? ESCAPE '\\')"
+        )
+
+        if anchored and pieces[0]:
+            # Prefix range scan on the term B-tree
+            return (
+                f"{guid_column} IN (SELECT guid FROM terms WHERE field IN ({in_fields}) "
+                f"AND term >= ? AND term < ?) AND {verify}",
+                [*fields, pieces[0], pieces[0] + PREFIX_END, *fields, pattern]
+            )
+
+        grams = self._rarest(fields, set().union(*(trigrams(piece) for piece in pieces)))
+        if grams is None:
+            return "0", []
+        if not grams:
+            # Too short for trigrams: one pass over the terms instead of the objects
+            return (
+                f"{guid_column} IN (SELECT guid FROM terms WHERE field IN ({in_fields}) AND term LIKE ? ESCAPE '\\')",
+                [*fields, pattern]
+            )
+        # Walk the rarest posting list and probe the others by primary key
+        # (CROSS JOIN keeps that order); candidates are then checked exactly
+        probes = ''.join(
+            f" CROSS JOIN grams g{i} ON g{i}.gram = ? AND g{i}.field = g0.field AND g{i}.guid = g0.guid"
+            for i in range(1, len(grams))
+        )
+        return (
+            f"{guid_column} IN (SELECT g0.guid FROM grams g0{probes} "
+            f"WHERE g0.gram = ? AND g0.field IN ({in_fields})) AND {verify}",
+            [*grams[1:], grams[0], *fields, *fields, pattern]
+        )
+
+    def _rarest(self, fields: tuple[str, ...], grams: set[str]) -> list[str] | None:
+        """Up to MAX_PROBES of grams, rarest first; None if one never occurs (nothing can match)"""
+        if not grams:
+            return []
+        counts = dict(self.db.execute(
+            f"SELECT gram, COUNT(*) FROM grams WHERE gram IN ({', '.join('?' * len(grams))}) "
+            f"AND field IN ({', '.join('?' * len(fields))}) GROUP BY gram",
+            [*grams, *fields]
+        ).fetchall())
+        if len(counts) < len(grams):
+            return None
+        return sorted(grams, key=counts.get)[:MAX_PROBES]
@@ -0,0 +1,280 @@
+import json
+
+from redis.asyncio import Redis
+
+from page_codec import encode_page, decode_page
+
+# --- Configuration ---
+SESSION_TTL = 1800  # 30 minutes
+
+# Meta fields stored as JSON / integers in the session:{id} hash
+_JSON_FIELDS = {'attributes', 'ous', 'is_count_exact', 'ou_counts', 'replica_match'}
+_INT_FIELDS = {'page_size', 'total_count', 'current_index'}
+
+# Meta, page count and the requested page in one round trip. Cursors are
+# only returned (and only worth their payload) when the page is next in line
+# for the sequential list.
+_READ_PAGE = """
+local meta = redis.call('HGETALL', KEYS[1])
+if #meta == 0 then
+    return false
+end
+local page_count = redis.call('LLEN', KEYS[2])
+local page_number = tonumber(ARGV[1])
+local page, seek_page = false, false
+local cookies, cursors = {}, {}
+if page_number <= page_count then
+    page = redis.call('LINDEX', KEYS[2], page_number - 1)
+else
+    seek_page = redis.call('HGET', KEYS[3], ARGV[1])
+    if page_number == page_count + 1 then
+        cookies = redis.call('HGETALL', KEYS[4])
+        cursors = redis.call('HGETALL', KEYS[5])
+    end
+end
+return {meta, page_count, page, seek_page, cookies, cursors}
+"""
+
+# Append the next page and the cursors that produced it, refreshing the TTL
+# of every key of the session, but only if nobody else appended that page first.
+# KEYS: meta, pages, cookies, cursors, then the other per-session keys
+# ARGV: expected page count, ttl, page, then (ou, cookie, cursor) triples
+_APPEND_PAGE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -2
+end
+if redis.call('LLEN', KEYS[2]) ~= tonumber(ARGV[1]) then
+    return -1
+end
+redis.call('RPUSH', KEYS[2], ARGV[3])
+for i = 4, #ARGV, 3 do
+    redis.call('HSET', KEYS[3], ARGV[i], ARGV[i + 1])
+    redis.call('HSET', KEYS[4], ARGV[i], ARGV[i + 2])
+end
+for i = 1, #KEYS do
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+end
+return redis.call('LLEN', KEYS[2])
+"""
+
+
+class PageConflict(Exception):
+    """Another request appended the page first"""
+
+
+def _text(value: bytes | str | None) -> str | None:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _pairs(flat: list) -> dict:
+    return {_text(flat[i]): flat[i + 1] for i in range(0, len(flat), 2)}
+
+
+def _decode_meta(raw: dict) -> dict:
+    meta = {}
+    for field, value in raw.items():
+        field = _text(field)
+        value = _text(value)
+        if field in _JSON_FIELDS:
+            value = json.loads(value)
+        elif field in _INT_FIELDS:
+            value = int(value)
+        meta[field] = value
+    return meta
+
+
+def _decode_page(blob: bytes | None) -> list | None:
+    return decode_page(blob) if blob is not None else None
+
+
+class SessionRepository:
+    """
+    Redis storage for query sessions.
+
+    Keys per session:
+      session:{id}            hash  query metadata
+      session:{id}:pages      list  pages served in order (page_codec blobs)
+      session:{id}:seek_pages hash  pages read out of order, by page number
+      session:{id}:cookies    hash  raw paged-results cookie per OU
+      session:{id}:cursors    hash  per-OU {buffer, done, pin, offset} JSON
+      session:{id}:dn_index   list  DNs in result order (page_seek.DnIndex)
+
+    Every write refreshes the TTL of all of them together, so no key (the DN
+    index in particular) expires while the session's meta still points at it.
+
+    The client must be created with decode_responses=False so paging cookies
+    round-trip as raw bytes.
+    """
+
+    PREFIX = "session:"
+
+    def __init__(self, redis: Redis, ttl: int = SESSION_TTL):
+        self.redis = redis
+        self.ttl = ttl
+        self._read_page = redis.register_script(_READ_PAGE)
+        self._append_page = redis.register_script(_APPEND_PAGE)
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        return f"{SessionRepository.PREFIX}{session_id}"
+
+    def _keys(self, session_id: str) -> dict[str, str]:
+        key = self.key(session_id)
+        return {
+            'meta': key,
+            'pages': key + ":pages",
+            'seek_pages': key + ":seek_pages",
+            'cookies': key + ":cookies",
+            'cursors': key + ":cursors",
+            'dn_index': key + ":dn_index",
+        }
+
+    async def exists(self, session_id: str) -> bool:
+        return bool(await self.redis.exists(self.key(session_id)))
+
+    async def create(self, session_id: str, meta: dict, cursors: dict[str, dict], first_page: list):
+        """Write metadata, cursors and the first page in a single MULTI"""
+        keys = self._keys(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(keys['meta'], mapping=self._encode_meta(meta))
+            pipe.rpush(keys['pages'], encode_page(first_page))
+            if cursors:
+                cookies, states = self._encode_cursors(cursors)
+                pipe.hset(keys['cookies'], mapping=cookies)
+                pipe.hset(keys['cursors'], mapping=states)
+            for name in ('meta', 'pages', 'cookies', 'cursors'):
+                pipe.expire(keys[name], self.ttl)
+            await pipe.execute()
+
+    async def get_meta(self, session_id: str) -> dict | None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.key(session_id))
+            pipe.llen(self._keys(session_id)['pages'])
+            raw, page_count = await pipe.execute()
+        if not raw:
+            return None
+        meta = _decode_meta(raw)
+        meta['page_count'] = page_count
+        return meta
+
+    async def update_meta(self, session_id: str, mapping: dict):
+        await self.redis.hset(self.key(session_id), mapping=self._encode_meta(mapping))
+
+    async def read_page(self, session_id: str, page_number: int) -> dict | None:
+        """
+        One round trip: {'meta', 'page_count', 'page', 'seek_page', 'cursors'}.
+        page is set when the page is on the sequential list, seek_page when it
+        was read out of order; cursors only when the page is next in line.
+        Returns None if the session doesn't exist.
+        """
+        keys = self._keys(session_id)
+        reply = await self._read_page(
+            keys=[keys['meta'], keys['pages'], keys['seek_pages'], keys['cookies'], keys['cursors']],
+            args=[page_number]
+        )
+        if not reply:
+            return None
+        raw_meta, page_count, page, seek_page, cookies, cursors = reply
+        return {
+            'meta': _decode_meta(_pairs(raw_meta)),
+            'page_count': page_count,
+            'page': _decode_page(page),
+            'seek_page': _decode_page(seek_page),
+            'cursors': self._decode_cursors(_pairs(cookies), _pairs(cursors)) if page_number == page_count + 1 else None
+        }
+
+    async def get_pages(self, session_id: str, start: int, stop: int) -> list[list]:
+        """Pages start..stop (0-based, inclusive, like LRANGE) from the sequential list"""
+        blobs = await self.redis.lrange(self._keys(session_id)['pages'], start, stop)
+        return [_decode_page(blob) for blob in blobs]
+
+    async def iter_pages(self, session_id: str, batch: int = 20):
+        """Yield cached pages in order, batch pages per round trip"""
+        start = 0
+        while True:
+            pages = await self.get_pages(session_id, start, start + batch - 1)
+            for page in pages:
+                yield page
+            if len(pages) < batch:
+                return
+            start += batch
+
+    async def append_page(self, session_id: str, page_index: int, page: list,
+                          cursors: dict[str, dict] | None = None) -> int:
+        """
+        Atomically store page number page_index + 1 with the cursors that
+        produced it. Raises PageConflict if that page was stored meanwhile,
+        KeyError if the session expired.
+        """
+        keys = self._keys(session_id)
+        args = [page_index, self.ttl, encode_page(page)]
+        if cursors:
+            cookies, states = self._encode_cursors(cursors)
+            for ou in cursors:
+                args.extend([ou, cookies[ou], states[ou]])
+        result = await self._append_page(
+            keys=[keys['meta'], keys['pages'], keys['cookies'], keys['cursors'], keys['seek_pages'], keys['dn_index']],
+            args=args
+        )
+        if result == -2:
+            raise KeyError(session_id)
+        if result == -1:
+            raise PageConflict(session_id)
+        return result
+
+    async def store_seek_page(self, session_id: str, page_number: int, page: list):
+        keys = self._keys(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(keys['seek_pages'], page_number, encode_page(page))
+            for key in keys.values():
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def drop_seek_page(self, session_id: str, page_number: int):
+        await self.redis.hdel(self._keys(session_id)['seek_pages'], page_number)
+
+    async def promote_seek_page(self, session_id: str, page_number: int, page: list):
+        """Move a page read out of order onto the sequential list once it's next in line"""
+        try:
+            await self.append_page(session_id, page_number - 1, page)
+        except PageConflict:
+            return
+        await self.drop_seek_page(session_id, page_number)
+
+    # --- Encoding ---
+    @staticmethod
+    def _encode_meta(meta: dict) -> dict:
+        encoded = {}
+        for field, value in meta.items():
+            if field in _JSON_FIELDS:
+                value = json.dumps(value)
+            encoded[field] = value
+        return encoded
+
+    @staticmethod
+    def _encode_cursors(cursors: dict[str, dict]) -> tuple[dict, dict]:
+        cookies = {ou: state['cookie'] or b"" for ou, state in cursors.items()}
+        states = {
+            ou: json.dumps({
+                'buffer': state['buffer'],
+                'done': state['done'],
+                'pin': state.get('pin'),
+                'offset': state.get('offset', 0)
+            })
+            for ou, state in cursors.items()
+        }
+        return cookies, states
+
+    @staticmethod
+    def _decode_cursors(cookies: dict, states: dict) -> dict[str, dict]:
+        cursors = {}
+        for ou, state in states.items():
+            state = json.loads(state)
+            cursors[ou] = {
+                'cookie': cookies.get(ou) or None,
+                'buffer': state['buffer'],
+                'done': state['done'],
+                'pin': state.get('pin'),
+                'offset': state.get('offset', 0)
+            }
+        return cursors
@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+
+from redis.asyncio import Redis
+
+from auth_cache import SessionExpired, USER_SESSION_LIFETIME
+
+# --- Configuration ---
+# 'redis': opaque ids backed by user_session:{id} (default)
+# 'signed': self-contained HMAC-signed tokens verified in-process
+SESSION_TOKEN_MODE = os.getenv('SESSION_TOKEN_MODE', 'redis').lower()
+# Must be the same on every worker; falls back to AD_AUTH_SECRET_KEY
+SESSION_TOKEN_SECRET = os.getenv('SESSION_TOKEN_SECRET', '')
+
+
+class TokenInvalid(Exception):
+    """Malformed token or bad signature"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class TokenSigner:
+    """
+    Compact signed session tokens: base64url(claims JSON) "." base64url(HMAC-SHA256).
+
+    Claims carry the user_info from authentication plus jti / iat / exp, so
+    verify() needs no I/O. Logout records the jti under revoked_token:{jti}
+    until the token would have expired anyway, and every request checks it
+    with is_revoked() (a single EXISTS).
+    """
+
+    def __init__(self, secret: str | bytes, redis: Redis, lifetime: int = USER_SESSION_LIFETIME):
+        self._secret = secret.encode() if isinstance(secret, str) else secret
+        self.redis = redis
+        self.lifetime = lifetime
+
+    def issue(self, user_info: dict) -> str:
+        now = int(time.time())
+        claims = {
+            "jti": uuid.uuid4().hex,
+            "iat": now,
+            "exp": now + self.lifetime,
+            "user_info": user_info
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> dict:
+        """Claims of a valid token. Raises TokenInvalid, or SessionExpired past exp."""
+        payload, _, signature = token.partition('.')
+        # Compared as bytes: a header with non-ASCII characters (decoded as
+        # latin-1) would make compare_digest raise on str arguments
+        expected = self._sign(payload).encode()
+        if not payload or not hmac.compare_digest(signature.encode(), expected):
+            raise TokenInvalid("Bad token signature")
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise TokenInvalid("Malformed token")
+        if claims.get("exp", 0) < time.time():
+            raise SessionExpired(claims.get("jti"))
+        return claims
+
+    async def is_revoked(self, claims: dict) -> bool:
+        return bool(await self.redis.exists(self._revoked_key(claims["jti"])))
+
+    async def revoke(self, claims: dict):
+        ttl = max(1, int(claims["exp"] - time.time()))
+        await self.redis.set(self._revoked_key(claims["jti"]), 1, ex=ttl)
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._secret, payload.encode(), hashlib.sha256).digest())
+
+    @staticmethod
+    def _revoked_key(jti: str) -> str:
+        return f"revoked_token:{jti}"
@@ -0,0 +1,66 @@
+"""
+Tests for bulk_lookup: identifier classification and how identifiers are
+split into OR filters within the term and length limits.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_lookup  # noqa: E402
+from bulk_lookup import chunk_filters, identifier_key, identifier_kind  # noqa: E402
+
+
+class IdentifierTest(unittest.TestCase):
+    def test_kinds(self):
+        self.assertEqual(identifier_kind('CN=John Smith,OU=Staff,DC=t'), 'dn')
+        self.assertEqual(identifier_kind('john@example.com'), 'address')
+        self.assertEqual(identifier_kind('jsmith'), 'name')
+
+    def test_keys_ignore_case_and_dn_spacing(self):
+        self.assertEqual(identifier_key('CN=A, OU=B,DC=t'), identifier_key('cn=a,ou=b,dc=t'))
+        self.assertEqual(identifier_key('JSmith'), identifier_key('jsmith'))
+
+
+class ChunkFiltersTest(unittest.TestCase):
+    def test_single_identifier(self):
+        self.assertEqual(
+            chunk_filters('name', ['jsmith'], 'user'),
+            [(['jsmith'], '(&(objectClass=user)(sAMAccountName=jsmith))')]
+        )
+
+    def test_values_are_escaped(self):
+        [(_, filter_cond)] = chunk_filters('dn', ['CN=Smith\\, John (IT),DC=t'])
+        self.assertEqual(filter_cond, '(distinguishedName=CN=Smith\\5c, John \\28IT\\29,DC=t)')
+
+    def test_term_limit(self):
+        identifiers = [f'user{i}@example.com' for i in range(25)]
+        with mock.patch.object(bulk_lookup, 'BULK_LOOKUP_BATCH', 10):
+            chunks = chunk_filters('address', identifiers)
+        # Two terms (userPrincipalName, mail) per address, at most 10 per filter
+        self.assertEqual([len(chunk) for chunk, _ in chunks], [5, 5, 5, 5, 5])
+        self.assertEqual([identifier for chunk, _ in chunks for identifier in chunk], identifiers)
+        for chunk, filter_cond in chunks:
+            self.assertEqual(filter_cond.count('(mail='), len(chunk))
+            self.assertTrue(filter_cond.startswith('(|'))
+
+    def test_length_limit(self):
+        identifiers = [f'account{i:03}' for i in range(40)]
+        term = len('(sAMAccountName=account000)')
+        with mock.patch.object(bulk_lookup, 'BULK_LOOKUP_MAX_FILTER_LENGTH', term * 7):
+            chunks = chunk_filters('name', identifiers)
+        self.assertEqual([len(chunk) for chunk, _ in chunks], [7] * 5 + [5])
+        self.assertTrue(all(len(filter_cond) <= term * 7 + len('(|)') for _, filter_cond in chunks))
+
+    def test_an_oversized_identifier_still_gets_a_filter(self):
+        with mock.patch.object(bulk_lookup, 'BULK_LOOKUP_MAX_FILTER_LENGTH', 10):
+            chunks = chunk_filters('name', ['a' * 50, 'b'])
+        self.assertEqual([chunk for chunk, _ in chunks], [['a' * 50], ['b']])
+
+
+if __name__ == '__main__':
+    unittest.main()
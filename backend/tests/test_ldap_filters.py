@@ -0,0 +1,85 @@
+"""
+Tests for ldap_filters: filter normalization for cache keys, escaping of
+search box input, and the default match mode.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ldap_filters  # noqa: E402
+from ldap_filters import canonical_query, choose_match, normalize_filter, query_filter  # noqa: E402
+
+
+class NormalizeFilterTest(unittest.TestCase):
+    def test_structure_whitespace_and_attribute_case_are_folded(self):
+        self.assertEqual(
+            normalize_filter(' ( & (objectClass=user) ( | (CN =Foo)(sAMAccountName=foo) ) ) '),
+            '(&(objectclass=user)(|(cn=Foo)(samaccountname=foo)))'
+        )
+        self.assertEqual(normalize_filter('( ! (cn ~=a))'), '(!(cn~=a))')
+
+    def test_assertion_values_are_kept(self):
+        self.assertNotEqual(normalize_filter('(cn=*a *b*)'), normalize_filter('(cn=*a*b*)'))
+        self.assertNotEqual(normalize_filter('(cn=John *)'), normalize_filter('(cn=John*)'))
+        self.assertNotEqual(normalize_filter('(cn=John)'), normalize_filter('(cn=john)'))
+        self.assertEqual(normalize_filter('(cn=a\\29 b)'), '(cn=a\\29 b)')
+
+    def test_extensible_match_keeps_the_rule(self):
+        self.assertEqual(
+            normalize_filter('(memberOf:1.2.840.113556.1.4.1941:=CN=G,DC=t)'),
+            '(memberof:1.2.840.113556.1.4.1941:=CN=G,DC=t)'
+        )
+
+    def test_canonical_query_separates_values(self):
+        key = lambda f: canonical_query('ldap://dc1', f, [None], ['cn'], 10)
+        self.assertNotEqual(key('(cn=John *)'), key('(cn=John*)'))
+        self.assertEqual(key('(cn=John*)'), key(' ( CN=John*) '))
+
+
+class QueryFilterTest(unittest.TestCase):
+    def test_special_characters_are_escaped(self):
+        self.assertEqual(
+            query_filter('computers', 'a(b)\\c', 'exact'),
+            '(&(objectClass=computer)(cn=a\\28b\\29\\5cc))'
+        )
+
+    def test_wildcards_survive_only_where_the_mode_allows(self):
+        self.assertEqual(query_filter('groups', 'a*b', 'contains'), '(&(objectClass=group)(cn=*a*b*))')
+        self.assertEqual(query_filter('groups', 'a**', 'prefix'), '(&(objectClass=group)(cn=a*))')
+        self.assertEqual(query_filter('groups', 'a*b', 'exact'), '(&(objectClass=group)(cn=a\\2ab))')
+
+    def test_users_match_both_naming_attributes(self):
+        self.assertEqual(
+            query_filter('users', ' jo ', 'prefix'),
+            '(&(objectClass=user)(|(cn=jo*)(sAMAccountName=jo*)))'
+        )
+        self.assertEqual(query_filter('users', '', 'contains'), '(&(objectClass=user)(|(cn=*)(sAMAccountName=*)))')
+
+    def test_anr(self):
+        self.assertEqual(query_filter('users', 'John Smith', 'anr'), '(&(objectClass=user)(anr=John Smith))')
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            query_filter('users', 'x', 'fuzzy')
+        for match in ('exact', 'anr'):
+            with self.assertRaises(ValueError):
+                query_filter('users', '  ', match)
+
+
+class ChooseMatchTest(unittest.TestCase):
+    def test_modes(self):
+        limit = ldap_filters.MATCH_PREFIX_MAX_LENGTH
+        self.assertEqual(choose_match('users', 'a*b'), 'contains')
+        self.assertEqual(choose_match('users', 'John Smith'), 'anr')
+        self.assertEqual(choose_match('computers', 'pc 1' + 'x' * limit), 'contains')
+        self.assertEqual(choose_match('groups', 'x' * limit), 'prefix')
+        self.assertEqual(choose_match('groups', ' ' + 'x' * limit + ' '), 'prefix')
+        self.assertEqual(choose_match('groups', 'x' * (limit + 1)), 'contains')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Smoke tests for main.py: the module imports, every global name its
+functions use is defined, and the in-memory session store works.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import builtins
+import os
+import symtable
+import sys
+import unittest
+from unittest import mock
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import main  # noqa: E402
+
+
+def _global_names(table: symtable.SymbolTable) -> set[str]:
+    """Names that nested scopes of table read from the module namespace"""
+    names = set()
+    for child in table.get_children():
+        if child.get_type() != 'module':
+            names |= {s.get_name() for s in child.get_symbols() if s.is_global() and s.is_referenced()}
+        names |= _global_names(child)
+    return names
+
+
+class MainSmokeTest(unittest.TestCase):
+    def test_global_names_resolve(self):
+        with open(os.path.join(BACKEND, 'main.py'), encoding='utf-8') as f:
+            table = symtable.symtable(f.read(), 'main.py', 'exec')
+        missing = sorted(name for name in _global_names(table)
+                         if not hasattr(main, name) and not hasattr(builtins, name))
+        self.assertEqual(missing, [])
+
+    def test_health_check(self):
+        health = main.health_check()
+        self.assertEqual(health['status'], 'ok')
+        self.assertEqual(health['sessions']['sessions'], len(main.session_store.sessions))
+
+    def test_session_store_roundtrip(self):
+        store = main.SessionStore(ttl_seconds=60)
+        session_id = store.create_session({'filter': 'users'})
+        store.update_session(session_id, {'total_count': 3})
+        self.assertEqual(store.get_session(session_id)['total_count'], 3)
+        store.cleanup_expired()
+        self.assertIsNotNone(store.get_session(session_id))
+
+    def test_get_all_results_stops_at_the_memory_budget(self):
+        store = main.SessionStore(ttl_seconds=60, memory_budget=2000)
+        session_id = store.create_session({'filter': 'users', 'query': '', 'attributes': ['Name'],
+                                           'ou_paths': [], 'page_size': 10})
+        store.get_session(session_id)['pagination_cookies'][1] = 'cookie'
+        page = [{'Name': f'user{i:04}', 'DistinguishedName': f'CN=user{i:04},DC=t'} for i in range(10)]
+        endless = mock.Mock(return_value=(page, 0, False, True, 'cookie'))
+        with mock.patch.object(main, 'session_store', store), mock.patch.object(main, 'get_ad_page', endless):
+            response = main.get_all_results(session_id, max_results=0)
+        self.assertFalse(response['is_complete'])
+        self.assertFalse(store.has_room(session_id))
+        # Stops on the first page that crosses the budget
+        self.assertLess(store.stats()['bytes'], store.memory_budget + main.approx_size(page[0]) * len(page))
+
+
+if __name__ == '__main__':
+    unittest.main()
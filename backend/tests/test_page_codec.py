@@ -0,0 +1,87 @@
+"""
+Tests for page_codec: cached pages round-trip through every serializer and
+compressor, and ColumnarRows behaves like a list of dicts.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import page_codec  # noqa: E402
+from page_codec import ColumnarRows, decode_page, encode_page, from_columns, to_columns  # noqa: E402
+
+
+def _rows(count: int) -> list[dict]:
+    return [
+        {
+            "dn": f"CN=pc{i},OU=Computers,DC=t",
+            "attributes": {
+                "cn": [f"pc{i}"],
+                "operatingSystem": ["Windows 11 Enterprise" if i % 3 else "Windows Server 2022"],
+                **({"description": [f"desk {i}"]} if i % 2 else {}),
+            }
+        }
+        for i in range(count)
+    ]
+
+
+class PageCodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        for rows in ([], _rows(1), _rows(300)):
+            self.assertEqual(decode_page(encode_page(rows)), rows)
+
+    def test_round_trip_without_msgpack_or_compression(self):
+        rows = _rows(300)
+        for compression in ('none', 'zlib', 'auto'):
+            with mock.patch.object(page_codec, 'msgpack', None), \
+                    mock.patch.object(page_codec, 'PAGE_COMPRESSION', compression):
+                self.assertEqual(decode_page(encode_page(rows)), rows)
+
+    def test_none_values_are_kept_and_absent_attributes_stay_absent(self):
+        rows = [
+            {"dn": "CN=a,DC=t", "attributes": {"cn": ["a"], "manager": None}},
+            {"dn": "CN=b,DC=t", "attributes": {"cn": ["b"]}},
+        ]
+        self.assertEqual(decode_page(encode_page(rows)), rows)
+
+    def test_repetitive_columns_are_dictionary_coded(self):
+        page = to_columns(_rows(300))
+        os_column = page["columns"][page["names"].index("operatingSystem")]
+        self.assertEqual(len(os_column["dict"]), 2)
+        self.assertEqual(len(os_column["codes"]), 300)
+        self.assertIn("values", page["columns"][page["names"].index("cn")])
+
+    def test_pages_from_older_formats(self):
+        rows = _rows(3)
+        legacy = json.dumps([json.dumps(row) for row in rows]).encode()
+        self.assertEqual(decode_page(legacy), rows)
+        page = to_columns(rows)
+        del page["absent"]
+        self.assertEqual(from_columns(page), rows)
+
+
+class ColumnarRowsTest(unittest.TestCase):
+    def test_behaves_like_a_list_of_dicts(self):
+        rows = [{"Name": "a", "Enabled": True}, {"Name": "b", "Title": None}, {"Name": "c"}]
+        store = ColumnarRows(rows[:1])
+        store.extend(rows[1:])
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store[1], rows[1])
+        self.assertEqual(store[-1], rows[2])
+        self.assertEqual(store[1:], rows[1:])
+        self.assertEqual(store.copy(), rows)
+        with self.assertRaises(IndexError):
+            store[3]
+
+    def test_strings_are_interned(self):
+        store = ColumnarRows([{"OS": "".join(["Windows ", "11"])}, {"OS": "".join(["Windows", " 11"])}])
+        self.assertIs(store[0]["OS"], store[1]["OS"])
+
+
+if __name__ == '__main__':
+    unittest.main()
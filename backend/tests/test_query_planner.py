@@ -0,0 +1,65 @@
+"""
+Tests for query_planner: nested and duplicate search bases are pruned, and
+BaseOwners drops rows an earlier overlapping base already returns.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_planner import BaseOwners, contains, plan_bases  # noqa: E402
+
+DEFAULT = 'DC=corp,DC=example'
+
+
+class PlanBasesTest(unittest.TestCase):
+    def test_nested_bases_are_dropped(self):
+        self.assertEqual(
+            plan_bases(['OU=IT,OU=Staff,DC=corp,DC=example', 'OU=Staff,DC=corp,DC=example'], DEFAULT),
+            ['OU=Staff,DC=corp,DC=example']
+        )
+
+    def test_duplicates_differ_only_in_case_and_spacing(self):
+        self.assertEqual(
+            plan_bases(['OU=Staff,DC=corp,DC=example', 'ou=staff, dc=corp, dc=example'], DEFAULT),
+            ['OU=Staff,DC=corp,DC=example']
+        )
+
+    def test_disjoint_bases_keep_their_order(self):
+        bases = ['OU=Sales,DC=corp,DC=example', 'OU=IT,DC=corp,DC=example']
+        self.assertEqual(plan_bases(bases, DEFAULT), bases)
+
+    def test_the_default_context_covers_everything_under_it(self):
+        self.assertEqual(plan_bases(['OU=IT,DC=corp,DC=example', None], DEFAULT), [None])
+        self.assertEqual(plan_bases(['dc=corp,dc=example'], DEFAULT), [None])
+        self.assertEqual(
+            plan_bases([None, 'CN=Configuration,DC=other'], DEFAULT),
+            [None, 'CN=Configuration,DC=other']
+        )
+
+    def test_sibling_names_are_not_nested(self):
+        self.assertFalse(contains('ou=it,dc=t', 'ou=xit,dc=t'))
+        self.assertTrue(contains('ou=it,dc=t', 'cn=a,ou=it,dc=t'))
+        self.assertTrue(contains('ou=it,dc=t', 'ou=it,dc=t'))
+        self.assertFalse(contains('', 'ou=it,dc=t'))
+
+
+class BaseOwnersTest(unittest.TestCase):
+    def test_rows_go_to_the_first_base_holding_them(self):
+        owners = BaseOwners(['OU=Staff,DC=t', 'OU=IT,OU=Staff,DC=t'], 'DC=t')
+        rows = [{'dn': 'CN=a,OU=IT,OU=Staff,DC=t'}, {'dn': 'CN=b,OU=Staff,DC=t'}]
+        self.assertEqual(owners.keep(0, rows), rows)
+        self.assertEqual(owners.keep(1, rows[:1]), [])
+
+    def test_disjoint_bases_keep_everything(self):
+        owners = BaseOwners(['OU=A,DC=t', 'OU=B,DC=t'], 'DC=t')
+        rows = [{'dn': 'CN=x,OU=B,DC=t'}]
+        self.assertFalse(owners.overlapping)
+        self.assertEqual(owners.keep(0, rows), rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
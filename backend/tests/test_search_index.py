@@ -0,0 +1,83 @@
+"""
+Tests for search_index: prefix, substring (trigram) and exact matching
+agree with what the equivalent LDAP filters would return.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex, trigrams  # noqa: E402
+
+NAMES = {
+    'g1': {'cn': ['John Smith'], 'sAMAccountName': ['jsmith'], 'mail': ['john.smith@example.com']},
+    'g2': {'cn': ['Jane Smithers'], 'sAMAccountName': ['jsmithers']},
+    'g3': {'cn': ['Müller'], 'sAMAccountName': ['MUELLER']},
+    'g4': {'cn': ['50%_off'], 'sAMAccountName': ['sale']},
+    'g5': {'cn': ['Al']},
+}
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.execute("CREATE TABLE objects (guid TEXT PRIMARY KEY)")
+        self.db.executemany("INSERT INTO objects VALUES (?)", [(guid,) for guid in NAMES])
+        self.index = SearchIndex(self.db)
+        self.index.add(list(NAMES.items()))
+
+    def tearDown(self):
+        self.db.close()
+
+    def find(self, text: str, mode: str = 'contains', fields=('cn', 'sAMAccountName')) -> set[str]:
+        where, params = self.index.match(fields, text, mode)
+        return {guid for guid, in self.db.execute(f"SELECT guid FROM objects WHERE {where}", params)}
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('smith'), {'smi', 'mit', 'ith'})
+        self.assertEqual(trigrams('al'), set())
+
+    def test_contains(self):
+        self.assertEqual(self.find('smith'), {'g1', 'g2'})
+        self.assertEqual(self.find('SMITHERS'), {'g2'})
+        self.assertEqual(self.find('n smi'), {'g1'})
+        self.assertEqual(self.find('xyz'), set())
+
+    def test_contains_with_short_text_and_wildcards(self):
+        self.assertEqual(self.find('al'), {'g4', 'g5'})
+        self.assertEqual(self.find('j*ers'), {'g2'})
+        self.assertEqual(self.find('*'), set(NAMES))
+
+    def test_prefix(self):
+        self.assertEqual(self.find('jsmith', 'prefix'), {'g1', 'g2'})
+        self.assertEqual(self.find('smith', 'prefix'), set())
+        self.assertEqual(self.find('mü', 'prefix'), {'g3'})
+        self.assertEqual(self.find('mue', 'prefix'), {'g3'})
+
+    def test_like_metacharacters_are_literal(self):
+        self.assertEqual(self.find('50%_', 'prefix'), {'g4'})
+        self.assertEqual(self.find('0%_o'), {'g4'})
+        self.assertEqual(self.find('5_'), set())
+
+    def test_exact(self):
+        self.assertEqual(self.find('JSMITH', 'exact'), {'g1'})
+        self.assertEqual(self.find('smith', 'exact'), set())
+
+    def test_fields_limit_the_match(self):
+        self.assertEqual(self.find('example', fields=('cn',)), set())
+        self.assertEqual(self.find('example', fields=('mail',)), {'g1'})
+
+    def test_add_replaces_and_remove_forgets(self):
+        self.index.add([('g1', {'cn': ['Someone Else']})])
+        self.assertEqual(self.find('smith'), {'g2'})
+        self.index.remove(['g2'])
+        self.assertEqual(self.find('smith'), set())
+        self.assertFalse(self.index.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests for session_tokens: signing, verification, expiry and revocation of
+signed session tokens, including the refresh-and-revoke rotation.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import asyncio
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth_cache import SessionExpired  # noqa: E402
+from session_tokens import TokenInvalid, TokenSigner  # noqa: E402
+
+
+class _Redis:
+    """The two string commands TokenSigner uses, in memory"""
+
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = (value, ex)
+
+    async def exists(self, key):
+        return int(key in self.values)
+
+
+class TokenSignerTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = _Redis()
+        self.signer = TokenSigner('secret', self.redis, lifetime=60)
+
+    def test_round_trip(self):
+        token = self.signer.issue({'username': 'jsmith', 'groups': ['Staff']})
+        claims = self.signer.verify(token)
+        self.assertEqual(claims['user_info'], {'username': 'jsmith', 'groups': ['Staff']})
+        self.assertEqual(claims['exp'] - claims['iat'], 60)
+        self.assertNotEqual(self.signer.verify(self.signer.issue({}))['jti'], claims['jti'])
+
+    def test_tampered_or_foreign_tokens_are_rejected(self):
+        token = self.signer.issue({'username': 'jsmith'})
+        payload, _, signature = token.partition('.')
+        forged = TokenSigner('other secret', self.redis).issue({'username': 'admin'})
+        for bad in (payload + '.' + signature[:-2], forged, payload, '', '.', 'é.é', payload + '.ü' + signature):
+            with self.assertRaises(TokenInvalid):
+                self.signer.verify(bad)
+
+    def test_expired_tokens(self):
+        token = self.signer.issue({})
+        with mock.patch('session_tokens.time.time', return_value=time.time() + 61):
+            with self.assertRaises(SessionExpired):
+                self.signer.verify(token)
+
+    def test_revocation_and_rotation(self):
+        async def scenario():
+            old = self.signer.verify(self.signer.issue({'username': 'jsmith'}))
+            self.assertFalse(await self.signer.is_revoked(old))
+            # /api/auth/refresh: a fresh token, then the old one is revoked
+            new = self.signer.verify(self.signer.issue(old['user_info']))
+            await self.signer.revoke(old)
+            self.assertTrue(await self.signer.is_revoked(old))
+            self.assertFalse(await self.signer.is_revoked(new))
+            # The revocation lasts only as long as the token would have
+            _, ttl = self.redis.values[f"revoked_token:{old['jti']}"]
+            self.assertTrue(0 < ttl <= 60)
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Tests for single_flight: concurrent calls with one key share one run, and a
+cancelled caller doesn't cancel the work for the others.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from single_flight import SingleFlight  # noqa: E402
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_concurrent_calls_share_one_run(self):
+        async def scenario():
+            flight, runs, release = SingleFlight(), [], asyncio.Event()
+
+            async def work(key):
+                runs.append(key)
+                await release.wait()
+                return f"result {key}"
+
+            calls = [asyncio.create_task(flight.do(key, lambda key=key: work(key))) for key in 'aab']
+            await asyncio.sleep(0)
+            self.assertEqual(flight.stats(), {'in_flight': 2, 'shared': 1})
+            release.set()
+            self.assertEqual(await asyncio.gather(*calls), ['result a', 'result a', 'result b'])
+            self.assertEqual(sorted(runs), ['a', 'b'])
+            self.assertEqual(flight.stats()['in_flight'], 0)
+            # Once finished, the same key runs again
+            self.assertEqual(await flight.do('a', lambda: work('a')), 'result a')
+            self.assertEqual(len(runs), 3)
+        asyncio.run(scenario())
+
+    def test_errors_reach_every_caller(self):
+        async def scenario():
+            flight = SingleFlight()
+
+            async def fail():
+                await asyncio.sleep(0)
+                raise ValueError("boom")
+
+            results = await asyncio.gather(flight.do('k', fail), flight.do('k', fail), return_exceptions=True)
+            self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        asyncio.run(scenario())
+
+    def test_a_cancelled_caller_leaves_the_work_running(self):
+        async def scenario():
+            flight, release = SingleFlight(), asyncio.Event()
+
+            async def work():
+                await release.wait()
+                return 42
+
+            first = asyncio.create_task(flight.do('k', work))
+            second = asyncio.create_task(flight.do('k', work))
+            await asyncio.sleep(0)
+            first.cancel()
+            release.set()
+            self.assertEqual(await second, 42)
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
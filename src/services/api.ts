@@ -29,6 +29,7 @@ export interface ADQueryParams {
   attributes: string[];
   ou_paths?: string[];
   page_size?: number;
+  match?: 'contains' | 'prefix' | 'exact' | 'anr';
 }
 
 export interface ADQueryResult {
@@ -49,6 +50,24 @@ export interface AllResultsResponse {
   fetched_count: number;
 }
 
+export interface BatchQueryError {
+  error: string;
+  status_code: number;
+}
+
+export interface BatchQueryResponse {
+  results: (PaginatedResponse<ADObject> | BatchQueryError)[];
+}
+
+export interface StreamEvent {
+  event: 'results' | 'progress' | 'done';
+  results?: ADObject[];
+  fetched?: number;
+  total_count?: number;
+  is_count_exact?: boolean;
+  is_complete?: boolean;
+}
+
 export interface ExportParams {
   session_id: string;
   format: 'csv' | 'json';
@@ -161,6 +180,28 @@ export const apiService = {
     }
   },
   
+  // Several initial queries in one request; each result is a first page or an error
+  queryADBatch: async (queries: ADQueryParams[]): Promise<BatchQueryResponse> => {
+    try {
+      const response = await fetchWithTimeout(
+        `${API_CONFIG.baseUrl}/ad/query/batch`,
+        {
+          method: 'POST',
+          headers: API_CONFIG.headers,
+          body: JSON.stringify({ queries }),
+        }
+      );
+      if (!response.ok) {
+        throw new ApiError(`API request failed with status ${response.status}`, response.status);
+      }
+      
+      return await response.json();
+    } catch (error) {
+      console.error('Error running batch query:', error);
+      throw error;
+    }
+  },
+  
   // Get a specific page of results
   getPage: async (sessionId: string, pageNumber: number): Promise<PaginatedResponse<ADObject>> => {
     try {
@@ -179,6 +220,48 @@ export const apiService = {
     }
   },
   
+  // Stream results page by page as NDJSON events; aborting the signal stops the server-side paging
+  streamResults: async (
+    sessionId: string,
+    onEvent: (event: StreamEvent) => void,
+    maxResults: number = 0,
+    signal?: AbortSignal
+  ): Promise<void> => {
+    try {
+      const response = await fetch(
+        `${API_CONFIG.baseUrl}/ad/query/stream/${sessionId}?format=ndjson&max_results=${maxResults}`,
+        {
+          method: 'GET',
+          headers: API_CONFIG.headers,
+          signal,
+        }
+      );
+      if (!response.ok || !response.body) {
+        throw new ApiError(`API request failed with status ${response.status}`, response.status);
+      }
+      
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+      }
+      // The last event (usually 'done') may arrive without a trailing newline
+      buffer += decoder.decode();
+      if (buffer.trim()) {
+        onEvent(JSON.parse(buffer));
+      }
+    } catch (error) {
+      console.error('Error streaming results:', error);
+      throw error;
+    }
+  },
+  
   // Get all results for a query
   getAllResults: async (sessionId: string, maxResults: number = 0): Promise<AllResultsResponse> => {
     try {